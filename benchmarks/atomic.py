@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+Compare the Lua backed atomic operations with the equivalent WATCH/MULTI/EXEC
+transactions, run by several threads contending for the same keys. Reports
+the operations per second and, for transactions, the number of retries caused
+by other threads modifying the watched keys.
+
+    $ python benchmarks/atomic.py --threads 8 --count 1000
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import redis
+from redis.exceptions import WatchError
+
+
+class Retries(object):
+    "Counts the WatchErrors raised by the transactions of all threads"
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self):
+        with self.lock:
+            self.count += 1
+
+
+def watched(client, retries, func, *keys):
+    "Run ``func`` as a transaction on ``keys``, retrying on WatchError"
+    with client.pipeline() as pipe:
+        while 1:
+            try:
+                pipe.watch(*keys)
+                result = func(pipe)
+                pipe.execute()
+                return result
+            except WatchError:
+                retries.add()
+
+
+def cas_watch(client, retries, i):
+    def func(pipe):
+        value = pipe.get('bench:cas')
+        pipe.multi()
+        pipe.set('bench:cas', int(value) + 1)
+    watched(client, retries, func, 'bench:cas')
+
+
+def cas_lua(client, retries, i):
+    while 1:
+        value = client.get('bench:cas')
+        if client.compare_and_set('bench:cas', value, int(value) + 1):
+            return
+        retries.add()
+
+
+def msetex_watch(client, retries, i):
+    keys = ['bench:mset:%d' % k for k in range(10)]
+    def func(pipe):
+        exists = [pipe.exists(k) for k in keys]
+        pipe.multi()
+        if not any(exists):
+            for k in keys:
+                pipe.setex(k, 60, i)
+    watched(client, retries, func, *keys)
+
+
+def msetex_lua(client, retries, i):
+    client.msetex(dict(('bench:mset:%d' % k, i) for k in range(10)), 60)
+
+
+def hincrby_watch(client, retries, i):
+    fields = ['f%d' % f for f in range(10)]
+    def func(pipe):
+        values = pipe.hmget('bench:hash', fields)
+        pipe.multi()
+        pipe.hmset('bench:hash', dict(
+            (f, min(int(v or 0) + 1, 100)) for f, v in zip(fields, values)))
+    watched(client, retries, func, 'bench:hash')
+
+
+def hincrby_lua(client, retries, i):
+    client.hincrby_capped('bench:hash', dict(('f%d' % f, 1)
+                                             for f in range(10)), maximum=100)
+
+
+def pop_watch(client, retries, i):
+    def func(pipe):
+        items = pipe.lrange('bench:list', 0, 9)
+        pipe.multi()
+        pipe.ltrim('bench:list', 10, -1)
+        return items
+    watched(client, retries, func, 'bench:list')
+
+
+def pop_lua(client, retries, i):
+    client.lpop_many('bench:list', 10)
+
+
+def zmove_watch(client, retries, i):
+    def func(pipe):
+        members = pipe.zrangebyscore('bench:zset', '-inf', i, 0, 10)
+        pipe.multi()
+        if members:
+            pipe.zrem('bench:zset', *members)
+            pipe.rpush('bench:due', *members)
+    watched(client, retries, func, 'bench:zset')
+
+
+def zmove_lua(client, retries, i):
+    client.zmove_expired('bench:zset', 'bench:due', i, 10)
+
+
+def setup(client, threads, count):
+    client.set('bench:cas', 0)
+    client.rpush('bench:list', *range(threads * count * 10))
+    client.zadd('bench:zset', **dict(('m%d' % m, m)
+                                     for m in range(threads * count * 10)))
+
+
+def run(client, func, threads, count):
+    retries = Retries()
+    def worker():
+        for i in range(count):
+            func(client, retries, i * 10)
+    workers = [threading.Thread(target=worker) for t in range(threads)]
+    start = time.time()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return threads * count / (time.time() - start), retries.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--threads', type=int, default=8,
+                        help='number of threads contending for the keys')
+    parser.add_argument('--count', type=int, default=500,
+                        help='number of operations per thread')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=9)
+    args = parser.parse_args()
+
+    pool = redis.ConnectionPool(host=args.host, port=args.port, db=args.db)
+    client = redis.StrictRedis(connection_pool=pool)
+    benchmarks = [
+        ('compare_and_set', cas_watch, cas_lua),
+        ('msetex', msetex_watch, msetex_lua),
+        ('hincrby_capped', hincrby_watch, hincrby_lua),
+        ('lpop_many', pop_watch, pop_lua),
+        ('zmove_expired', zmove_watch, zmove_lua),
+    ]
+    print('%d threads, %d operations each' % (args.threads, args.count))
+    print('%-16s %12s %10s %12s %10s' % (
+        'operation', 'watch ops/s', 'retries', 'lua ops/s', 'retries'))
+    for name, watch_func, lua_func in benchmarks:
+        results = []
+        for func in (watch_func, lua_func):
+            client.flushdb()
+            setup(client, args.threads, args.count)
+            results.extend(run(client, func, args.threads, args.count))
+        print('%-16s %12.0f %10d %12.0f %10d' % ((name,) + tuple(results)))
+    client.flushdb()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Compare loading a sorted set, a hash and string keys with zadd, hmset and
+mset on a client with a chunk_size, against zadd_many, hmset_many and
+mset_many packing parallel sequences straight into commands. Reports the
+elapsed time and the CPU time spent by the client.
+
+    $ python benchmarks/bulk.py --items 1000000
+"""
+import argparse
+import os
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import redis
+
+
+def measure(client, call):
+    "Returns the elapsed and CPU seconds taken by ``call``"
+    client.flushdb()
+    start, cpu = time.time(), time.process_time()
+    call()
+    return time.time() - start, time.process_time() - cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--items', type=int, default=1000000,
+                        help='number of members, fields and keys loaded')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='number of items sent per command')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=9)
+    args = parser.parse_args()
+    client = redis.StrictRedis(host=args.host, port=args.port, db=args.db,
+                               chunk_size=args.chunk_size)
+    names = ['member:%d' % i for i in range(args.items)]
+    scores = array('d', [i * 1.5 for i in range(args.items)])
+    values = ['value:%d' % i for i in range(args.items)]
+    mapping = dict(zip(names, values))
+    benchmarks = [
+        ('zadd', lambda: client.zadd('z', **dict(zip(names, scores)))),
+        ('zadd_many', lambda: client.zadd_many('z', names, scores)),
+        ('hmset', lambda: client.hmset('h', mapping)),
+        ('hmset_many', lambda: client.hmset_many('h', names, values)),
+        ('mset', lambda: client.mset(mapping)),
+        ('mset_many', lambda: client.mset_many(names, values)),
+    ]
+    print('%d items, %d per command' % (args.items, args.chunk_size))
+    print('%-12s %12s %12s %12s' % ('method', 'seconds', 'cpu seconds',
+                                    'items/s'))
+    for name, call in benchmarks:
+        elapsed, cpu = measure(client, call)
+        print('%-12s %12.2f %12.2f %12.0f' % (name, elapsed, cpu,
+                                              args.items / elapsed))
+    client.flushdb()
+
+
+if __name__ == '__main__':
+    main()
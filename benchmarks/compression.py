@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Measure the throughput and compression ratio of the CompressionCodec for each
+algorithm and compression level, encoding and decoding in memory and storing
+the values with SET and GET.
+
+    $ python benchmarks/compression.py --size 102400 --count 200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import redis
+from redis.codecs import CompressionCodec
+
+
+def make_document(size):
+    "Return a JSON document of about ``size`` bytes, as an API would cache"
+    items = []
+    length = 0
+    i = 0
+    while length < size:
+        item = {'id': i, 'name': 'item %d' % i, 'tags': ['a', 'b', 'c'],
+                'price': i * 1.5, 'description': 'lorem ipsum ' * (i % 7)}
+        items.append(item)
+        length += len(json.dumps(item))
+        i += 1
+    return json.dumps(items)
+
+
+def timed(func, count):
+    start = time.time()
+    for i in range(count):
+        func()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--size', type=int, default=100 * 1024,
+                        help='approximate size of the values in bytes')
+    parser.add_argument('--count', type=int, default=100,
+                        help='number of values to encode and store')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=9)
+    parser.add_argument('--no-server', action='store_true',
+                        help='only measure encoding and decoding')
+    args = parser.parse_args()
+
+    value = make_document(args.size)
+    megabytes = len(value) * args.count / 1024.0 / 1024.0
+    print('%d values of %d bytes' % (args.count, len(value)))
+    print('%-6s %5s %7s %12s %12s %12s' % (
+        'algo', 'level', 'ratio', 'encode MB/s', 'decode MB/s', 'set+get MB/s'))
+
+    for algorithm in ('zlib', 'lzma'):
+        for level in range(10):
+            codec = CompressionCodec(threshold=0, algorithm=algorithm,
+                                     level=level)
+            data = codec.encode(value)
+            encode = timed(lambda: codec.encode(value), args.count)
+            decode = timed(lambda: codec.decode(data), args.count)
+            roundtrip = ''
+            if not args.no_server:
+                client = redis.StrictRedis(host=args.host, port=args.port,
+                                           db=args.db, codecs=codec)
+                def set_and_get():
+                    client.set('benchmark:compression', value)
+                    client.get('benchmark:compression')
+                roundtrip = '%12.1f' % (megabytes /
+                                        timed(set_and_get, args.count))
+                client.delete('benchmark:compression')
+            print('%-6s %5d %7.2f %12.1f %12.1f %s' % (
+                algorithm, level, len(value) / float(len(data)),
+                megabytes / encode, megabytes / decode, roundtrip))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Measure the time the client spends per command, excluding the network and
+the server, by running commands over a connection that packs them but
+returns canned replies instead of sending them. Reports the fastest CPU
+time of several runs.
+
+    $ python benchmarks/dispatch.py --calls 100000
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import redis
+from redis.connection import Connection
+
+REPLIES = {
+    'GET': 'value',
+    'SET': 'OK',
+    'INCRBY': 1,
+    'HGETALL': ['field', 'value', 'other', 'value'],
+    'ZRANGE': ['a', '1', 'b', '2'],
+    'MULTI': 'OK',
+}
+
+
+class StubConnection(Connection):
+    "A connection packing commands and returning canned replies"
+    def __init__(self, **kwargs):
+        super(StubConnection, self).__init__(**kwargs)
+        self.pending = deque()
+        self.transaction = None
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def send_packed_command(self, command):
+        pass
+
+    def pack_command(self, *args):
+        self.pending.append(args[0])
+        return super(StubConnection, self).pack_command(*args)
+
+    def read_response(self, raw=False):
+        command = self.pending.popleft()
+        if command == 'MULTI':
+            self.transaction = []
+        elif command == 'EXEC':
+            replies, self.transaction = self.transaction, None
+            return replies
+        elif self.transaction is not None:
+            self.transaction.append(REPLIES[command])
+            return 'QUEUED'
+        return REPLIES[command]
+
+
+def pipeline(client, transaction):
+    def run():
+        pipe = client.pipeline(transaction=transaction)
+        for i in range(100):
+            pipe.get('foo')
+        pipe.execute()
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--calls', type=int, default=100000,
+                        help='number of calls of each command per run')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='number of runs, the fastest is reported')
+    args = parser.parse_args()
+    pool = redis.ConnectionPool(connection_class=StubConnection)
+    client = redis.StrictRedis(connection_pool=pool)
+    benchmarks = [
+        ('GET', lambda: client.get('foo')),
+        ('SET', lambda: client.set('foo', 'bar')),
+        ('INCRBY', lambda: client.incr('foo')),
+        ('HGETALL', lambda: client.hgetall('foo')),
+        ('ZRANGE WITHSCORES', lambda: client.zrange('foo', 0, -1,
+                                                      withscores=True)),
+        ('pipeline of 100 GET', pipeline(client, False)),
+        ('transaction of 100 GET', pipeline(client, True)),
+    ]
+    print('%-24s %12s' % ('command', 'us/call'))
+    for name, call in benchmarks:
+        calls = args.calls
+        if name.startswith(('pipeline', 'transaction')):
+            calls //= 100
+        best = None
+        for run in range(args.runs):
+            start = time.process_time()
+            for i in range(calls):
+                call()
+            elapsed = time.process_time() - start
+            best = min(best or elapsed, elapsed)
+        print('%-24s %12.2f' % (name, best / calls * 1e6))
+
+
+if __name__ == '__main__':
+    main()
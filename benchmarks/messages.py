@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Compare the cost of parsing published messages into dicts with parsing them
+into compact Message objects, whose payloads are decoded when accessed, and
+the memory held by each. Messages are parsed from an in-memory stream, so
+only the client's work is measured.
+
+    $ python benchmarks/messages.py --messages 200000 --size 64
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from redis.connection import PythonParser
+from redis.pubsub import parse_raw_response, to_message
+
+
+def stream(messages, size):
+    "Return the RESP bytes of ``messages`` messages of ``size`` bytes"
+    payload = b'x' * size
+    reply = []
+    for i in range(messages):
+        channel = b'channel:%d' % (i % 100)
+        reply.append(b'*3\r\n$7\r\nmessage\r\n$%d\r\n%s\r\n$%d\r\n%s\r\n' % (
+            len(channel), channel, len(payload), payload))
+    return b''.join(reply)
+
+
+def parser(data):
+    parser = PythonParser()
+    parser._fp = BytesIO(data)
+    return parser
+
+
+def dicts(data, messages):
+    read = parser(data).read_response
+    return [to_message(read()) for i in range(messages)]
+
+
+def compact(data, messages):
+    read = parser(data).read_response
+    return [parse_raw_response(read(raw=True)) for i in range(messages)]
+
+
+def compact_decoded(data, messages):
+    messages = compact(data, messages)
+    for message in messages:
+        message.data
+    return messages
+
+
+def measure(function, data, messages):
+    "Returns the messages parsed per second and the bytes held per message"
+    start = time.time()
+    function(data, messages)
+    rate = messages / (time.time() - start)
+    tracemalloc.start()
+    held = function(data, messages)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return rate, size / float(messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--messages', type=int, default=200000,
+                        help='number of messages parsed')
+    parser.add_argument('--size', type=int, default=64,
+                        help='size of the payloads in bytes')
+    args = parser.parse_args()
+    data = stream(args.messages, args.size)
+    print('%d messages of %d bytes' % (args.messages, args.size))
+    print('%-28s %12s %12s' % ('messages', 'parsed/s', 'bytes/msg'))
+    for name, function in (('dict', dicts),
+                           ('Message', compact),
+                           ('Message, data accessed', compact_decoded)):
+        rate, size = measure(function, data, args.messages)
+        print('%-28s %12.0f %12.0f' % (name, rate, size))
+
+
+if __name__ == '__main__':
+    main()
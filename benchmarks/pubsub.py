@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Measure the messages per second received by a PubSub listening on a single
+connection, and by PartitionedSubscribers reading increasing numbers of
+connections, while publisher processes flood many channels.
+
+    $ python benchmarks/pubsub.py --publishers 4 --channels 64 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import redis
+
+
+def publish(args, channels, stop):
+    client = redis.StrictRedis(host=args.host, port=args.port, db=args.db)
+    payload = 'x' * args.size
+    while not stop.is_set():
+        pipe = client.pipeline(transaction=False)
+        for channel in channels:
+            pipe.publish(channel, payload)
+        pipe.execute()
+
+
+def run(args, receive):
+    """
+    Run the publishers for ``args.seconds`` while ``receive`` counts the
+    messages it receives, returning the messages received per second
+    """
+    channels = ['benchmark:%d' % i for i in range(args.channels)]
+    stop = multiprocessing.Event()
+    publishers = [
+        multiprocessing.Process(target=publish, args=(args, channels, stop))
+        for i in range(args.publishers)]
+    counted = []
+    done = threading.Event()
+    reader = threading.Thread(target=lambda: counted.append(
+        receive(channels, done)))
+    reader.start()
+    time.sleep(0.5)
+    for process in publishers:
+        process.start()
+    time.sleep(args.seconds)
+    done.set()
+    stop.set()
+    reader.join()
+    for process in publishers:
+        process.join()
+    return counted[0] / args.seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--publishers', type=int, default=4,
+                        help='number of publishing processes')
+    parser.add_argument('--channels', type=int, default=64,
+                        help='number of channels published to')
+    parser.add_argument('--size', type=int, default=64,
+                        help='size of the messages in bytes')
+    parser.add_argument('--seconds', type=float, default=5,
+                        help='duration of each run')
+    parser.add_argument('--partitions', default='2,4,8',
+                        help='comma separated numbers of partitions')
+    parser.add_argument('--compact', action='store_true',
+                        help='receive compact Message objects')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=9)
+    args = parser.parse_args()
+    client = redis.StrictRedis(host=args.host, port=args.port, db=args.db)
+
+    def listen(channels, done):
+        pubsub = client.pubsub(compact=args.compact)
+        pubsub.subscribe(channels)
+        count = 0
+        while not done.is_set():
+            if pubsub.get_message(timeout=0.1) is not None:
+                count += 1
+        pubsub.connection.disconnect()
+        return count
+
+    def partitioned(partitions):
+        def receive(channels, done):
+            subscriber = client.partitioned_subscriber(
+                partitions, compact=args.compact)
+            subscriber.subscribe(channels)
+            count = 0
+            while not done.is_set():
+                if subscriber.get_message(timeout=0.1) is not None:
+                    count += 1
+            subscriber.close()
+            return count
+        return receive
+
+    print('%d publishers, %d channels, %d byte messages' % (
+        args.publishers, args.channels, args.size))
+    print('%-24s %12s' % ('subscriber', 'messages/s'))
+    print('%-24s %12.0f' % ('PubSub', run(args, listen)))
+    for partitions in map(int, args.partitions.split(',')):
+        print('%-24s %12.0f' % ('%d partitions' % partitions,
+                                run(args, partitioned(partitions))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Measure the checks per second of each rate limiter, run by several threads
+checking random keys one at a time or in batches, against INCR and EXPIRE
+calls made by the application. The target is 50k checks per second.
+
+    $ python benchmarks/ratelimit.py --threads 8 --checks 20000 --batch 100
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import redis
+from redis.ratelimit import (
+    FixedWindowRateLimiter,
+    SlidingWindowRateLimiter,
+    TokenBucketRateLimiter,
+    )
+
+TARGET = 50000
+
+
+class IncrExpireRateLimiter(object):
+    "The INCR and EXPIRE calls the limiters replace, for comparison"
+    def __init__(self, redis, limit, period, prefix='ratelimit:'):
+        self.redis = redis
+        self.limit = limit
+        self.period = period
+        self.prefix = prefix
+
+    def check(self, key, cost=1):
+        key = self.prefix + key
+        count = self.redis.incr(key, cost)
+        if count == cost:
+            self.redis.expire(key, self.period)
+        return count <= self.limit, max(0, self.limit - count)
+
+    def check_many(self, keys, cost=1):
+        return [self.check(key, cost) for key in keys]
+
+
+def run(limiter, threads, checks, batch, keys):
+    def worker():
+        names = ['key:%d' % random.randrange(keys) for i in range(checks)]
+        if batch > 1:
+            for i in range(0, checks, batch):
+                limiter.check_many(names[i:i + batch])
+        else:
+            for name in names:
+                limiter.check(name)
+    workers = [threading.Thread(target=worker) for t in range(threads)]
+    start = time.time()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return threads * checks / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--threads', type=int, default=8,
+                        help='number of threads checking limits')
+    parser.add_argument('--checks', type=int, default=5000,
+                        help='number of checks per thread')
+    parser.add_argument('--batch', type=int, default=100,
+                        help='number of keys per batched check')
+    parser.add_argument('--keys', type=int, default=10000,
+                        help='number of distinct keys checked')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=9)
+    args = parser.parse_args()
+
+    pool = redis.ConnectionPool(host=args.host, port=args.port, db=args.db,
+                                max_connections=args.threads)
+    client = redis.StrictRedis(connection_pool=pool)
+    limiters = [
+        ('incr+expire', IncrExpireRateLimiter),
+        ('fixed window', FixedWindowRateLimiter),
+        ('sliding window', SlidingWindowRateLimiter),
+        ('token bucket', TokenBucketRateLimiter),
+    ]
+    print('%d threads, %d checks each, target %d checks/s' % (
+        args.threads, args.checks, TARGET))
+    print('%-16s %14s %14s' % ('limiter', 'single/s', 'batch %d/s'
+                               % args.batch))
+    for name, limiter_class in limiters:
+        results = []
+        for batch in (1, args.batch):
+            client.flushdb()
+            limiter = limiter_class(client, 1000, 60)
+            results.append(run(limiter, args.threads, args.checks, batch,
+                               args.keys))
+        print('%-16s %14.0f %14.0f' % ((name,) + tuple(results)))
+    client.flushdb()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Measure how the throughput of the Scheduler scales with the number of worker
+processes claiming due items in batches, compared with claiming items one at
+a time with ZRANGEBYSCORE and ZREM.
+
+    $ python benchmarks/scheduler.py --items 100000 --workers 1 2 4 8
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import redis
+from redis.scheduler import Scheduler
+
+
+def claim_batches(args, batch):
+    client = redis.StrictRedis(host=args.host, port=args.port, db=args.db)
+    scheduler = Scheduler(client, 'benchmark:schedule')
+    claimed = 0
+    while 1:
+        items, next_due = scheduler.claim(batch)
+        if not items:
+            return claimed
+        claimed += len(items)
+
+
+def claim_one_by_one(args, batch):
+    client = redis.StrictRedis(host=args.host, port=args.port, db=args.db)
+    claimed = 0
+    while 1:
+        items = client.zrangebyscore('benchmark:schedule', '-inf', time.time(),
+                                     0, 1)
+        if not items:
+            return claimed
+        # only the worker removing the item may process it
+        if client.zrem('benchmark:schedule', items[0]):
+            claimed += 1
+
+
+def run(args, func, workers, batch):
+    client = redis.StrictRedis(host=args.host, port=args.port, db=args.db)
+    client.delete('benchmark:schedule')
+    scheduler = Scheduler(client, 'benchmark:schedule')
+    for i in range(0, args.items, 10000):
+        scheduler.schedule_many(dict(
+            ('item:%d' % j, j) for j in range(i, min(i + 10000, args.items))))
+    pool = multiprocessing.Pool(workers)
+    start = time.time()
+    results = [pool.apply_async(func, (args, batch)) for w in range(workers)]
+    claimed = sum(r.get() for r in results)
+    elapsed = time.time() - start
+    pool.close()
+    pool.join()
+    assert claimed == args.items
+    return claimed / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--items', type=int, default=100000,
+                        help='number of due items to claim')
+    parser.add_argument('--batch', type=int, default=100,
+                        help='number of items claimed per round trip')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='numbers of worker processes to compare')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=9)
+    args = parser.parse_args()
+
+    print('%d items' % args.items)
+    print('%8s %16s %16s' % ('workers', 'batch %d/s' % args.batch,
+                             'one by one/s'))
+    for workers in args.workers:
+        print('%8d %16.0f %16.0f' % (
+            workers, run(args, claim_batches, workers, args.batch),
+            run(args, claim_one_by_one, workers, 1)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Compare the cost of converting a ZRANGE WITHSCORES reply into (value, score)
+pairs with converting it into a list of values and an array of scores, and
+the memory held by each. The reply is parsed from an in-memory stream, so
+only the client's work is measured.
+
+    $ python benchmarks/zset.py --members 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from redis.client import import_numpy, zset_score_pairs
+from redis.exceptions import RedisError
+from redis.connection import PythonParser
+
+
+def stream(members):
+    "Return the RESP bytes of a ZRANGE WITHSCORES reply of ``members``"
+    reply = [b'*%d\r\n' % (members * 2)]
+    for i in range(members):
+        member = b'member:%d' % i
+        score = repr(i * 1.5).encode()
+        reply.append(b'$%d\r\n%s\r\n$%d\r\n%s\r\n' % (
+            len(member), member, len(score), score))
+    return b''.join(reply)
+
+
+def read(data):
+    parser = PythonParser()
+    parser._fp = BytesIO(data)
+    return parser.read_response()
+
+
+def convert(score_array):
+    def function(response):
+        return zset_score_pairs(response, withscores=True,
+                                score_array=score_array)
+    return function
+
+
+def measure(function, response):
+    """
+    Returns the fastest of three conversions of ``response`` in seconds, and
+    the bytes held by the result
+    """
+    best = None
+    for run in range(3):
+        start = time.process_time()
+        function(response)
+        elapsed = time.process_time() - start
+        best = min(best or elapsed, elapsed)
+    tracemalloc.start()
+    held = function(response)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return best, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--members', type=int, default=1000000,
+                        help='number of members in the reply')
+    args = parser.parse_args()
+    start = time.process_time()
+    response = read(stream(args.members))
+    parsed = time.process_time() - start
+    print('%d members, reply parsed in %.3fs' % (args.members, parsed))
+    print('%-16s %12s %12s' % ('scores', 'seconds', 'MB held'))
+    conversions = [('pairs', convert(None)), ('array', convert('array'))]
+    try:
+        import_numpy()
+        conversions.append(('numpy', convert('numpy')))
+    except RedisError:
+        pass
+    for name, function in conversions:
+        elapsed, size = measure(function, response)
+        print('%-16s %12.3f %12.1f' % (name, elapsed, size / 1e6))
+
+
+if __name__ == '__main__':
+    main()
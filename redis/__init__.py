@@ -1,18 +1,24 @@
 from redis.client import Redis, StrictRedis
+from redis.cache import ClientCache, CacheInvalidator, SingleFlight
 from redis.connection import (
     ConnectionPool,
     Connection,
     UnixDomainSocketConnection
     )
+from redis.lock import ReadWriteLock, Semaphore, TokenLock
 from redis.utils import from_url
 from redis.exceptions import (
     AuthenticationError,
     ConnectionError,
     DataError,
+    DecompressionError,
     InvalidResponse,
+    LockError,
+    NoScriptError,
     PubSubError,
     RedisError,
     ResponseError,
+    UnknownCommandError,
     WatchError,
     )
 
@@ -23,6 +29,10 @@ VERSION = tuple(map(int, __version__.split('.')))
 __all__ = [
     'Redis', 'StrictRedis', 'ConnectionPool',
     'Connection', 'UnixDomainSocketConnection',
+    'ClientCache', 'CacheInvalidator', 'SingleFlight',
     'RedisError', 'ConnectionError', 'ResponseError', 'AuthenticationError',
-    'InvalidResponse', 'DataError', 'PubSubError', 'WatchError', 'from_url',
+    'InvalidResponse', 'DataError', 'DecompressionError', 'PubSubError',
+    'WatchError', 'from_url',
+    'NoScriptError', 'UnknownCommandError', 'LockError', 'TokenLock',
+    'Semaphore', 'ReadWriteLock',
     ]
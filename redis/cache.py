@@ -0,0 +1,343 @@
+import socket
+import threading
+import time
+from collections import OrderedDict
+from redis.commands import COMMANDS, find_spec
+from redis.exceptions import ConnectionError
+
+
+# commands whose replies may be served from a ClientCache. Each of these reads
+# a single key, ``args[1]``, so entries can be invalidated by key name.
+CACHED_COMMANDS = set(('GET', 'HGET', 'HGETALL', 'SMEMBERS'))
+
+FLUSH_COMMANDS = set(('FLUSHDB', 'FLUSHALL'))
+
+
+def is_read_only(spec):
+    """
+    Returns True if the command described by ``spec`` never modifies a key
+    and so never invalidates cache entries. Unknown commands, whose ``spec``
+    is None, may.
+    """
+    return spec is not None and not spec.write
+
+
+def is_coalesced(spec):
+    """
+    Returns True if the command described by ``spec`` is a side effect free
+    read, which a SingleFlight may share between callers
+    """
+    return (spec is not None and spec.readonly and not spec.random and
+            not spec.blocking)
+
+
+# the commands of the default command table passing the checks above. The
+# client applies the checks to its own table, see load_command_specs
+READ_ONLY_COMMANDS = set(
+    name for name, spec in COMMANDS.items() if is_read_only(spec))
+COALESCED_COMMANDS = set(
+    name for name, spec in COMMANDS.items() if is_coalesced(spec))
+
+
+def written_keys(args, commands=COMMANDS):
+    """
+    Return the keys the command ``args`` may modify, looked up in the
+    command table ``commands``. Commands unknown to the table are assumed to
+    modify ``args[1]``.
+    """
+    spec = find_spec(args[0], commands)
+    if spec is None:
+        return args[1:2]
+    if not spec.write:
+        return []
+    return spec.keys(args)
+
+
+def sizeof(value):
+    "Approximate the number of payload bytes held by a parsed reply"
+    if value is None:
+        return 0
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    if isinstance(value, (set, list, tuple)):
+        return sum(map(sizeof, value))
+    return len(str(value))
+
+
+class ClientCache(object):
+    """
+    An in-process cache of replies to read commands, used by a client
+    created with the ``client_cache`` argument.
+
+    ``max_entries`` and ``max_bytes`` bound the size of the cache. Once
+    either is exceeded, the least recently used entries are evicted.
+
+    ``ttl`` is the maximum number of seconds an entry is served before it's
+    read from the server again. By default entries live until they're
+    evicted or invalidated.
+
+    Writes issued through the client invalidate the entries of the keys they
+    modify. Writes made by other clients are only seen once the entry's
+    ``ttl`` passes, or immediately if a CacheInvalidator is running.
+    """
+    def __init__(self, max_entries=10000, max_bytes=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.commands = CACHED_COMMANDS
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # incremented on every invalidation, so a reply read before a
+        # concurrent write isn't stored after the write invalidated the key
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys = {}
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, args):
+        """
+        Return a tuple of (hit, value) for the command ``args``. ``hit`` is
+        False if the reply isn't cached or the entry expired.
+        """
+        with self._lock:
+            entry = self._entries.get(args)
+            if entry is not None:
+                value, size, expires = entry
+                if expires is None or expires > time.time():
+                    self._entries.move_to_end(args)
+                    self.hits += 1
+                    return True, _copy(value)
+                self._remove(args)
+            self.misses += 1
+            return False, None
+
+    def set(self, args, value, generation=None):
+        """
+        Store ``value`` as the reply to the command ``args``. If
+        ``generation`` is specified and entries were invalidated since it was
+        read, the value may be stale and is discarded.
+        """
+        size = sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        else:
+            expires = None
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            if args in self._entries:
+                self._remove(args)
+            self._entries[args] = (_copy(value), size, expires)
+            self._keys.setdefault(args[1], set()).add(args)
+            self._bytes += size
+            self._evict()
+            return True
+
+    def invalidate(self, *keys):
+        "Remove all entries holding replies for ``keys``"
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                for args in list(self._keys.get(key, ())):
+                    self._remove(args)
+
+    def invalidate_command(self, args, commands=COMMANDS):
+        """
+        Remove all entries made stale by executing the command ``args``,
+        described in the command table ``commands``
+        """
+        if args[0] in FLUSH_COMMANDS:
+            self.clear()
+            return
+        keys = written_keys(args, commands)
+        if keys:
+            self.invalidate(*keys)
+
+    def clear(self):
+        "Remove all entries"
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._keys.clear()
+            self._bytes = 0
+
+    def stats(self):
+        "Return a dict of the cache's hit, miss and size counters"
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            }
+
+    def _remove(self, args):
+        value, size, expires = self._entries.pop(args)
+        self._bytes -= size
+        cached = self._keys.get(args[1])
+        if cached is not None:
+            cached.discard(args)
+            if not cached:
+                del self._keys[args[1]]
+
+    def _evict(self):
+        while self._entries and (
+                len(self._entries) > self.max_entries or
+                (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+
+def _copy(value):
+    # replies are shared between callers, don't let one of them change
+    # the reply another receives
+    if isinstance(value, (dict, set)):
+        return value.copy()
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+class _Call(object):
+    "A command execution in flight, shared by all callers waiting on it"
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
+        self.waiters = 0
+        self.started = 0
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical read commands issued concurrently by a client created
+    with the ``single_flight`` argument. The first caller executes the
+    command, callers issuing the same command while it's in flight wait for
+    it and receive its response (or exception) instead of sending their own.
+
+    A thread never joins a call that was already in flight when a write it
+    made completed, as that call's response may predate the write.
+
+    A SingleFlight may be shared by clients using the same connection pool.
+    """
+    def __init__(self):
+        self.executed = 0
+        self.coalesced = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._calls = {}
+
+    def completed(self, command_names, commands=COMMANDS):
+        """
+        Record that the calling thread executed the commands named
+        ``command_names``, described in the command table ``commands``, so
+        that if any of them writes, its later reads don't join calls started
+        before.
+        """
+        if all(is_read_only(find_spec(name, commands))
+               for name in command_names):
+            return
+        with self._lock:
+            self.writes += 1
+            self._local.last_write = self.writes
+
+    def execute(self, func, args, options):
+        "Call ``func(*args, **options)`` unless an identical call is in flight"
+        try:
+            key = (args, tuple(sorted(options.items())))
+            hash(key)
+        except TypeError:
+            return func(*args, **options)
+        last_write = getattr(self._local, 'last_write', 0)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            # a call in flight since before this thread's last write
+            stale = not leader and call.started < last_write
+            if leader:
+                call = self._calls[key] = _Call()
+                call.started = self.writes
+                self.executed += 1
+            elif stale:
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+        if stale:
+            return func(*args, **options)
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return _copy(call.response)
+        try:
+            call.response = func(*args, **options)
+        except BaseException as e:
+            # even interruptions, so waiters don't take None for the reply
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        # no callers can join once the call is removed
+        if call.waiters:
+            return _copy(call.response)
+        return call.response
+
+
+class CacheInvalidator(threading.Thread):
+    """
+    A daemon thread invalidating the entries of ``client``'s ClientCache
+    when keys are modified by any client, using keyspace notifications.
+
+    The server must be configured to publish them, e.g. with
+    ``client.config_set('notify-keyspace-events', 'KA')``.
+    """
+    def __init__(self, client):
+        super(CacheInvalidator, self).__init__()
+        self.daemon = True
+        self.cache = client.client_cache
+        db = client.connection_pool.connection_kwargs.get('db', 0)
+        self.prefix = '__keyspace@%s__:' % db
+        self.pubsub = client.pubsub()
+        self._running = False
+
+    def start(self):
+        # subscribe before returning so no modification made after start()
+        # is missed
+        self.pubsub.psubscribe(self.prefix + '*')
+        self._running = True
+        super(CacheInvalidator, self).start()
+
+    def run(self):
+        try:
+            for message in self.pubsub.listen():
+                if message['type'] == 'pmessage':
+                    self.cache.invalidate(message['channel'][len(self.prefix):])
+        except ConnectionError:
+            if self._running:
+                raise
+        finally:
+            # entries may have been modified while we weren't listening
+            self.cache.clear()
+
+    def stop(self):
+        "Stop listening for notifications and wait for the thread to exit"
+        self._running = False
+        connection = self.pubsub.connection
+        if connection is not None and connection._sock is not None:
+            # wake up the listening thread, which sees the socket as closed
+            connection._sock.shutdown(socket.SHUT_RDWR)
+        self.join()
+        self.pubsub.reset()
@@ -1,17 +1,46 @@
 from __future__ import with_statement
 import datetime
+import hashlib
 import time
 import warnings
-from itertools import starmap
-from redis.connection import ConnectionPool, UnixDomainSocketConnection
+from array import array
+from fnmatch import fnmatchcase
+from itertools import chain, starmap
+from redis import scripts
+from redis.codecs import Codec, KeyCodecs
+from redis.cache import is_coalesced
+from redis.commands import COMMANDS, find_spec, parse_command
+from redis.lock import ReadWriteLock, Semaphore
+from redis.pubsub import (
+    BufferedPublisher,
+    Message,
+    PartitionedSubscriber,
+    PubSubWorkerPool,
+    get_multiplexer,
+    parse_raw_response,
+    to_message,
+    )
+from redis.connection import (
+    ConnectionPool,
+    UnixDomainSocketConnection,
+    decode_response,
+    )
 from redis.exceptions import (
     ConnectionError,
     DataError,
+    LockError,
+    NoScriptError,
     RedisError,
     ResponseError,
+    UnknownCommandError,
     WatchError,
 )
 
+SCORE_ARRAYS = ('array', 'numpy')
+
+# the number of items sent per command by bulk loads by default
+BULK_CHUNK_SIZE = 10000
+
 def list_or_args(keys, args):
     # returns a single list combining keys and args
     try:
@@ -26,6 +55,15 @@ def list_or_args(keys, args):
         keys.extend(args)
     return keys
 
+def mapping_or_columns(keys, values):
+    """
+    Return the parallel sequences ``keys`` and ``values``, or the keys and
+    values of ``keys`` if it's a mapping and ``values`` is None
+    """
+    if values is None:
+        return list(keys.keys()), list(keys.values())
+    return keys, values
+
 def timestamp_to_datetime(response):
     "Converts a unix timestamp to a Python datetime object"
     if not response:
@@ -100,12 +138,40 @@ def pairs_to_dict(response):
     it = iter(response)
     return dict(zip(it, it))
 
+def import_numpy():
+    """
+    Return the numpy module, imported on first use as it takes a while to
+    load. Raises a RedisError if it isn't installed.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise RedisError("numpy is not installed")
+    return numpy
+
+def zset_score_array(response, score_array):
+    """
+    Return a list of the values in ``response`` and their scores as an
+    ``array('d')``, or a NumPy array if ``score_array`` is 'numpy'
+    """
+    values = response[0::2]
+    if score_array == 'numpy':
+        numpy = import_numpy()
+        return values, numpy.array(response[1::2], dtype=numpy.float64)
+    return values, array('d', map(float, response[1::2]))
+
 def zset_score_pairs(response, **options):
     """
     If ``withscores`` is specified in the options, return the response as
-    a list of (value, score) pairs
+    a list of (value, score) pairs, or as a list of values and an array of
+    scores if ``score_array`` is specified
     """
-    if not response or not options['withscores']:
+    if not options['withscores']:
+        return response
+    score_array = options.get('score_array')
+    if score_array:
+        return zset_score_array(response, score_array)
+    if not response:
         return response
     score_cast_func = options.get('score_cast_func', float)
     it = iter(response)
@@ -121,6 +187,46 @@ def float_or_none(response):
         return None
     return float(response)
 
+def parse_scan(response, **options):
+    cursor, r = response
+    return int(cursor), r
+
+def parse_hscan(response, **options):
+    cursor, r = response
+    return int(cursor), r and pairs_to_dict(r) or {}
+
+def parse_zscan(response, **options):
+    score_cast_func = options.get('score_cast_func', float)
+    cursor, r = response
+    it = iter(r)
+    return int(cursor), list(zip(it, map(score_cast_func, it)))
+
+def parse_script(response, **options):
+    parse = options['parse']
+    if parse in ('FLUSH', 'KILL'):
+        return response == 'OK'
+    if parse == 'EXISTS':
+        return list(map(bool, response))
+    return response
+
+def parse_eval(response, **options):
+    callback = options.get('callback')
+    if callback is not None:
+        return callback(response)
+    return response
+
+def concat(responses):
+    "Concatenate a list of list responses"
+    return list(chain.from_iterable(responses))
+
+def last(responses):
+    "Return the last of a list of responses"
+    return responses[-1]
+
+def read_response(connection):
+    "Read the unparsed response of a command from ``connection``"
+    return connection.read_response()
+
 def parse_config(response, **options):
     # this is stupid, but don't have a better option right now
     if options['parse'] == 'GET':
@@ -137,6 +243,9 @@ class StrictRedis(object):
     Connection and Pipeline derive from this, implementing how
     the commands are sent and received to the Redis server
     """
+    # the CommandSpecs of the commands, by name. See load_command_specs
+    command_specs = COMMANDS
+
     RESPONSE_CALLBACKS = dict_merge(
         string_keys_to_dict(
             'AUTH DEL EXISTS EXPIRE EXPIREAT HDEL HEXISTS HMSET MOVE MSETNX '
@@ -173,21 +282,31 @@ class StrictRedis(object):
                 r == 'Background rewriting of AOF file started',
             'BGSAVE': lambda r: r == 'Background saving started',
             'BRPOPLPUSH': lambda r: r and r or None,
+            'COMMAND': parse_command,
             'CONFIG': parse_config,
             'DEBUG': parse_debug_object,
+            'EVAL': parse_eval,
+            'EVALSHA': parse_eval,
             'HGETALL': lambda r: r and pairs_to_dict(r) or {},
             'INFO': parse_info,
             'LASTSAVE': timestamp_to_datetime,
             'OBJECT': parse_object,
             'PING': lambda r: r == 'PONG',
             'RANDOMKEY': lambda r: r and r or None,
+            'SCAN': parse_scan,
+            'SCRIPT': parse_script,
+            'SSCAN': parse_scan,
+            'HSCAN': parse_hscan,
+            'ZSCAN': parse_zscan,
         }
         )
 
     def __init__(self, host='localhost', port=6379,
                  db=0, password=None, socket_timeout=None,
                  connection_pool=None,
-                 charset='utf-8', errors='strict', unix_socket_path=None):
+                 charset='utf-8', errors='strict', unix_socket_path=None,
+                 client_cache=None, single_flight=None, chunk_size=None,
+                 codecs=None):
         if not connection_pool:
             kwargs = {
                 'db': db,
@@ -209,6 +328,13 @@ class StrictRedis(object):
                 })
             connection_pool = ConnectionPool(**kwargs)
         self.connection_pool = connection_pool
+        self.client_cache = client_cache
+        self.single_flight = single_flight
+        self.chunk_size = chunk_size
+        self._scripts = {}
+        if isinstance(codecs, Codec):
+            codecs = KeyCodecs(default=codecs, encoding=charset, errors=errors)
+        self.codecs = codecs
 
         self.response_callbacks = self.__class__.RESPONSE_CALLBACKS.copy()
 
@@ -216,6 +342,33 @@ class StrictRedis(object):
         "Set a custom Response Callback"
         self.response_callbacks[command] = callback
 
+    def command_spec(self, command_name):
+        """
+        Return the CommandSpec describing ``command_name``, or None if the
+        command is unknown
+        """
+        return find_spec(command_name, self.command_specs)
+
+    def command_keys(self, args):
+        "Return the keys within the arguments ``args`` of a command"
+        spec = find_spec(args[0], self.command_specs)
+        if spec is None:
+            return []
+        return spec.keys(args)
+
+    def load_command_specs(self):
+        """
+        Replace the client's command specs with those reported by the
+        server's COMMAND command, adding the commands the client doesn't
+        know of. They decide which commands the client cache and the
+        SingleFlight consider reads, and pipelines created afterwards use
+        them too. Returns the dict of command specs.
+        """
+        specs = dict(self.command_specs)
+        specs.update(self.execute_command('COMMAND'))
+        self.command_specs = specs
+        return specs
+
     def pipeline(self, transaction=True, shard_hint=None):
         """
         Return a new pipeline object that can queue multiple commands for
@@ -228,15 +381,25 @@ class StrictRedis(object):
             self.connection_pool,
             self.response_callbacks,
             transaction,
-            shard_hint)
+            shard_hint,
+            self.client_cache,
+            self.codecs,
+            self.single_flight,
+            self.command_specs)
 
     def transaction(self, func, *watches, **kwargs):
         """
         Convenience method for executing the callable `func` as a transaction
         while watching all keys specified in `watches`. The 'func' callable
         should expect a single arguement which is a Pipeline object.
+
+        The transaction is retried each time a watched key is modified by
+        another client. If ``max_retries`` is given, the WatchError is raised
+        once the transaction has been retried that many times.
         """
         shard_hint = kwargs.pop('shard_hint', None)
+        max_retries = kwargs.pop('max_retries', None)
+        retries = 0
         with self.pipeline(True, shard_hint) as pipe:
             while 1:
                 try:
@@ -245,9 +408,13 @@ class StrictRedis(object):
                     func(pipe)
                     return pipe.execute()
                 except WatchError:
+                    if max_retries is not None and retries >= max_retries:
+                        raise
+                    retries += 1
                     continue
 
-    def lock(self, name, timeout=None, sleep=0.1):
+    def lock(self, name, timeout=None, sleep=0.1, lock_class=None,
+             **kwargs):
         """
         Return a new Lock object using key ``name`` that mimics
         the behavior of threading.Lock.
@@ -258,40 +425,266 @@ class StrictRedis(object):
         ``sleep`` indicates the amount of time to sleep per loop iteration
         when the lock is in blocking mode and another client is currently
         holding the lock.
+
+        ``lock_class`` selects the lock implementation, Lock by default.
+        Pass redis.lock.TokenLock for a lock owned by a unique token, with
+        millisecond timeouts. Any other keyword arguments are passed to the
+        ``lock_class``.
+        """
+        if lock_class is None:
+            lock_class = Lock
+        return lock_class(self, name, timeout=timeout, sleep=sleep, **kwargs)
+
+    def semaphore(self, name, limit, timeout=None, **kwargs):
+        """
+        Return a new Semaphore object using key ``name``, that can be held
+        by at most ``limit`` clients at once.
+
+        If specified, ``timeout`` indicates a maximum life for each hold of
+        the semaphore. Any other keyword arguments are passed to Semaphore.
+        """
+        return Semaphore(self, name, limit, timeout=timeout, **kwargs)
+
+    def read_write_lock(self, name, timeout=None, **kwargs):
+        """
+        Return a new ReadWriteLock object using key ``name``, held either by
+        any number of readers or by a single writer.
+
+        If specified, ``timeout`` indicates a maximum life for each hold of
+        the lock. Any other keyword arguments are passed to ReadWriteLock.
         """
-        return Lock(self, name, timeout=timeout, sleep=sleep)
+        return ReadWriteLock(self, name, timeout=timeout, **kwargs)
 
-    def pubsub(self, shard_hint=None):
+    def pubsub(self, shard_hint=None, compact=False):
         """
         Return a Publish/Subscribe object. With this object, you can
         subscribe to channels and listen for messages that get published to
         them.
+
+        If ``compact`` is True, messages are returned as Message objects
+        instead of dicts, their payloads decoded when first accessed.
+        """
+        return PubSub(self.connection_pool, shard_hint, compact)
+
+    def subscriber(self, max_queued=0):
+        """
+        Return a Subscriber sharing a single subscription connection with
+        all the other Subscribers of the process using the same connection
+        pool. See PubSubMultiplexer.
+        """
+        return get_multiplexer(self.connection_pool).subscriber(max_queued)
+
+    def partitioned_subscriber(self, partitions=4, max_queued=0,
+                               compact=False):
         """
-        return PubSub(self.connection_pool, shard_hint)
+        Return a PartitionedSubscriber hashing its channels and patterns
+        across ``partitions`` connections, each read by a thread of its own,
+        to receive high rates of messages. If ``compact`` is True, messages
+        are Message objects instead of dicts.
+        """
+        return PartitionedSubscriber(self.connection_pool, partitions,
+                                     max_queued, compact)
 
     #### COMMAND EXECUTION AND PROTOCOL PARSING ####
     def execute_command(self, *args, **options):
         "Execute a command and return a parsed response"
-        pool = self.connection_pool
+        if self.codecs is not None:
+            args, options = self.codecs.prepare(args, options)
+        cache = self.client_cache
+        if cache is None:
+            return self._coalesce_command(args, options)
+        if args[0] in cache.commands:
+            hit, response = cache.get(args)
+            if not hit:
+                generation = cache.generation
+                response = self._coalesce_command(args, options)
+                cache.set(args, response, generation)
+            return response
+        try:
+            return self._coalesce_command(args, options)
+        finally:
+            cache.invalidate_command(args, self.command_specs)
+
+    def execute_raw_command(self, *args, **options):
+        """
+        Execute a command without applying the client's codecs, for values
+        stored and compared as they are, such as lock tokens. Replies aren't
+        read from the client cache, which holds decoded ones.
+        """
+        cache = self.client_cache
+        if cache is None:
+            return self._coalesce_command(args, options)
+        try:
+            return self._coalesce_command(args, options)
+        finally:
+            cache.invalidate_command(args, self.command_specs)
+
+    def _coalesce_command(self, args, options):
+        "Execute a command, sharing the response with identical reads in flight"
+        single_flight = self.single_flight
+        if single_flight is None:
+            if not options:
+                return self._execute_command(*args)
+            return self._execute_command(*args, **options)
+        if is_coalesced(find_spec(args[0], self.command_specs)):
+            return single_flight.execute(self._execute_command, args, options)
+        try:
+            return self._execute_command(*args, **options)
+        finally:
+            single_flight.completed((args[0],), self.command_specs)
+
+    def _execute_command(self, *args, **options):
+        "Send a command to the server and return its parsed response"
         command_name = args[0]
-        connection = pool.get_connection(command_name, **options)
+        if options:
+            def parse(connection):
+                return self.parse_response(connection, command_name,
+                                           **options)
+            return self._send_command(args, options, parse)
+        # without options, read the reply and apply the callback directly
+        callback = self.response_callbacks.get(command_name)
+        response = self._send_command(args, options, read_response)
+        if callback is None:
+            return response
+        return callback(response)
+
+    def _send_command(self, args, options, parse):
+        """
+        Send the command ``args`` over a connection from the pool and return
+        ``parse(connection)``. If the connection was lost, the command is
+        sent once more over a new one.
+        """
+        pool = self.connection_pool
+        # only pools routing commands by key use their keys
+        keys = pool.routes_by_key and self.command_keys(args) or ()
+        connection = pool.get_connection(args[0], *keys, **options)
         try:
             connection.send_command(*args)
-            return self.parse_response(connection, command_name, **options)
+            return parse(connection)
         except ConnectionError:
             connection.disconnect()
             connection.send_command(*args)
-            return self.parse_response(connection, command_name, **options)
+            return parse(connection)
         finally:
             pool.release(connection)
 
     def parse_response(self, connection, command_name, **options):
         "Parses a response from the Redis server"
-        response = connection.read_response()
+        if not options:
+            response = connection.read_response()
+            callback = self.response_callbacks.get(command_name)
+            if callback is None:
+                return response
+            return callback(response)
+        decoder = options.pop('decoder', None)
+        if decoder is None:
+            response = connection.read_response()
+        else:
+            response = decoder(connection.read_response(raw=True))
         if command_name in self.response_callbacks:
             return self.response_callbacks[command_name](response, **options)
         return response
 
+    def execute_chunked_command(self, merge, command_name, prefix, items,
+                                step=1, chunk_size=None):
+        """
+        Execute ``command_name`` with the arguments in the ``prefix`` list
+        followed by those in the ``items`` list.
+
+        If the client was created with a ``chunk_size``, or one is specified,
+        and there are more ``items`` than that, they are split into chunks of
+        at most ``chunk_size`` items, keeping groups of ``step`` items
+        together. A command is sent for each chunk through a pipeline, so
+        commands of other clients are served in between, and ``merge`` is
+        called with the list of their responses to build the response to
+        return.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        if not chunk_size or len(items) <= chunk_size:
+            return self.execute_command(command_name, *(prefix + items))
+        chunk_size = max(chunk_size - chunk_size % step, step)
+        pipe = self.pipeline(transaction=False)
+        for i in range(0, len(items), chunk_size):
+            pipe.execute_command(command_name,
+                                 *(prefix + items[i:i + chunk_size]))
+        return merge(pipe.execute())
+
+    def execute_bulk_command(self, merge, command_name, prefix, firsts,
+                             seconds, chunk_size=None):
+        """
+        Execute ``command_name`` with the arguments in the ``prefix`` list
+        followed by the items of the parallel sequences ``firsts`` and
+        ``seconds`` interleaved, such as the scores and members of ZADD.
+
+        Each sequence is encoded at once and the pairs are packed straight
+        into commands of at most ``chunk_size`` items, the client's
+        ``chunk_size`` or BULK_CHUNK_SIZE by default. The commands are all
+        sent over one connection before their replies are read, and
+        ``merge`` is called with the list of their responses to build the
+        response to return.
+        """
+        if len(firsts) != len(seconds):
+            raise DataError("%s requires sequences of equal length" %
+                            command_name)
+        if self.codecs is not None:
+            # values are encoded one by one by their codecs
+            items = list(chain.from_iterable(zip(firsts, seconds)))
+            return self.execute_chunked_command(
+                merge, command_name, prefix, items, 2,
+                chunk_size or self.chunk_size or BULK_CHUNK_SIZE)
+        pairs = max((chunk_size or self.chunk_size or BULK_CHUNK_SIZE) // 2, 1)
+        pool = self.connection_pool
+        keys = ()
+        if self.client_cache is not None or pool.routes_by_key:
+            # the keys written are the prefix's, or the first sequence with
+            # MSET
+            keys = prefix or list(firsts)
+        # only pools routing commands by key use their keys
+        connection = pool.get_connection(
+            command_name, *(pool.routes_by_key and keys or ()))
+        try:
+            firsts = connection.encode_column(firsts)
+            seconds = connection.encode_column(seconds)
+            try:
+                responses = self._execute_bulk_command(
+                    connection, command_name, prefix, firsts, seconds, pairs)
+            except ConnectionError:
+                connection.disconnect()
+                responses = self._execute_bulk_command(
+                    connection, command_name, prefix, firsts, seconds, pairs)
+        finally:
+            pool.release(connection)
+            if self.client_cache is not None:
+                self.client_cache.invalidate(*keys)
+            if self.single_flight is not None:
+                self.single_flight.completed((command_name,),
+                                             self.command_specs)
+        return merge(responses)
+
+    def _execute_bulk_command(self, connection, command_name, prefix, firsts,
+                              seconds, pairs):
+        "Send the chunks of a bulk command, then read their responses"
+        prefix = [command_name] + prefix
+        chunks = range(0, len(firsts), pairs)
+        for i in chunks:
+            connection.send_packed_command(connection.pack_pairs(
+                prefix, firsts[i:i + pairs], seconds[i:i + pairs]))
+        callback = self.response_callbacks.get(command_name)
+        responses = []
+        error = None
+        for i in chunks:
+            try:
+                response = connection.read_response()
+            except ResponseError as e:
+                # read the remaining responses, then raise the first error
+                error = error or e
+                continue
+            responses.append(response if callback is None
+                             else callback(response))
+        if error is not None:
+            raise error
+        return responses
+
     #### SERVER INFORMATION ####
     def bgrewriteaof(self):
         "Tell the Redis server to rewrite the AOF file from data in memory."
@@ -322,7 +715,7 @@ class StrictRedis(object):
 
     def delete(self, *names):
         "Delete one or more keys specified by ``names``"
-        return self.execute_command('DEL', *names)
+        return self.execute_chunked_command(any, 'DEL', [], list(names))
     __delitem__ = delete
 
     def echo(self, value):
@@ -459,14 +852,25 @@ class StrictRedis(object):
         Returns a list of values ordered identically to ``keys``
         """
         args = list_or_args(keys, args)
-        return self.execute_command('MGET', *args)
+        return self.execute_chunked_command(concat, 'MGET', [], args)
 
     def mset(self, mapping):
         "Sets each key in the ``mapping`` dict to its corresponding value"
         items = []
         for pair in mapping.items():
             items.extend(pair)
-        return self.execute_command('MSET', *items)
+        return self.execute_chunked_command(all, 'MSET', [], items, 2)
+
+    def mset_many(self, keys, values=None, chunk_size=None):
+        """
+        Sets each of ``keys`` to the value at the same position of
+        ``values``, or each key of the mapping ``keys`` to its value if
+        ``values`` is omitted. The pairs are packed straight into MSET
+        commands of at most ``chunk_size`` items. See execute_bulk_command.
+        """
+        keys, values = mapping_or_columns(keys, values)
+        return self.execute_bulk_command(all, 'MSET', [], keys, values,
+                                         chunk_size)
 
     def msetnx(self, mapping):
         """
@@ -486,6 +890,10 @@ class StrictRedis(object):
         "Removes an expiration on ``name``"
         return self.execute_command('PERSIST', name)
 
+    def pttl(self, name):
+        "Returns the number of milliseconds until the key ``name`` will expire"
+        return self.execute_command('PTTL', name)
+
     def randomkey(self):
         "Returns the name of a random key"
         return self.execute_command('RANDOMKEY')
@@ -500,6 +908,46 @@ class StrictRedis(object):
         "Rename key ``src`` to ``dst`` if ``dst`` doesn't already exist"
         return self.execute_command('RENAMENX', src, dst)
 
+    def scan(self, cursor=0, match=None, count=None):
+        """
+        Incrementally return lists of key names. Also return a cursor
+        indicating the scan position.
+
+        ``match`` allows for filtering the keys by pattern
+
+        ``count`` allows for hint the minimum number of returns
+        """
+        pieces = [cursor]
+        if match is not None:
+            pieces.extend(['MATCH', match])
+        if count is not None:
+            pieces.extend(['COUNT', count])
+        return self.execute_command('SCAN', *pieces)
+
+    def scan_iter(self, match=None, count=None):
+        """
+        Make an iterator using the SCAN command so that the client doesn't
+        need to remember the cursor position.
+
+        ``match`` allows for filtering the keys by pattern
+
+        ``count`` allows for hint the minimum number of returns
+
+        On servers without SCAN, all keys are fetched at once using KEYS.
+        """
+        try:
+            cursor, data = self.scan(0, match, count)
+        except UnknownCommandError:
+            for item in self.keys(match or '*'):
+                yield item
+            return
+        for item in data:
+            yield item
+        while cursor != 0:
+            cursor, data = self.scan(cursor, match, count)
+            for item in data:
+                yield item
+
     def set(self, name, value):
         "Set the value at key ``name`` to ``value``"
         return self.execute_command('SET', name, value)
@@ -651,7 +1099,8 @@ class StrictRedis(object):
 
     def lpush(self, name, *values):
         "Push ``values`` onto the head of the list ``name``"
-        return self.execute_command('LPUSH', name, *values)
+        return self.execute_chunked_command(last, 'LPUSH', [name],
+                                            list(values))
 
     def lpushx(self, name, value):
         "Push ``value`` onto the head of the list ``name`` if ``name`` exists"
@@ -706,7 +1155,8 @@ class StrictRedis(object):
 
     def rpush(self, name, *values):
         "Push ``values`` onto the tail of the list ``name``"
-        return self.execute_command('RPUSH', name, *values)
+        return self.execute_chunked_command(last, 'RPUSH', [name],
+                                            list(values))
 
     def rpushx(self, name, value):
         "Push ``value`` onto the tail of the list ``name`` if ``name`` exists"
@@ -770,7 +1220,7 @@ class StrictRedis(object):
     #### SET COMMANDS ####
     def sadd(self, name, *values):
         "Add ``value(s)`` to set ``name``"
-        return self.execute_command('SADD', name, *values)
+        return self.execute_chunked_command(sum, 'SADD', [name], list(values))
 
     def scard(self, name):
         "Return the number of elements in set ``name``"
@@ -826,6 +1276,48 @@ class StrictRedis(object):
         "Remove ``values`` from set ``name``"
         return self.execute_command('SREM', name, *values)
 
+    def sscan(self, name, cursor=0, match=None, count=None):
+        """
+        Incrementally return lists of elements in a set. Also return a cursor
+        indicating the scan position.
+
+        ``match`` allows for filtering the members by pattern
+
+        ``count`` allows for hint the minimum number of returns
+        """
+        pieces = [name, cursor]
+        if match is not None:
+            pieces.extend(['MATCH', match])
+        if count is not None:
+            pieces.extend(['COUNT', count])
+        return self.execute_command('SSCAN', *pieces)
+
+    def sscan_iter(self, name, match=None, count=None):
+        """
+        Make an iterator using the SSCAN command so that the client doesn't
+        need to remember the cursor position.
+
+        ``match`` allows for filtering the members by pattern
+
+        ``count`` allows for hint the minimum number of returns
+
+        On servers without SSCAN, all members are fetched at once using
+        SMEMBERS.
+        """
+        try:
+            cursor, data = self.sscan(name, 0, match, count)
+        except UnknownCommandError:
+            for item in self.smembers(name):
+                if match is None or fnmatchcase(item, match):
+                    yield item
+            return
+        for item in data:
+            yield item
+        while cursor != 0:
+            cursor, data = self.sscan(name, cursor, match, count)
+            for item in data:
+                yield item
+
     def sunion(self, keys, *args):
         "Return the union of sets specifiued by ``keys``"
         args = list_or_args(keys, args)
@@ -861,7 +1353,20 @@ class StrictRedis(object):
         for pair in kwargs.items():
             pieces.append(pair[1])
             pieces.append(pair[0])
-        return self.execute_command('ZADD', name, *pieces)
+        return self.execute_chunked_command(sum, 'ZADD', [name], pieces, 2)
+
+    def zadd_many(self, name, members, scores=None, chunk_size=None):
+        """
+        Add ``members`` to the sorted set ``name`` with the score at the same
+        position of ``scores``, such as an ``array('d')`` or a NumPy array,
+        or the members of the mapping ``members`` with their scores if
+        ``scores`` is omitted. The pairs are packed straight into ZADD
+        commands of at most ``chunk_size`` items. Returns the number of
+        members added. See execute_bulk_command.
+        """
+        members, scores = mapping_or_columns(members, scores)
+        return self.execute_bulk_command(sum, 'ZADD', [name], scores, members,
+                                         chunk_size)
 
     def zcard(self, name):
         "Return the number of elements in the sorted set ``name``"
@@ -882,8 +1387,23 @@ class StrictRedis(object):
         """
         return self._zaggregate('ZINTERSTORE', dest, keys, aggregate)
 
+    def _zrange_options(self, withscores, score_cast_func, score_array):
+        "Returns the options of the sorted set range commands"
+        if score_array is not None:
+            if score_array not in SCORE_ARRAYS:
+                raise DataError("``score_array`` must be 'array' or 'numpy'")
+            if not withscores:
+                raise DataError("``score_array`` requires ``withscores``")
+            if score_cast_func is not float:
+                raise DataError("``score_cast_func`` can't be combined with "
+                                "``score_array``")
+            if score_array == 'numpy':
+                import_numpy()
+        return {'withscores': withscores, 'score_cast_func': score_cast_func,
+                'score_array': score_array}
+
     def zrange(self, name, start, end, desc=False, withscores=False,
-               score_cast_func=float):
+               score_cast_func=float, score_array=None):
         """
         Return a range of values from sorted set ``name`` between
         ``start`` and ``end`` sorted in ascending order.
@@ -896,17 +1416,24 @@ class StrictRedis(object):
         The return type is a list of (value, score) pairs
 
         ``score_cast_func`` a callable used to cast the score return value
+
+        ``score_array`` either 'array' or 'numpy', to return a list of the
+        values and their scores as an ``array('d')`` or a NumPy array instead
+        of (value, score) pairs
         """
         if desc:
-            return self.zrevrange(name, start, end, withscores)
+            return self.zrevrange(name, start, end, withscores,
+                                  score_cast_func, score_array)
         pieces = ['ZRANGE', name, start, end]
         if withscores:
             pieces.append('withscores')
-        options = {'withscores': withscores, 'score_cast_func': score_cast_func}
+        options = self._zrange_options(withscores, score_cast_func,
+                                       score_array)
         return self.execute_command(*pieces, **options)
 
     def zrangebyscore(self, name, min, max,
-            start=None, num=None, withscores=False, score_cast_func=float):
+            start=None, num=None, withscores=False, score_cast_func=float,
+            score_array=None):
         """
         Return a range of values from the sorted set ``name`` with scores
         between ``min`` and ``max``.
@@ -918,6 +1445,10 @@ class StrictRedis(object):
         The return type is a list of (value, score) pairs
 
         `score_cast_func`` a callable used to cast the score return value
+
+        ``score_array`` either 'array' or 'numpy', to return a list of the
+        values and their scores as an ``array('d')`` or a NumPy array instead
+        of (value, score) pairs
         """
         if (start is not None and num is None) or \
                 (num is not None and start is None):
@@ -927,7 +1458,8 @@ class StrictRedis(object):
             pieces.extend(['LIMIT', start, num])
         if withscores:
             pieces.append('withscores')
-        options = {'withscores': withscores, 'score_cast_func': score_cast_func}
+        options = self._zrange_options(withscores, score_cast_func,
+                                       score_array)
         return self.execute_command(*pieces, **options)
 
     def zrank(self, name, value):
@@ -958,7 +1490,7 @@ class StrictRedis(object):
         return self.execute_command('ZREMRANGEBYSCORE', name, min, max)
 
     def zrevrange(self, name, start, num, withscores=False,
-                  score_cast_func=float):
+                  score_cast_func=float, score_array=None):
         """
         Return a range of values from sorted set ``name`` between
         ``start`` and ``num`` sorted in descending order.
@@ -969,15 +1501,21 @@ class StrictRedis(object):
         The return type is a list of (value, score) pairs
 
         ``score_cast_func`` a callable used to cast the score return value
+
+        ``score_array`` either 'array' or 'numpy', to return a list of the
+        values and their scores as an ``array('d')`` or a NumPy array instead
+        of (value, score) pairs
         """
         pieces = ['ZREVRANGE', name, start, num]
         if withscores:
             pieces.append('withscores')
-        options = {'withscores': withscores, 'score_cast_func': score_cast_func}
+        options = self._zrange_options(withscores, score_cast_func,
+                                       score_array)
         return self.execute_command(*pieces, **options)
 
     def zrevrangebyscore(self, name, max, min,
-            start=None, num=None, withscores=False, score_cast_func=float):
+            start=None, num=None, withscores=False, score_cast_func=float,
+            score_array=None):
         """
         Return a range of values from the sorted set ``name`` with scores
         between ``min`` and ``max`` in descending order.
@@ -989,6 +1527,10 @@ class StrictRedis(object):
         The return type is a list of (value, score) pairs
 
         ``score_cast_func`` a callable used to cast the score return value
+
+        ``score_array`` either 'array' or 'numpy', to return a list of the
+        values and their scores as an ``array('d')`` or a NumPy array instead
+        of (value, score) pairs
         """
         if (start is not None and num is None) or \
                 (num is not None and start is None):
@@ -998,7 +1540,8 @@ class StrictRedis(object):
             pieces.extend(['LIMIT', start, num])
         if withscores:
             pieces.append('withscores')
-        options = {'withscores': withscores, 'score_cast_func': score_cast_func}
+        options = self._zrange_options(withscores, score_cast_func,
+                                       score_array)
         return self.execute_command(*pieces, **options)
 
     def zrevrank(self, name, value):
@@ -1008,6 +1551,70 @@ class StrictRedis(object):
         """
         return self.execute_command('ZREVRANK', name, value)
 
+    def zscan(self, name, cursor=0, match=None, count=None,
+              score_cast_func=float):
+        """
+        Incrementally return lists of elements in a sorted set. Also return a
+        cursor indicating the scan position.
+
+        ``match`` allows for filtering the members by pattern
+
+        ``count`` allows for hint the minimum number of returns
+
+        ``score_cast_func`` a callable used to cast the score return value
+        """
+        pieces = [name, cursor]
+        if match is not None:
+            pieces.extend(['MATCH', match])
+        if count is not None:
+            pieces.extend(['COUNT', count])
+        options = {'score_cast_func': score_cast_func}
+        return self.execute_command('ZSCAN', *pieces, **options)
+
+    def zscan_iter(self, name, match=None, count=None,
+                   score_cast_func=float):
+        """
+        Make an iterator using the ZSCAN command so that the client doesn't
+        need to remember the cursor position.
+
+        ``match`` allows for filtering the members by pattern
+
+        ``count`` allows for hint the minimum number of returns
+
+        ``score_cast_func`` a callable used to cast the score return value
+
+        On servers without ZSCAN, the sorted set is paged through with ZRANGE
+        windows of ``count`` members. Members added or removed while iterating
+        may then be skipped or returned twice.
+        """
+        try:
+            cursor, data = self.zscan(name, 0, match, count, score_cast_func)
+        except UnknownCommandError:
+            for item in self._zrange_iter(name, match, count or 10,
+                                          score_cast_func):
+                yield item
+            return
+        for item in data:
+            yield item
+        while cursor != 0:
+            cursor, data = self.zscan(name, cursor, match, count,
+                                      score_cast_func)
+            for item in data:
+                yield item
+
+    def _zrange_iter(self, name, match, page_size, score_cast_func):
+        start = 0
+        while True:
+            data = self.zrange(name, start, start + page_size - 1,
+                               withscores=True,
+                               score_cast_func=score_cast_func)
+            for item in data:
+                if match is None or fnmatchcase(item[0], match):
+                    yield item
+            if len(data) < page_size:
+                return
+            start += page_size
+
     def zscore(self, name, value):
         "Return the score of element ``value`` in sorted set ``name``"
         return self.execute_command('ZSCORE', name, value)
@@ -1088,12 +1695,66 @@ class StrictRedis(object):
         items = []
         for pair in mapping.items():
             items.extend(pair)
-        return self.execute_command('HMSET', name, *items)
+        return self.execute_chunked_command(all, 'HMSET', [name], items, 2)
+
+    def hmset_many(self, name, fields, values=None, chunk_size=None):
+        """
+        Sets each of ``fields`` in the hash ``name`` to the value at the same
+        position of ``values``, or each key of the mapping ``fields`` to its
+        value if ``values`` is omitted. The pairs are packed straight into
+        HMSET commands of at most ``chunk_size`` items. See
+        execute_bulk_command.
+        """
+        fields, values = mapping_or_columns(fields, values)
+        return self.execute_bulk_command(all, 'HMSET', [name], fields, values,
+                                         chunk_size)
 
     def hmget(self, name, keys, *args):
         "Returns a list of values ordered identically to ``keys``"
         args = list_or_args(keys, args)
-        return self.execute_command('HMGET', name, *args)
+        return self.execute_chunked_command(concat, 'HMGET', [name], args)
+
+    def hscan(self, name, cursor=0, match=None, count=None):
+        """
+        Incrementally return key/value slices in a hash. Also return a cursor
+        indicating the scan position.
+
+        ``match`` allows for filtering the keys by pattern
+
+        ``count`` allows for hint the minimum number of returns
+        """
+        pieces = [name, cursor]
+        if match is not None:
+            pieces.extend(['MATCH', match])
+        if count is not None:
+            pieces.extend(['COUNT', count])
+        return self.execute_command('HSCAN', *pieces)
+
+    def hscan_iter(self, name, match=None, count=None):
+        """
+        Make an iterator using the HSCAN command so that the client doesn't
+        need to remember the cursor position. Yields (key, value) pairs.
+
+        ``match`` allows for filtering the keys by pattern
+
+        ``count`` allows for hint the minimum number of returns
+
+        On servers without HSCAN, the whole hash is fetched at once using
+        HGETALL.
+        """
+        try:
+            cursor, data = self.hscan(name, 0, match, count)
+        except UnknownCommandError:
+            for item in self.hgetall(name).items():
+                if match is None or fnmatchcase(item[0], match):
+                    yield item
+            return
+        for item in data.items():
+            yield item
+        while cursor != 0:
+            cursor, data = self.hscan(name, cursor, match, count)
+            for item in data.items():
+                yield item
 
     def hvals(self, name):
         "Return the list of values within hash ``name``"
@@ -1106,6 +1767,172 @@ class StrictRedis(object):
         """
         return self.execute_command('PUBLISH', channel, message)
 
+    def publish_many(self, messages):
+        """
+        Publish each (channel, message) tuple of ``messages`` in a single
+        round trip. Returns a list of the number of subscribers each message
+        was delivered to.
+        """
+        with self.pipeline(transaction=False) as pipe:
+            for channel, message in messages:
+                pipe.publish(channel, message)
+            return pipe.execute()
+
+    def buffered_publisher(self, max_messages=100, max_delay=0.01,
+                           exception_handler=None):
+        """
+        Return a started BufferedPublisher, publishing messages in batches
+        of up to ``max_messages``, sent at most ``max_delay`` seconds after
+        the first message of the batch was buffered.
+        """
+        publisher = BufferedPublisher(self, max_messages, max_delay,
+                                      exception_handler)
+        publisher.start()
+        return publisher
+
+    #### SCRIPTING ####
+    def eval(self, script, numkeys, *keys_and_args):
+        """
+        Execute the Lua ``script``, specifying the ``numkeys`` the script
+        will touch and the key names and argument values in ``keys_and_args``.
+        Returns the result of the script.
+
+        In practice, use the object returned by ``register_script``. This
+        function exists purely for Redis API completion.
+        """
+        return self.execute_command('EVAL', script, numkeys, *keys_and_args)
+
+    def evalsha(self, sha, numkeys, *keys_and_args):
+        """
+        Use the ``sha`` to execute a Lua script already registered via EVAL
+        or SCRIPT LOAD. Specify the ``numkeys`` the script will touch and the
+        key names and argument values in ``keys_and_args``. Returns the result
+        of the script.
+
+        In practice, use the object returned by ``register_script``. This
+        function exists purely for Redis API completion.
+        """
+        return self.execute_command('EVALSHA', sha, numkeys, *keys_and_args)
+
+    def script_exists(self, *args):
+        """
+        Check if a script exists in the script cache by specifying the SHAs of
+        each script as ``args``. Returns a list of boolean values indicating if
+        if each already script exists in the cache.
+        """
+        return self.execute_command('SCRIPT', 'EXISTS', *args, parse='EXISTS')
+
+    def script_flush(self):
+        "Flush all scripts from the script cache"
+        return self.execute_command('SCRIPT', 'FLUSH', parse='FLUSH')
+
+    def script_kill(self):
+        "Kill the currently executing Lua script"
+        return self.execute_command('SCRIPT', 'KILL', parse='KILL')
+
+    def script_load(self, script):
+        "Load a Lua ``script`` into the script cache. Returns the SHA."
+        return self.execute_command('SCRIPT', 'LOAD', script, parse='LOAD')
+
+    def register_script(self, script):
+        """
+        Register a Lua ``script`` specifying the ``keys`` it will touch.
+        Returns a Script object that is callable and hides the complexity of
+        deal with scripts, keys, and shas. This is the preferred way to work
+        with Lua scripts.
+        """
+        return Script(self, script)
+
+    def get_script(self, script):
+        """
+        Return the Script object of the Lua ``script`` registered with this
+        client, registering it on first use, so its SHA is only computed
+        once.
+        """
+        try:
+            return self._scripts[script]
+        except KeyError:
+            registered = self._scripts[script] = self.register_script(script)
+            return registered
+
+    #### ATOMIC OPERATIONS ####
+    def compare_and_set(self, name, expected, value, time=None):
+        """
+        Set the value of key ``name`` to ``value`` only if its current value
+        is ``expected``. If ``time`` is specified, the key expires after that
+        many seconds, otherwise any previous expiration is removed.
+
+        Returns True if the value was set.
+        """
+        return self._atomic(scripts.COMPARE_AND_SET, [name],
+                            [expected, value, time or 0], callback=bool)
+
+    def compare_and_delete(self, name, expected):
+        """
+        Delete key ``name`` only if its current value is ``expected``.
+        Returns True if the key was deleted.
+        """
+        return self._atomic(scripts.COMPARE_AND_DELETE, [name], [expected],
+                            callback=bool)
+
+    def msetex(self, mapping, time=None, nx=False):
+        """
+        Set each key in ``mapping`` to its value, expiring after ``time``
+        seconds if specified. With ``nx``, the keys are only set if none of
+        them already exist, like MSETNX.
+
+        Returns True if the keys were set.
+        """
+        keys = list(mapping.keys())
+        args = [time or 0, nx and 1 or 0] + [mapping[k] for k in keys]
+        return self._atomic(scripts.MSETEX, keys, args, callback=bool)
+
+    def hincrby_capped(self, name, mapping, minimum=None, maximum=None):
+        """
+        Increment the fields of hash ``name`` by the amounts in ``mapping``,
+        keeping each value between ``minimum`` and ``maximum``.
+
+        Returns a dict of the fields' new values. The amounts, bounds and
+        current values must be integers.
+        """
+        fields = list(mapping.keys())
+        for value in [minimum, maximum] + [mapping[f] for f in fields]:
+            if value is not None and not isinstance(value, int):
+                raise DataError("hincrby_capped amounts and bounds must be "
+                                "integers")
+        args = ['' if minimum is None else minimum,
+                '' if maximum is None else maximum]
+        for field in fields:
+            args.extend((field, mapping[field]))
+        return self._atomic(scripts.HINCRBY_CAPPED, [name], args,
+                            callback=lambda r: dict(zip(fields, r)))
+
+    def lpop_many(self, name, count):
+        "Remove and return up to ``count`` items from the head of list ``name``"
+        return self._atomic(scripts.POP_MANY, [name], [count, 'left'])
+
+    def rpop_many(self, name, count):
+        "Remove and return up to ``count`` items from the tail of list ``name``"
+        return self._atomic(scripts.POP_MANY, [name], [count, 'right'])
+
+    def zmove_expired(self, src, dst, max_score=None, count=None):
+        """
+        Move the members of sorted set ``src`` with a score of at most
+        ``max_score``, the current time by default, to the tail of list
+        ``dst``. If ``count`` is specified, at most that many members with
+        the lowest scores are moved.
+
+        Returns the list of moved members.
+        """
+        if max_score is None:
+            max_score = time.time()
+        return self._atomic(scripts.ZMOVE_EXPIRED, [src, dst],
+                            [repr(max_score), '' if count is None else count])
+
+    def _atomic(self, script, keys, args, **options):
+        "Run one of the Lua ``script``s of the atomic operations"
+        return self.get_script(script)(keys, args, **options)
+
 
 class Redis(StrictRedis):
     """
@@ -1118,6 +1945,7 @@ class Redis(StrictRedis):
     RESPONSE_CALLBACKS = dict_merge(
         StrictRedis.RESPONSE_CALLBACKS,
         {
+            'PTTL': lambda r: r != -1 and r or None,
             'TTL': lambda r: r != -1 and r or None,
         }
     )
@@ -1134,7 +1962,11 @@ class Redis(StrictRedis):
             self.connection_pool,
             self.response_callbacks,
             transaction,
-            shard_hint)
+            shard_hint,
+            self.client_cache,
+            self.codecs,
+            self.single_flight,
+            self.command_specs)
 
     def setex(self, name, value, time):
         """
@@ -1184,7 +2016,7 @@ class Redis(StrictRedis):
         for pair in kwargs.items():
             pieces.append(pair[1])
             pieces.append(pair[0])
-        return self.execute_command('ZADD', name, *pieces)
+        return self.execute_chunked_command(sum, 'ZADD', [name], pieces, 2)
 
 
 class PubSub(object):
@@ -1194,10 +2026,14 @@ class PubSub(object):
     After subscribing to one or more channels, the listen() method will block
     until a message arrives on one of the subscribed channels. That message
     will be returned and it's safe to start listening again.
+
+    Messages are dicts, or Message objects if ``compact`` is True. Their
+    payloads are then read as bytes and decoded when first accessed.
     """
-    def __init__(self, connection_pool, shard_hint=None):
+    def __init__(self, connection_pool, shard_hint=None, compact=False):
         self.connection_pool = connection_pool
         self.shard_hint = shard_hint
+        self.compact = compact
         self.connection = None
         self.channels = set()
         self.patterns = set()
@@ -1249,7 +2085,13 @@ class PubSub(object):
 
     def parse_response(self):
         "Parse the response from a publish/subscribe command"
-        response = self.connection.read_response()
+        connection = self.connection
+        response = connection.read_response(raw=self.compact)
+        if self.compact:
+            response = parse_raw_response(
+                response, connection.encoding, connection.encoding_errors)
+            if isinstance(response, Message):
+                return response
         if response[0] in self.subscribe_commands:
             self.subscription_count = response[2]
             # if we've just unsubscribed from the remaining channels,
@@ -1305,22 +2147,56 @@ class PubSub(object):
     def listen(self):
         "Listen for messages on channels this client has been subscribed to"
         while self.subscription_count:
-            r = self.parse_response()
-            if r[0] == 'pmessage':
-                msg = {
-                    'type': r[0],
-                    'pattern': r[1],
-                    'channel': r[2],
-                    'data': r[3]
-                }
-            else:
-                msg = {
-                    'type': r[0],
-                    'pattern': None,
-                    'channel': r[1],
-                    'data': r[2]
-                }
-            yield msg
+            yield self.handle_message(self.parse_response())
+
+    def get_message(self, timeout=0):
+        """
+        Return the next message on the channels this client has been
+        subscribed to, or None if no message arrives within ``timeout``
+        seconds. Returns immediately if ``timeout`` is 0, and waits forever
+        if it's None.
+        """
+        if not self.subscription_count or self.connection is None:
+            return None
+        if not self.connection.can_read(timeout):
+            return None
+        return self.handle_message(self.parse_response())
+
+    def fileno(self):
+        """
+        Returns the file descriptor of the subscription connection's socket,
+        to wait for messages with select or selectors alongside other I/O.
+
+        Several messages can be read from the socket at once, so when the
+        socket is readable, call get_message() until it returns None.
+        """
+        if self.connection is None:
+            raise ConnectionError("Not subscribed to any channel or pattern")
+        return self.connection._sock.fileno()
+
+    def handle_message(self, response):
+        "Return the message of a publish/subscribe ``response``"
+        if isinstance(response, Message):
+            return response
+        return to_message(response)
+
+    def run_in_thread(self, handlers=None, pattern_handlers=None, workers=4,
+                      queue_size=1000, exception_handler=None):
+        """
+        Subscribe to the channels of ``handlers`` and the patterns of
+        ``pattern_handlers``, and call their handlers with each message
+        published, in a pool of ``workers`` threads fed by a thread reading
+        the messages. Returns the started PubSubWorkerPool, whose stop()
+        method stops it.
+
+        Messages of a channel are handled in order, by the same worker.
+        Each worker queues up to ``queue_size`` messages, after which
+        reading messages waits for the worker to catch up.
+        """
+        pool = PubSubWorkerPool(self, handlers, pattern_handlers, workers,
+                                queue_size, exception_handler)
+        pool.start()
+        return pool
 
 
 class BasePipeline(object):
@@ -1343,14 +2219,24 @@ class BasePipeline(object):
     """
 
     UNWATCH_COMMANDS = set(('DISCARD', 'EXEC', 'UNWATCH'))
+    WATCH_COMMANDS = UNWATCH_COMMANDS | set(('WATCH',))
 
     def __init__(self, connection_pool, response_callbacks, transaction,
-                 shard_hint):
+                 shard_hint, client_cache=None, codecs=None,
+                 single_flight=None, command_specs=None):
         self.connection_pool = connection_pool
         self.connection = None
         self.response_callbacks = response_callbacks
         self.transaction = transaction
         self.shard_hint = shard_hint
+        self.client_cache = client_cache
+        self.codecs = codecs
+        self.single_flight = single_flight
+        if command_specs is not None:
+            self.command_specs = command_specs
+        self._scripts = {}
+        # commands are already sent in a single request, never chunk them
+        self.chunk_size = None
 
         self.watching = False
         self.reset()
@@ -1369,6 +2255,7 @@ class BasePipeline(object):
 
     def reset(self):
         self.command_stack = []
+        self.scripts = set()
         # make sure to reset the connection state in the event that we were
         # watching something
         if self.watching and self.connection:
@@ -1389,6 +2276,15 @@ class BasePipeline(object):
             self.connection_pool.release(self.connection)
             self.connection = None
 
+    def execute_bulk_command(self, merge, command_name, prefix, firsts,
+                             seconds, chunk_size=None):
+        "Queue a single command of the pairs of ``firsts`` and ``seconds``"
+        if len(firsts) != len(seconds):
+            raise DataError("%s requires sequences of equal length" %
+                            command_name)
+        items = list(chain.from_iterable(zip(firsts, seconds)))
+        return self.execute_command(command_name, *(prefix + items))
+
     def multi(self):
         """
         Start a transactional block of the pipeline after WATCH commands
@@ -1402,6 +2298,8 @@ class BasePipeline(object):
         self.explicit_transaction = True
 
     def execute_command(self, *args, **kwargs):
+        if self.codecs is not None:
+            args, kwargs = self.codecs.prepare(args, kwargs)
         if (self.watching or args[0] == 'WATCH') and \
                 not self.explicit_transaction:
             return self.immediate_execute_command(*args, **kwargs)
@@ -1433,6 +2331,10 @@ class BasePipeline(object):
                 return self.parse_response(conn, command_name, **options)
             self.reset()
             raise
+        finally:
+            if self.client_cache is not None:
+                self.client_cache.invalidate_command(args,
+                                                     self.command_specs)
 
     def pipeline_execute_command(self, *args, **options):
         """
@@ -1450,7 +2352,7 @@ class BasePipeline(object):
         return self
 
     def _execute_transaction(self, connection, commands):
-        all_cmds = ''.join(starmap(connection.pack_command,
+        all_cmds = b''.join(starmap(connection.pack_command,
                                    [args for args, options in commands]))
         connection.send_packed_command(all_cmds)
         # we don't care about the multi/exec any longer
@@ -1460,8 +2362,10 @@ class BasePipeline(object):
         # which is the last command
         for i in range(len(commands)+1):
             self.parse_response(connection, '_')
-        # parse the EXEC.
-        response = self.parse_response(connection, '_')
+        # parse the EXEC. if values within the replies need to be decoded,
+        # read them raw and decode the other replies afterwards
+        raw = any('decoder' in options for args, options in commands)
+        response = connection.read_response(raw=raw)
 
         if response is None:
             raise WatchError("Watched variable changed.")
@@ -1471,22 +2375,55 @@ class BasePipeline(object):
                                 "pipeline execution")
         # We have to run response callbacks manually
         data = []
-        for r, cmd in zip(response, commands):
+        callbacks = self.resolve_callbacks(commands)
+        for r, cmd, callback in zip(response, commands, callbacks):
             if not isinstance(r, Exception):
                 args, options = cmd
-                command_name = args[0]
-                if command_name in self.response_callbacks:
-                    r = self.response_callbacks[command_name](r, **options)
+                if raw:
+                    options = dict(options)
+                    decoder = options.pop('decoder', None)
+                    if decoder is None:
+                        r = decode_response(r, connection.encoding,
+                                            connection.encoding_errors)
+                    else:
+                        r = decoder(r)
+                if callback is not None and options:
+                    r = callback(r, **options)
+                elif callback is not None:
+                    r = callback(r)
             data.append(r)
         return data
 
     def _execute_pipeline(self, connection, commands):
         # build up all commands into a single request to increase network perf
-        all_cmds = ''.join(starmap(connection.pack_command,
+        all_cmds = b''.join(starmap(connection.pack_command,
                                    [args for args, options in commands]))
         connection.send_packed_command(all_cmds)
-        return [self.parse_response(connection, args[0], **options)
-                for args, options in commands]
+        read_response = connection.read_response
+        data = []
+        error = None
+        callbacks = self.resolve_callbacks(commands)
+        for (args, options), callback in zip(commands, callbacks):
+            try:
+                if options or args[0] in self.WATCH_COMMANDS:
+                    data.append(self.parse_response(connection, args[0],
+                                                    **options))
+                    continue
+                r = read_response()
+            except ResponseError as e:
+                # read the remaining replies so none are left on the
+                # connection, then raise the first error
+                error = error or e
+                continue
+            data.append(r if callback is None else callback(r))
+        if error is not None:
+            raise error
+        return data
+
+    def resolve_callbacks(self, commands):
+        "Return the response callback of each of ``commands``, or None"
+        get = self.response_callbacks.get
+        return [get(args[0]) for args, options in commands]
 
     def parse_response(self, connection, command_name, **options):
         result = StrictRedis.parse_response(
@@ -1497,8 +2434,29 @@ class BasePipeline(object):
             self.watching = True
         return result
 
+    def load_scripts(self):
+        """
+        Make sure the scripts called within the pipeline are in the server's
+        script cache, so their EVALSHA commands don't fail. Checks all of them
+        in one round trip, then loads the missing ones in another.
+        """
+        scripts = list(self.scripts)
+        shas = [s.sha for s in scripts]
+        exists = self.immediate_execute_command('SCRIPT', 'EXISTS', *shas,
+                                                parse='EXISTS')
+        missing = [s for s, exist in zip(scripts, exists) if not exist]
+        if not missing:
+            return
+        conn = self.connection
+        conn.send_packed_command(b''.join(
+            [conn.pack_command('SCRIPT', 'LOAD', s.script) for s in missing]))
+        for s in missing:
+            s.sha = self.parse_response(conn, 'SCRIPT', parse='LOAD')
+
     def execute(self):
         "Execute all the commands in the current pipeline"
+        if self.scripts:
+            self.load_scripts()
         stack = self.command_stack
         if self.transaction or self.explicit_transaction:
             stack = [(('MULTI', ), {})] + stack + [(('EXEC', ), {})]
@@ -1529,6 +2487,13 @@ class BasePipeline(object):
             # predicated on any state
             return execute(conn, stack)
         finally:
+            if self.client_cache is not None:
+                for args, options in stack:
+                    self.client_cache.invalidate_command(args,
+                                                         self.command_specs)
+            if self.single_flight is not None:
+                self.single_flight.completed(
+                    [args[0] for args, options in stack], self.command_specs)
             self.reset()
 
     def watch(self, *names):
@@ -1554,9 +2519,43 @@ class Pipeline(BasePipeline, Redis):
     "Pipeline for the Redis class"
     pass
 
-class LockError(RedisError):
-    "Errors thrown from the Lock"
-    pass
+class Script(object):
+    "An executable Lua script object returned by ``register_script``"
+
+    def __init__(self, registered_client, script):
+        self.registered_client = registered_client
+        self.script = script
+        encoding = registered_client.connection_pool.connection_kwargs.get(
+            'encoding', 'utf-8')
+        if isinstance(script, str):
+            script = script.encode(encoding)
+        self.sha = hashlib.sha1(script).hexdigest()
+
+    def __call__(self, keys=[], args=[], client=None, **options):
+        """
+        Execute the script, passing any required ``args``. ``client`` may be
+        another client or a pipeline to execute the script with. A
+        ``callback`` option is called with the script's result to build the
+        value returned.
+
+        EVALSHA is tried first. If the server doesn't have the script cached
+        it's sent with EVAL, which also caches it. Within a pipeline, the
+        script is loaded before the pipeline is executed instead.
+        """
+        if client is None:
+            client = self.registered_client
+        args = tuple(keys) + tuple(args)
+        if isinstance(client, BasePipeline):
+            client.scripts.add(self)
+            return client.execute_command('EVALSHA', self.sha, len(keys),
+                                          *args, **options)
+        try:
+            return client.execute_command('EVALSHA', self.sha, len(keys),
+                                          *args, **options)
+        except NoScriptError:
+            return client.execute_command('EVAL', self.script, len(keys),
+                                          *args, **options)
+
 
 class Lock(object):
     """
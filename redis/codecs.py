@@ -0,0 +1,297 @@
+import json
+import lzma
+import pickle
+import zlib
+from fnmatch import fnmatchcase
+from redis.connection import decode_response
+from redis.exceptions import DecompressionError, RedisError
+
+try:
+    import msgpack
+    msgpack_available = True
+except ImportError:
+    msgpack_available = False
+
+
+class Codec(object):
+    """
+    Base class of value codecs. A codec serializes the values written to
+    keys it's selected for and deserializes the values read back from them.
+    """
+    def encode(self, value):
+        "Return the bytes stored on the server for ``value``"
+        raise NotImplementedError
+
+    def decode(self, data):
+        "Return the value represented by the stored bytes ``data``"
+        raise NotImplementedError
+
+
+class StringCodec(Codec):
+    "Stores values as encoded strings, the client's default behavior"
+    def __init__(self, encoding='utf-8', errors='strict'):
+        self.encoding = encoding
+        self.errors = errors
+
+    def encode(self, value):
+        if isinstance(value, bytes):
+            return value
+        if not isinstance(value, str):
+            value = str(value)
+        return value.encode(self.encoding, self.errors)
+
+    def decode(self, data):
+        return data.decode(self.encoding, self.errors)
+
+
+class JSONCodec(Codec):
+    "Stores values as JSON documents"
+    def __init__(self, **dumps_kwargs):
+        dumps_kwargs.setdefault('separators', (',', ':'))
+        self.dumps_kwargs = dumps_kwargs
+
+    def encode(self, value):
+        return json.dumps(value, **self.dumps_kwargs).encode('utf-8')
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class PickleCodec(Codec):
+    """
+    Stores values as pickles. Only use it with servers where all writers are
+    trusted, unpickling data can execute arbitrary code.
+    """
+    def __init__(self, protocol=pickle.HIGHEST_PROTOCOL):
+        self.protocol = protocol
+
+    def encode(self, value):
+        return pickle.dumps(value, self.protocol)
+
+    def decode(self, data):
+        return pickle.loads(data)
+
+
+class MsgpackCodec(Codec):
+    "Stores values serialized with MessagePack"
+    def __init__(self):
+        if not msgpack_available:
+            raise RedisError("msgpack is not installed")
+
+    def encode(self, value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+class CompressionCodec(Codec):
+    """
+    Compresses the values serialized by ``codec``, a StringCodec by default,
+    once they're at least ``threshold`` bytes long.
+
+    ``algorithm`` is either 'zlib' or 'lzma', and ``level`` the compression
+    level (or lzma preset) from 0 to 9, 6 by default.
+
+    Every value is stored with a one byte tag telling whether it's stored
+    as ``codec`` encoded it or compressed, and with which algorithm. Values
+    that don't shrink when compressed are stored uncompressed.
+
+    Values written without the codec have no tag, so enabling it for keys
+    already holding values makes them unreadable: reading them raises a
+    DecompressionError.
+    """
+    RAW = b'\x00'
+    ALGORITHMS = {'zlib': b'z', 'lzma': b'x'}
+
+    def __init__(self, codec=None, threshold=1024, algorithm='zlib',
+                 level=6):
+        if algorithm not in self.ALGORITHMS:
+            raise RedisError("Unknown compression algorithm: %s" % algorithm)
+        self.codec = codec or StringCodec()
+        self.threshold = threshold
+        self.algorithm = algorithm
+        self.level = level
+        self.tag = self.ALGORITHMS[algorithm]
+
+    def compress(self, data):
+        "Return the compressed ``data``, including the tag"
+        if self.algorithm == 'zlib':
+            return self.tag + zlib.compress(data, self.level)
+        return self.tag + lzma.compress(data, preset=self.level)
+
+    def decompress(self, data):
+        """
+        Return ``data`` without its tag, decompressed if it's compressed.
+        Raises a DecompressionError if ``data`` has an unknown tag or can't
+        be decompressed.
+        """
+        tag = data[:1]
+        if tag == self.RAW:
+            return data[1:]
+        try:
+            if tag == b'z':
+                return zlib.decompress(data[1:])
+            if tag == b'x':
+                return lzma.decompress(data[1:])
+        except (zlib.error, lzma.LZMAError) as e:
+            raise DecompressionError("Cannot decompress value: %s" % e)
+        raise DecompressionError("Unknown compression tag: %r" % tag)
+
+    def encode(self, value):
+        data = self.codec.encode(value)
+        if len(data) >= self.threshold:
+            compressed = self.compress(data)
+            if len(compressed) <= len(data):
+                return compressed
+        return self.RAW + data
+
+    def decode(self, data):
+        return self.codec.decode(self.decompress(data))
+
+
+# the argument positions of values in commands writing values, as a function
+# of the command's arguments returning (position, key) pairs
+VALUE_ARGUMENTS = dict(
+    [(name, lambda args: [(2, args[1])]) for name in (
+        'GETSET', 'LPUSHX', 'RPUSHX', 'SET', 'SETNX')] +
+    [(name, lambda args: [(3, args[1])]) for name in (
+        'HSET', 'HSETNX', 'LREM', 'LSET', 'SETEX')] +
+    [(name, lambda args: [(i, args[1]) for i in range(2, len(args))])
+     for name in ('LPUSH', 'RPUSH')] +
+    [(name, lambda args: [(i, args[i - 1]) for i in range(2, len(args), 2)])
+     for name in ('MSET', 'MSETNX')] +
+    [
+        ('HMSET', lambda args: [(i, args[1]) for i in range(3, len(args), 2)]),
+        ('LINSERT', lambda args: [(3, args[1]), (4, args[1])]),
+    ])
+
+# the shape of replies holding values, used to decode them
+SINGLE_VALUE_REPLIES = set((
+    'BRPOPLPUSH', 'GET', 'GETSET', 'HGET', 'LINDEX', 'LPOP', 'RPOP',
+    'RPOPLPUSH',
+    ))
+LIST_OF_VALUES_REPLIES = set(('HMGET', 'HVALS', 'LRANGE'))
+KEY_VALUE_REPLIES = set(('BLPOP', 'BRPOP'))
+VALUE_REPLIES = SINGLE_VALUE_REPLIES | LIST_OF_VALUES_REPLIES | \
+    set(('HGETALL',))
+
+
+class KeyCodecs(object):
+    """
+    Selects the codec applied to the values of each key. ``codecs`` is a
+    list of (pattern, codec) pairs, or a dict mapping patterns to codecs,
+    matched against key names with glob style patterns in order. Keys not
+    matching any pattern use the ``default`` codec, or are left alone if
+    ``default`` is None.
+
+    Codecs are applied to string, hash and list values. ``encoding`` and
+    ``errors`` are used to decode the parts of replies that aren't values,
+    such as the field names returned by HGETALL.
+    """
+    def __init__(self, codecs=None, default=None, encoding='utf-8',
+                 errors='strict'):
+        if isinstance(codecs, dict):
+            codecs = codecs.items()
+        self.codecs = list(codecs or [])
+        self.default = default
+        self.encoding = encoding
+        self.errors = errors
+        # decoders by reply shape and codecs, see decoder()
+        self._decoders = {}
+
+    def get(self, key):
+        "Return the codec of ``key``, or None if its values aren't encoded"
+        if isinstance(key, bytes):
+            key = key.decode(self.encoding, self.errors)
+        elif not isinstance(key, str):
+            key = str(key)
+        for pattern, codec in self.codecs:
+            if fnmatchcase(key, pattern):
+                return codec
+        return self.default
+
+    def prepare(self, args, options):
+        """
+        Return the command ``args`` with their values encoded, and the
+        ``options`` to parse the reply with. If the reply holds values,
+        a ``decoder`` option is added to decode them.
+        """
+        command_name = args[0]
+        if command_name in VALUE_ARGUMENTS:
+            args = list(args)
+            for i, key in VALUE_ARGUMENTS[command_name](args):
+                codec = self.get(key)
+                if codec is not None:
+                    args[i] = codec.encode(args[i])
+            args = tuple(args)
+        decoder = self.decoder(args)
+        if decoder is not None:
+            options = dict(options, decoder=decoder)
+        return args, options
+
+    def decoder(self, args):
+        """
+        Return a function decoding the values within the raw reply to the
+        command ``args``, or None if the reply holds no encoded values.
+
+        The same function is returned for replies of the same shape holding
+        values of the same codecs, so the options of identical reads stay
+        equal and a SingleFlight coalesces them.
+        """
+        command_name = args[0]
+        if command_name == 'MGET':
+            codec = tuple(self.get(key) for key in args[1:])
+            if not any(codec):
+                return None
+            shape = 'mget'
+        elif command_name in KEY_VALUE_REPLIES:
+            return self._decode_key_value
+        elif command_name not in VALUE_REPLIES:
+            return None
+        else:
+            codec = self.get(args[1])
+            if codec is None:
+                return None
+            if command_name in SINGLE_VALUE_REPLIES:
+                shape = 'value'
+            elif command_name in LIST_OF_VALUES_REPLIES:
+                shape = 'list'
+            else:
+                shape = 'pairs'
+        decoder = self._decoders.get((shape, codec))
+        if decoder is None:
+            decoder = self._decoders.setdefault(
+                (shape, codec), self._make_decoder(shape, codec))
+        return decoder
+
+    def _make_decoder(self, shape, codec):
+        if shape == 'mget':
+            return lambda response: [
+                self._decode(c, r) for c, r in zip(codec, response)]
+        if shape == 'value':
+            return lambda response: self._decode(codec, response)
+        if shape == 'list':
+            return lambda response: response and \
+                [self._decode(codec, r) for r in response]
+        return lambda response: response and \
+            self._decode_pairs(codec, response)
+
+    def _decode(self, codec, data):
+        if codec is None:
+            return decode_response(data, self.encoding, self.errors)
+        if data is None:
+            return None
+        return codec.decode(data)
+
+    def _decode_pairs(self, codec, response):
+        fields = decode_response(response[::2], self.encoding, self.errors)
+        response[::2] = fields
+        response[1::2] = [codec.decode(r) for r in response[1::2]]
+        return response
+
+    def _decode_key_value(self, response):
+        if not response:
+            return response
+        key = response[0].decode(self.encoding, self.errors)
+        return [key, self._decode(self.get(key), response[1])]
@@ -0,0 +1,282 @@
+"""
+Descriptions of the commands issued by the clients: their arity, flags, key
+positions and reply types, as reported by the COMMAND command.
+"""
+
+# the flags a CommandSpec may have. 'random' marks commands whose replies
+# may differ between identical calls on unchanged data, like SRANDMEMBER
+FLAGS = set((
+    'admin', 'blocking', 'movablekeys', 'pubsub', 'random', 'readonly',
+    'write',
+    ))
+
+
+class CommandSpec(object):
+    """
+    Describes a command named ``name``.
+
+    ``arity`` is the number of arguments including the command name, or
+    minus the minimum number of arguments of commands taking a variable
+    number of them.
+
+    ``flags`` is a set of FLAGS, or a string of space separated flags.
+
+    The keys of the command are the arguments from position ``first_key``
+    to ``last_key``, every ``key_step`` arguments, the command name being
+    at position 0. A negative ``last_key`` counts from the last argument.
+    Commands without keys have a ``first_key`` of 0. The keys of commands
+    with the 'movablekeys' flag, whose positions depend on the arguments,
+    are found by calling ``key_func`` with the arguments instead.
+
+    ``reply`` is the type of the command's reply: 'status', 'integer',
+    'bulk' or 'array', or None if it depends on the arguments.
+    """
+    def __init__(self, name, arity, flags=(), first_key=0, last_key=0,
+                 key_step=0, reply=None, key_func=None):
+        if isinstance(flags, str):
+            flags = flags.split()
+        self.name = name
+        self.arity = arity
+        self.flags = frozenset(flags)
+        self.first_key = first_key
+        self.last_key = last_key
+        self.key_step = key_step
+        self.reply = reply
+        self.key_func = key_func
+        self.readonly = 'readonly' in self.flags
+        self.write = 'write' in self.flags
+        self.blocking = 'blocking' in self.flags
+        self.random = 'random' in self.flags
+
+    def __repr__(self):
+        return '<CommandSpec %s arity=%d flags=%s keys=%d:%d:%d reply=%s>' % (
+            self.name, self.arity, ','.join(sorted(self.flags)),
+            self.first_key, self.last_key, self.key_step, self.reply)
+
+    def keys(self, args):
+        "Return the keys within the arguments ``args`` of a call"
+        if self.key_func is not None:
+            return list(self.key_func(args))
+        if not self.first_key:
+            return []
+        if self.last_key == self.first_key:
+            return list(args[self.first_key:self.first_key + 1])
+        last_key = self.last_key
+        if last_key < 0:
+            last_key += len(args)
+        return list(args[self.first_key:last_key + 1:self.key_step])
+
+    def check_arity(self, args):
+        "Returns True if ``args`` has a valid number of arguments"
+        if self.arity < 0:
+            return len(args) >= -self.arity
+        return len(args) == self.arity
+
+
+def numkeys_keys(args):
+    "Keys of commands followed by a number of keys, like EVAL"
+    return args[3:3 + int(args[2])]
+
+
+def destination_numkeys_keys(args):
+    "Keys of ZINTERSTORE and ZUNIONSTORE: the destination and the sources"
+    return [args[1]] + list(args[3:3 + int(args[2])])
+
+
+def sort_keys(args):
+    "Keys of SORT: the sorted key and the STORE destination, if any"
+    keys = [args[1]]
+    if 'STORE' in args:
+        keys.append(args[args.index('STORE') + 1])
+    return keys
+
+
+# name, arity, flags, first key, last key, key step, reply
+COMMAND_TABLE = [
+    ('APPEND', 3, 'write', 1, 1, 1, 'integer'),
+    ('AUTH', -2, '', 0, 0, 0, 'status'),
+    ('BGREWRITEAOF', 1, 'admin', 0, 0, 0, 'status'),
+    ('BGSAVE', -1, 'admin', 0, 0, 0, 'status'),
+    ('BLPOP', -3, 'write blocking', 1, -2, 1, 'array'),
+    ('BRPOP', -3, 'write blocking', 1, -2, 1, 'array'),
+    ('BRPOPLPUSH', 4, 'write blocking', 1, 2, 1, 'bulk'),
+    ('COMMAND', -1, 'random', 0, 0, 0, 'array'),
+    ('CONFIG', -2, 'admin', 0, 0, 0, None),
+    ('DBSIZE', 1, 'readonly', 0, 0, 0, 'integer'),
+    ('DEBUG', -2, 'admin', 0, 0, 0, None),
+    ('DECRBY', 3, 'write', 1, 1, 1, 'integer'),
+    ('DEL', -2, 'write', 1, -1, 1, 'integer'),
+    ('DISCARD', 1, '', 0, 0, 0, 'status'),
+    ('ECHO', 2, '', 0, 0, 0, 'bulk'),
+    # scripts may write any of their keys
+    ('EVAL', -3, 'write movablekeys', 0, 0, 0, None, numkeys_keys),
+    ('EVALSHA', -3, 'write movablekeys', 0, 0, 0, None, numkeys_keys),
+    ('EXEC', 1, '', 0, 0, 0, 'array'),
+    ('EXISTS', -2, 'readonly', 1, -1, 1, 'integer'),
+    ('EXPIRE', 3, 'write', 1, 1, 1, 'integer'),
+    ('EXPIREAT', 3, 'write', 1, 1, 1, 'integer'),
+    ('FLUSHALL', -1, 'write admin', 0, 0, 0, 'status'),
+    ('FLUSHDB', -1, 'write admin', 0, 0, 0, 'status'),
+    ('GET', 2, 'readonly', 1, 1, 1, 'bulk'),
+    ('GETBIT', 3, 'readonly', 1, 1, 1, 'integer'),
+    ('GETSET', 3, 'write', 1, 1, 1, 'bulk'),
+    ('HDEL', -3, 'write', 1, 1, 1, 'integer'),
+    ('HEXISTS', 3, 'readonly', 1, 1, 1, 'integer'),
+    ('HGET', 3, 'readonly', 1, 1, 1, 'bulk'),
+    ('HGETALL', 2, 'readonly', 1, 1, 1, 'array'),
+    ('HINCRBY', 4, 'write', 1, 1, 1, 'integer'),
+    ('HKEYS', 2, 'readonly', 1, 1, 1, 'array'),
+    ('HLEN', 2, 'readonly', 1, 1, 1, 'integer'),
+    ('HMGET', -3, 'readonly', 1, 1, 1, 'array'),
+    ('HMSET', -4, 'write', 1, 1, 1, 'status'),
+    ('HSCAN', -3, 'readonly random', 1, 1, 1, 'array'),
+    ('HSET', -4, 'write', 1, 1, 1, 'integer'),
+    ('HSETNX', 4, 'write', 1, 1, 1, 'integer'),
+    ('HVALS', 2, 'readonly', 1, 1, 1, 'array'),
+    ('INCRBY', 3, 'write', 1, 1, 1, 'integer'),
+    ('INFO', -1, 'random', 0, 0, 0, 'bulk'),
+    ('KEYS', 2, 'readonly', 0, 0, 0, 'array'),
+    ('LASTSAVE', 1, 'random', 0, 0, 0, 'integer'),
+    ('LINDEX', 3, 'readonly', 1, 1, 1, 'bulk'),
+    ('LINSERT', 5, 'write', 1, 1, 1, 'integer'),
+    ('LLEN', 2, 'readonly', 1, 1, 1, 'integer'),
+    ('LPOP', -2, 'write', 1, 1, 1, 'bulk'),
+    ('LPUSH', -3, 'write', 1, 1, 1, 'integer'),
+    ('LPUSHX', -3, 'write', 1, 1, 1, 'integer'),
+    ('LRANGE', 4, 'readonly', 1, 1, 1, 'array'),
+    ('LREM', 4, 'write', 1, 1, 1, 'integer'),
+    ('LSET', 4, 'write', 1, 1, 1, 'status'),
+    ('LTRIM', 4, 'write', 1, 1, 1, 'status'),
+    ('MGET', -2, 'readonly', 1, -1, 1, 'array'),
+    ('MOVE', 3, 'write', 1, 1, 1, 'integer'),
+    ('MSET', -3, 'write', 1, -1, 2, 'status'),
+    ('MSETNX', -3, 'write', 1, -1, 2, 'integer'),
+    ('MULTI', 1, '', 0, 0, 0, 'status'),
+    ('OBJECT', -2, 'readonly random', 2, 2, 1, None),
+    ('PERSIST', 2, 'write', 1, 1, 1, 'integer'),
+    ('PING', -1, '', 0, 0, 0, 'status'),
+    ('PSUBSCRIBE', -2, 'pubsub', 0, 0, 0, 'array'),
+    ('PTTL', 2, 'readonly', 1, 1, 1, 'integer'),
+    ('PUBLISH', 3, 'pubsub', 0, 0, 0, 'integer'),
+    ('PUNSUBSCRIBE', -1, 'pubsub', 0, 0, 0, 'array'),
+    ('RANDOMKEY', 1, 'readonly random', 0, 0, 0, 'bulk'),
+    ('RENAME', 3, 'write', 1, 2, 1, 'status'),
+    ('RENAMENX', 3, 'write', 1, 2, 1, 'integer'),
+    ('RPOP', -2, 'write', 1, 1, 1, 'bulk'),
+    ('RPOPLPUSH', 3, 'write', 1, 2, 1, 'bulk'),
+    ('RPUSH', -3, 'write', 1, 1, 1, 'integer'),
+    ('RPUSHX', -3, 'write', 1, 1, 1, 'integer'),
+    ('SADD', -3, 'write', 1, 1, 1, 'integer'),
+    ('SAVE', 1, 'admin', 0, 0, 0, 'status'),
+    ('SCAN', -2, 'readonly random', 0, 0, 0, 'array'),
+    ('SCARD', 2, 'readonly', 1, 1, 1, 'integer'),
+    ('SCRIPT', -2, '', 0, 0, 0, None),
+    ('SDIFF', -2, 'readonly', 1, -1, 1, 'array'),
+    ('SDIFFSTORE', -3, 'write', 1, -1, 1, 'integer'),
+    ('SELECT', 2, '', 0, 0, 0, 'status'),
+    ('SET', -3, 'write', 1, 1, 1, 'status'),
+    ('SETBIT', 4, 'write', 1, 1, 1, 'integer'),
+    ('SETEX', 4, 'write', 1, 1, 1, 'status'),
+    ('SETNX', 3, 'write', 1, 1, 1, 'integer'),
+    ('SETRANGE', 4, 'write', 1, 1, 1, 'integer'),
+    ('SHUTDOWN', -1, 'admin', 0, 0, 0, 'status'),
+    ('SINTER', -2, 'readonly', 1, -1, 1, 'array'),
+    ('SINTERSTORE', -3, 'write', 1, -1, 1, 'integer'),
+    ('SISMEMBER', 3, 'readonly', 1, 1, 1, 'integer'),
+    ('SLAVEOF', 3, 'admin', 0, 0, 0, 'status'),
+    ('SMEMBERS', 2, 'readonly', 1, 1, 1, 'array'),
+    ('SMOVE', 4, 'write', 1, 2, 1, 'integer'),
+    ('SORT', -2, 'write movablekeys', 1, 1, 1, 'array', sort_keys),
+    ('SPOP', -2, 'write random', 1, 1, 1, 'bulk'),
+    ('SRANDMEMBER', -2, 'readonly random', 1, 1, 1, 'bulk'),
+    ('SREM', -3, 'write', 1, 1, 1, 'integer'),
+    ('SSCAN', -3, 'readonly random', 1, 1, 1, 'array'),
+    ('STRLEN', 2, 'readonly', 1, 1, 1, 'integer'),
+    ('SUBSCRIBE', -2, 'pubsub', 0, 0, 0, 'array'),
+    ('SUBSTR', 4, 'readonly', 1, 1, 1, 'bulk'),
+    ('SUNION', -2, 'readonly', 1, -1, 1, 'array'),
+    ('SUNIONSTORE', -3, 'write', 1, -1, 1, 'integer'),
+    ('TTL', 2, 'readonly', 1, 1, 1, 'integer'),
+    ('TYPE', 2, 'readonly', 1, 1, 1, 'status'),
+    ('UNSUBSCRIBE', -1, 'pubsub', 0, 0, 0, 'array'),
+    ('UNWATCH', 1, '', 0, 0, 0, 'status'),
+    ('WATCH', -2, '', 1, -1, 1, 'status'),
+    ('ZADD', -4, 'write', 1, 1, 1, 'integer'),
+    ('ZCARD', 2, 'readonly', 1, 1, 1, 'integer'),
+    ('ZCOUNT', 4, 'readonly', 1, 1, 1, 'integer'),
+    ('ZINCRBY', 4, 'write', 1, 1, 1, 'bulk'),
+    ('ZINTERSTORE', -4, 'write movablekeys', 1, 1, 1, 'integer',
+     destination_numkeys_keys),
+    ('ZRANGE', -4, 'readonly', 1, 1, 1, 'array'),
+    ('ZRANGEBYSCORE', -4, 'readonly', 1, 1, 1, 'array'),
+    ('ZRANK', 3, 'readonly', 1, 1, 1, 'integer'),
+    ('ZREM', -3, 'write', 1, 1, 1, 'integer'),
+    ('ZREMRANGEBYRANK', 4, 'write', 1, 1, 1, 'integer'),
+    ('ZREMRANGEBYSCORE', 4, 'write', 1, 1, 1, 'integer'),
+    ('ZREVRANGE', -4, 'readonly', 1, 1, 1, 'array'),
+    ('ZREVRANGEBYSCORE', -4, 'readonly', 1, 1, 1, 'array'),
+    ('ZREVRANK', 3, 'readonly', 1, 1, 1, 'integer'),
+    ('ZSCAN', -3, 'readonly random', 1, 1, 1, 'array'),
+    ('ZSCORE', 3, 'readonly', 1, 1, 1, 'bulk'),
+    ('ZUNIONSTORE', -4, 'write movablekeys', 1, 1, 1, 'integer',
+     destination_numkeys_keys),
+    ]
+
+COMMANDS = dict((row[0], CommandSpec(*row)) for row in COMMAND_TABLE)
+
+
+def find_spec(command_name, commands=COMMANDS):
+    """
+    Return the CommandSpec of ``command_name`` in ``commands``, or None if
+    the command is unknown. Names are matched case insensitively.
+    """
+    spec = commands.get(command_name)
+    if spec is None:
+        # commands are mostly issued by name already in upper case
+        spec = commands.get(command_name.upper())
+    return spec
+
+
+def command_keys(args, commands=COMMANDS):
+    """
+    Return the keys within the arguments ``args`` of a command, looked up
+    in ``commands``. Unknown commands have no keys.
+    """
+    spec = find_spec(args[0], commands)
+    if spec is None:
+        return []
+    return spec.keys(args)
+
+
+def parse_command(response, commands=COMMANDS):
+    """
+    Return a dict of the CommandSpecs described by a COMMAND ``response``.
+    Flags unknown to FLAGS are dropped. Commands described in ``commands``
+    keep their reply type, their key function and their 'blocking' and
+    'write' flags, which servers don't all report, e.g. scripts aren't
+    flagged as writes. They also keep their own 'random' flag, as servers
+    flag commands like HGETALL and TTL whose replies may differ between
+    calls for other reasons, such as ordering or time passing.
+    """
+    specs = {}
+    for info in response:
+        name, arity, flags, first_key, last_key, key_step = info[:6]
+        name = name.upper()
+        flags = FLAGS.intersection(flags)
+        local = commands.get(name)
+        reply = key_func = None
+        if local is not None:
+            reply, key_func = local.reply, local.key_func
+            if local.blocking:
+                flags.add('blocking')
+            if local.write:
+                flags.add('write')
+            if local.random:
+                flags.add('random')
+            else:
+                flags.discard('random')
+        if 'movablekeys' not in flags:
+            key_func = None
+        specs[name] = CommandSpec(name, arity, flags, first_key, last_key,
+                                  key_step, reply, key_func)
+    return specs
@@ -1,4 +1,5 @@
 import os
+import selectors
 import socket
 from itertools import chain
 from redis.exceptions import (
@@ -6,7 +7,9 @@ from redis.exceptions import (
     ConnectionError,
     ResponseError,
     InvalidResponse,
-    AuthenticationError
+    AuthenticationError,
+    NoScriptError,
+    UnknownCommandError,
 )
 
 from io import BytesIO
@@ -17,12 +20,30 @@ try:
 except ImportError:
     hiredis_available = False
 
+# the types of the columns encoded at once by Connection.encode_column
+NUMBER_TYPES = frozenset((int, float))
+STR_TYPES = frozenset((str,))
+BYTES_TYPES = frozenset((bytes,))
+
+PAIR_FORMAT = b'$%d\r\n%s\r\n$%d\r\n%s\r\n'
+
+def decode_response(response, encoding='utf-8', errors='strict'):
+    "Decode the bulk replies within a raw ``response`` to strings"
+    if isinstance(response, bytes):
+        return response.decode(encoding, errors)
+    if isinstance(response, list):
+        return [decode_response(r, encoding, errors) for r in response]
+    return response
+
 class PythonParser(object):
     "Plain Python parsing class"
     MAX_READ_LENGTH = 1000000
 
     def __init__(self):
+        self._sock = None
         self._fp = None
+        self.encoding = 'utf-8'
+        self.encoding_errors = 'strict'
 
     def __del__(self):
         try:
@@ -32,14 +53,36 @@ class PythonParser(object):
 
     def on_connect(self, connection):
         "Called when the socket connects"
+        self._sock = connection._sock
         self._fp = connection._sock.makefile('rb')
+        self.encoding = connection.encoding
+        self.encoding_errors = connection.encoding_errors
 
     def on_disconnect(self):
         "Called when the socket disconnects"
+        self._sock = None
         if self._fp is not None:
             self._fp.close()
             self._fp = None
 
+    def can_read(self):
+        """
+        Returns True if data is buffered or can be read from the socket
+        without blocking
+        """
+        if self._fp is None:
+            return False
+        timeout = self._sock.gettimeout()
+        self._sock.settimeout(0)
+        try:
+            # only reads from the socket if nothing is buffered, returning
+            # nothing instead of blocking
+            return bool(self._fp.peek(1))
+        except (socket.error, ValueError):
+            return False
+        finally:
+            self._sock.settimeout(timeout)
+
     def read(self, length=None):
         """
         Read a line from the socket is no length is specified,
@@ -71,7 +114,11 @@ class PythonParser(object):
             raise ConnectionError("Error while reading from socket: %s" % \
                 (e.args,))
 
-    def read_response(self):
+    def read_response(self, raw=False):
+        """
+        Read and parse a reply. Bulk replies are decoded to strings, unless
+        ``raw`` is True in which case they're returned as bytes.
+        """
         response = self.read().decode()
         if not response:
             raise ConnectionError("Socket closed on remote end")
@@ -82,11 +129,17 @@ class PythonParser(object):
         if byte == '-':
             if response.startswith('ERR '):
                 response = response[4:]
+                if response.startswith('unknown command'):
+                    return UnknownCommandError(response)
                 return ResponseError(response)
             if response.startswith('LOADING '):
                 # If we're loading the dataset into memory, kill the socket
                 # so we re-initialize (and re-SELECT) next time.
                 raise ConnectionError("Redis is loading data into memory")
+            if response.startswith('NOSCRIPT '):
+                return NoScriptError(response[9:])
+            # other error codes, such as WRONGTYPE, are kept in the message
+            return ResponseError(response)
         # single value
         elif byte == '+':
             return response
@@ -99,13 +152,15 @@ class PythonParser(object):
             if length == -1:
                 return None
             response = self.read(length)
-            return response.decode()
+            if raw:
+                return response
+            return response.decode(self.encoding, self.encoding_errors)
         # multi-bulk response
         elif byte == '*':
             length = int(response)
             if length == -1:
                 return None
-            return [self.read_response() for i in range(length)]
+            return [self.read_response(raw) for i in range(length)]
         raise InvalidResponse("Protocol Error")
 
 class HiredisParser(object):
@@ -125,15 +180,30 @@ class HiredisParser(object):
         self._reader = hiredis.Reader(
             protocolError=InvalidResponse,
             replyError=ResponseError)
+        self._next_response = False
+        self.encoding = connection.encoding
+        self.encoding_errors = connection.encoding_errors
 
     def on_disconnect(self):
         self._sock = None
         self._reader = None
+        self._next_response = False
 
-    def read_response(self):
+    def can_read(self):
+        "Returns True if a complete reply was already read from the socket"
+        if not self._reader:
+            return False
+        if self._next_response is False:
+            self._next_response = self._reader.gets()
+        return self._next_response is not False
+
+    def read_response(self, raw=False):
         if not self._reader:
             raise ConnectionError("Socket closed on remote end")
-        response = self._reader.gets()
+        if self._next_response is not False:
+            response, self._next_response = self._next_response, False
+        else:
+            response = self._reader.gets()
         while response is False:
             try:
                 buffer = self._sock.recv(4096)
@@ -145,10 +215,18 @@ class HiredisParser(object):
             self._reader.feed(buffer)
             # proactively, but not conclusively, check if more data is in the
             # buffer. if the data received doesn't end with \n, there's more.
-            if not buffer.endswith('\n'):
+            if not buffer.endswith(b'\n'):
                 continue
             response = self._reader.gets()
-        return response
+        if isinstance(response, ResponseError):
+            message = str(response)
+            if message.startswith('NOSCRIPT '):
+                return NoScriptError(message[9:])
+            if message.startswith('ERR unknown command'):
+                return UnknownCommandError(message[4:])
+        if raw:
+            return response
+        return decode_response(response, self.encoding, self.encoding_errors)
 
 if hiredis_available:
     DefaultParser = HiredisParser
@@ -239,7 +317,7 @@ class Connection(object):
         if not self._sock:
             self.connect()
         try:
-            self._sock.sendall(command.encode())
+            self._sock.sendall(command)
         except socket.error as e:
             self.disconnect()
             if len(e.args) == 1:
@@ -256,28 +334,80 @@ class Connection(object):
         "Pack and send a command to the Redis server"
         self.send_packed_command(self.pack_command(*args))
 
-    def read_response(self):
-        "Read the response from a previously sent command"
+    def can_read(self, timeout=0):
+        """
+        Returns True if a reply can be read within ``timeout`` seconds, or
+        without blocking if ``timeout`` is 0. Waits forever if ``timeout``
+        is None.
+        """
+        if not self._sock:
+            self.connect()
+        if self._parser.can_read():
+            return True
+        with selectors.DefaultSelector() as selector:
+            selector.register(self._sock, selectors.EVENT_READ)
+            return bool(selector.select(timeout))
+
+    def read_response(self, raw=False):
+        """
+        Read the response from a previously sent command. If ``raw`` is True,
+        bulk replies are returned as bytes rather than decoded to strings.
+        """
         try:
-            response = self._parser.read_response()
+            response = self._parser.read_response(raw)
         except:
             self.disconnect()
             raise
-        if response.__class__ == ResponseError:
+        if isinstance(response, ResponseError):
             raise response
         return response
 
     def encode(self, value):
         "Return a bytestring representation of the value"
         if isinstance(value, bytes):
-            return value.decode()
-        return str(value)
+            return value
+        if not isinstance(value, str):
+            value = str(value)
+        return value.encode(self.encoding, self.encoding_errors)
 
     def pack_command(self, *args):
         "Pack a series of arguments into a value Redis command"
-        command = ['$%s\r\n%s\r\n' % (len(enc_value.encode()), enc_value)
+        command = [b'$%d\r\n%s\r\n' % (len(enc_value), enc_value)
                    for enc_value in map(self.encode, args)]
-        return '*%s\r\n%s' % (len(command), ''.join(command))
+        return b'*%d\r\n%s' % (len(command), b''.join(command))
+
+    def encode_column(self, values):
+        """
+        Return a list of the bytestring representations of the items of
+        ``values``. Columns of only numbers, such as an ``array('d')`` or a
+        NumPy array, or of only strings are converted at once rather than
+        item by item.
+        """
+        if hasattr(values, 'tolist'):
+            values = values.tolist()
+        elif not isinstance(values, list):
+            values = list(values)
+        types = set(map(type, values))
+        if types <= NUMBER_TYPES:
+            return ((b' %r' * len(values)) % tuple(values)).split()
+        if types == STR_TYPES:
+            encoding, errors = self.encoding, self.encoding_errors
+            return [value.encode(encoding, errors) for value in values]
+        if types == BYTES_TYPES:
+            return values
+        return list(map(self.encode, values))
+
+    def pack_pairs(self, prefix, firsts, seconds):
+        """
+        Pack a command of the arguments in the ``prefix`` list followed by
+        the pairs of the encoded ``firsts`` and ``seconds`` interleaved
+        """
+        head = [b'$%d\r\n%s\r\n' % (len(enc_value), enc_value)
+                for enc_value in map(self.encode, prefix)]
+        body = (PAIR_FORMAT * len(firsts)) % tuple(chain.from_iterable(
+            zip(map(len, firsts), firsts, map(len, seconds), seconds)))
+        return b'*%d\r\n%s%s' % (len(head) + 2 * len(firsts),
+                                  b''.join(head), body)
 
 class UnixDomainSocketConnection(Connection):
     def __init__(self, path='', db=0, password=None,
@@ -314,6 +444,10 @@ class UnixDomainSocketConnection(Connection):
 # TODO: add ability to block waiting on a connection to be released
 class ConnectionPool(object):
     "Generic connection pool"
+    # pools choosing connections by the keys of the commands set this, so
+    # that clients find the keys passed to get_connection
+    routes_by_key = False
+
     def __init__(self, connection_class=Connection, max_connections=None,
                  **connection_kwargs):
         self.pid = os.getpid()
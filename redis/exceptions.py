@@ -12,15 +12,30 @@ class ConnectionError(RedisError):
 class ResponseError(RedisError):
     pass
 
+class NoScriptError(ResponseError):
+    pass
+
+class UnknownCommandError(ResponseError):
+    "Raised when the server doesn't know a command"
+    pass
+
 class InvalidResponse(RedisError):
     pass
 
 class DataError(RedisError):
     pass
 
+class DecompressionError(DataError):
+    "Raised when a value read can't be decompressed by a CompressionCodec"
+    pass
+
 class PubSubError(RedisError):
     pass
 
 class WatchError(RedisError):
     pass
 
+
+class LockError(RedisError):
+    "Errors thrown from the Lock"
+    pass
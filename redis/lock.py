@@ -0,0 +1,702 @@
+from __future__ import with_statement
+import math
+import threading
+import time
+import uuid
+from redis import scripts
+from redis.exceptions import LockError
+
+
+class LocalQueue(object):
+    """
+    The process local state shared by the TokenLocks of a name. Threads
+    queue on ``mutex`` and only its holder talks to Redis. While the lock is
+    held, ``token`` is the Redis lock's token and ``acquired_until`` the time
+    the lease ends at, or None if it never expires.
+    """
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.users = 0
+        self.waiters = 0
+        self.token = None
+        self.acquired_until = None
+        self.renewal = None
+        self.handoffs = 0
+
+
+_local_queues = {}
+_local_queues_lock = threading.Lock()
+
+
+def get_local_queue(connection_pool, name):
+    "Return the LocalQueue of lock ``name``, counting the caller as a user"
+    key = (id(connection_pool), name)
+    with _local_queues_lock:
+        queue = _local_queues.get(key)
+        if queue is None:
+            queue = _local_queues[key] = LocalQueue()
+        queue.users += 1
+        return queue
+
+
+def put_local_queue(connection_pool, name):
+    "Stop using the LocalQueue of lock ``name``, dropping it once unused"
+    key = (id(connection_pool), name)
+    with _local_queues_lock:
+        queue = _local_queues[key]
+        queue.users -= 1
+        if not queue.users:
+            del _local_queues[key]
+
+
+class SignalWaiter(object):
+    """
+    Base class of the primitives whose waiters block on a signal list that
+    is pushed to when they're released, or sleep between attempts to
+    acquire them if ``notify`` is False.
+    """
+    def stop_trying_at(self, blocking_timeout):
+        "Return the time to give up acquiring at, or None to never give up"
+        if blocking_timeout is None:
+            blocking_timeout = self.blocking_timeout
+        if blocking_timeout is None:
+            return None
+        return time.time() + blocking_timeout
+
+    def wait(self, signal, stop_trying_at, poll=False):
+        """
+        Block until ``signal`` is pushed to, or it's time to retry. Returns
+        False without waiting if ``stop_trying_at`` has passed.
+
+        ``poll`` sleeps ``sleep`` seconds instead of taking the signal, left
+        for another waiter.
+        """
+        notify = self.notify and not poll
+        wait = notify and self.notify_timeout or self.sleep
+        if stop_trying_at is not None:
+            remaining = stop_trying_at - time.time()
+            if remaining <= 0:
+                return False
+            wait = min(wait, remaining)
+        if notify:
+            # BLPOP timeouts are whole seconds, and 0 blocks forever
+            self.redis.execute_raw_command(
+                'BLPOP', signal, max(1, int(math.ceil(wait))))
+        else:
+            time.sleep(wait)
+        return True
+
+    def retry(self, try_acquire, signal, blocking, blocking_timeout):
+        """
+        Call ``try_acquire`` until it returns True, waiting for ``signal``
+        in between. Returns False if ``blocking`` is False or
+        ``blocking_timeout`` elapsed first.
+        """
+        stop_trying_at = self.stop_trying_at(blocking_timeout)
+        while 1:
+            if try_acquire():
+                return True
+            if not blocking or not self.wait(signal, stop_trying_at):
+                return False
+
+    @property
+    def signal_ttl(self):
+        "The time in milliseconds signals are kept for when no one waits"
+        return int(self.notify_timeout * 1000)
+
+
+class TokenLock(SignalWaiter):
+    """
+    A shared, distributed Lock identified by a unique token. The lock key
+    holds the token of its owner and expires on the server, so locks don't
+    depend on the clocks of the clients, and only the owner can release or
+    extend it.
+
+    Acquiring a free lock takes a single SET NX PX command. Releasing it is
+    an atomic compare-and-delete, a lock that expired and was acquired by
+    another client is never deleted.
+
+    Clients waiting for the lock block on a signal list, named after the
+    lock with a ':signal' suffix, that is pushed to when the lock is
+    released. One waiter is woken per release, as soon as it happens.
+
+    With ``local`` locking, threads of the same process contending for a
+    lock queue on a process local mutex first, and only the thread at the
+    head of the queue talks to Redis. When ``handoff`` is enabled, a thread
+    releasing the lock while others wait passes the Redis lock on to the
+    next one without a round trip, for as long as at least half of the
+    lease remains. Locks without a timeout are handed off at most
+    ``max_handoffs`` times in a row, so that other processes get a turn.
+
+    A TokenLock instance shouldn't be shared by multiple threads, create a
+    lock per thread instead.
+    """
+
+    def __init__(self, redis, name, timeout=None, sleep=0.1,
+                 blocking_timeout=None, auto_renewal=False, notify=True,
+                 notify_timeout=1, local=False, handoff=True,
+                 max_handoffs=100):
+        """
+        Create a new TokenLock instance named ``name`` using the Redis client
+        supplied by ``redis``.
+
+        ``timeout`` indicates a maximum life for the lock in seconds, with
+        millisecond precision. By default, it will remain locked until
+        release() is called.
+
+        ``sleep`` indicates the amount of time to sleep per loop iteration
+        when the lock is in blocking mode and another client is currently
+        holding the lock, if ``notify`` is False.
+
+        If ``notify`` is True, waiters block until the lock is released
+        instead of sleeping. They retry at least every ``notify_timeout``
+        seconds, so a lock whose owner crashed is acquired soon after it
+        expires. Blocking times are rounded up to whole seconds, the
+        resolution of BLPOP timeouts.
+
+        ``blocking_timeout`` indicates the maximum amount of time in seconds
+        to spend trying to acquire the lock. By default, acquire() blocks
+        until the lock is acquired.
+
+        If ``auto_renewal`` is True, a background thread extends the lock's
+        ``timeout`` every third of it for as long as the lock is held, so
+        long critical sections keep the lock while a crashed owner's lock
+        still expires.
+
+        If ``local`` is True, threads of this process contending for the
+        lock queue locally, and with ``handoff`` pass the acquired lock on
+        to each other, as described above.
+        """
+        self.redis = redis
+        self.name = name
+        self.timeout = timeout
+        self.sleep = sleep
+        self.blocking_timeout = blocking_timeout
+        self.auto_renewal = auto_renewal
+        self.notify = notify
+        self.notify_timeout = notify_timeout
+        self.signal = '%s:signal' % name
+        self.local = local
+        self.handoff = handoff
+        self.max_handoffs = max_handoffs
+        self.token = None
+        self.local_queue = None
+        self._renewal = None
+        if timeout is not None and sleep > timeout:
+            raise LockError("'sleep' must be less than 'timeout'")
+        if auto_renewal and timeout is None:
+            raise LockError("'auto_renewal' requires a 'timeout'")
+
+    def __enter__(self):
+        if self.acquire():
+            return self
+        raise LockError("Unable to acquire lock within the time specified")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def acquire(self, blocking=True, blocking_timeout=None):
+        """
+        Use Redis to hold a shared, distributed lock named ``name``.
+        Returns True once the lock is acquired.
+
+        If ``blocking`` is False, always return immediately. If the lock
+        was acquired, return True, otherwise return False.
+
+        ``blocking_timeout`` overrides the lock's maximum amount of time to
+        spend trying to acquire the lock, returning False once it's elapsed.
+        """
+        if self.token is not None:
+            raise LockError("Cannot acquire an already acquired lock")
+        stop_trying_at = self.stop_trying_at(blocking_timeout)
+        if not self.local:
+            return self._acquire(blocking, stop_trying_at)
+        pool = self.redis.connection_pool
+        queue = get_local_queue(pool, self.name)
+        try:
+            if not self._acquire_local(queue, blocking, stop_trying_at):
+                put_local_queue(pool, self.name)
+                return False
+        except:
+            put_local_queue(pool, self.name)
+            raise
+        self.local_queue = queue
+        return True
+
+    def _acquire_local(self, queue, blocking, stop_trying_at):
+        "Wait for the head of the local ``queue``, then for the Redis lock"
+        with _local_queues_lock:
+            queue.waiters += 1
+        if not blocking:
+            acquired = queue.mutex.acquire(False)
+        elif stop_trying_at is None:
+            acquired = queue.mutex.acquire()
+        else:
+            acquired = queue.mutex.acquire(
+                True, max(0, stop_trying_at - time.time()))
+        with _local_queues_lock:
+            queue.waiters -= 1
+            if not acquired:
+                # the lock may have been handed over as the wait timed out
+                acquired = queue.mutex.acquire(False)
+        if not acquired:
+            return False
+        if queue.token is not None:
+            # the previous local owner handed the Redis lock over
+            self.token = queue.token
+            self._renewal = queue.renewal
+            return True
+        try:
+            acquired = self._acquire(blocking, stop_trying_at, queue)
+        except:
+            queue.mutex.release()
+            raise
+        if not acquired:
+            queue.mutex.release()
+        return acquired
+
+    def _acquire(self, blocking, stop_trying_at, queue=None):
+        """
+        Acquire the Redis lock, giving up at ``stop_trying_at``. The lease
+        is recorded on the local ``queue`` if specified.
+        """
+        token = uuid.uuid4().hex
+        while 1:
+            start = time.time()
+            if self.do_acquire(token):
+                self.token = token
+                if queue is not None:
+                    queue.token = token
+                    queue.handoffs = 0
+                    queue.acquired_until = None
+                    if self.timeout is not None:
+                        queue.acquired_until = start + self.timeout
+                if self.auto_renewal:
+                    self._start_renewal()
+                return True
+            if not blocking or not self.wait(self.signal, stop_trying_at):
+                return False
+
+    def do_acquire(self, token):
+        "Try to set the lock key to ``token`` once, returning True on success"
+        args = ['SET', self.name, token, 'NX']
+        if self.timeout is not None:
+            args.extend(('PX', int(self.timeout * 1000)))
+        return self.redis.execute_raw_command(*args)
+
+    def release(self):
+        "Releases the already acquired lock"
+        if self.token is None:
+            raise ValueError("Cannot release an unlocked lock")
+        queue = self.local_queue
+        if queue is not None:
+            self.local_queue = None
+            try:
+                self._release_local(queue)
+            finally:
+                put_local_queue(self.redis.connection_pool, self.name)
+            return
+        self._release()
+
+    def _release_local(self, queue):
+        "Hand the lock over to the next local waiter, or release it"
+        with _local_queues_lock:
+            # waiters only give up while holding _local_queues_lock, so one
+            # of them is guaranteed to take the lock handed over
+            if self.handoff and queue.waiters and self._lease_valid(queue):
+                queue.handoffs += 1
+                queue.renewal = self._renewal
+                self._renewal = None
+                self.token = None
+                queue.mutex.release()
+                return
+        try:
+            queue.token = None
+            queue.renewal = None
+            self._release()
+        finally:
+            queue.mutex.release()
+
+    def _lease_valid(self, queue):
+        "Returns True if the lock held by ``queue`` can be handed over"
+        if queue.acquired_until is None:
+            return queue.handoffs < self.max_handoffs
+        if self._renewal is not None:
+            # renewed leases are extended to the timeout every third of it
+            return queue.handoffs < self.max_handoffs
+        remaining = queue.acquired_until - time.time()
+        return remaining > self.timeout / 2.0
+
+    def _release(self):
+        "Release the Redis lock"
+        self._stop_renewal()
+        token = self.token
+        self.token = None
+        if self.notify:
+            released = self.redis.get_script(scripts.RELEASE_LOCK)(
+                [self.name, self.signal], [token, self.signal_ttl])
+        else:
+            released = self.redis.compare_and_delete(self.name, token)
+        if not released:
+            raise LockError("Cannot release a lock that's no longer owned")
+
+    def extend(self, timeout=None):
+        """
+        Reset the time the lock expires in to ``timeout`` seconds, the lock's
+        own timeout by default. Raises a LockError if the lock is no longer
+        owned.
+        """
+        if self.token is None:
+            raise LockError("Cannot extend an unlocked lock")
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is None:
+            raise LockError("Cannot extend a lock with no timeout")
+        if not self.redis.get_script(scripts.RENEW_LOCK)(
+                [self.name], [self.token, int(timeout * 1000)]):
+            raise LockError("Cannot extend a lock that's no longer owned")
+        if self.local_queue is not None:
+            self.local_queue.acquired_until = time.time() + timeout
+        return True
+
+    def locked(self):
+        "Returns True if the lock is held by any client"
+        return self.redis.execute_raw_command('GET', self.name) is not None
+
+    def owned(self):
+        "Returns True if the lock is still held by this lock instance"
+        return self.token is not None and \
+            self.redis.execute_raw_command('GET', self.name) == self.token
+
+    def _start_renewal(self):
+        self._renewal = threading.Event()
+        thread = threading.Thread(target=self._renew,
+                                  args=(self._renewal, self.token))
+        thread.daemon = True
+        thread.start()
+
+    def _stop_renewal(self):
+        if self._renewal is not None:
+            self._renewal.set()
+            self._renewal = None
+
+    def _renew(self, stopped, token):
+        "Extend the lock every third of its timeout until it's released"
+        renew = self.redis.get_script(scripts.RENEW_LOCK)
+        ttl = int(self.timeout * 1000)
+        while not stopped.wait(self.timeout / 3.0):
+            try:
+                if not renew([self.name], [token, ttl]):
+                    # the lock expired and may be held by another client
+                    return
+            except Exception:
+                # retry on the next interval, the lock is still valid for
+                # at least another third of its timeout
+                continue
+
+
+class Semaphore(SignalWaiter):
+    """
+    A distributed counting semaphore, held by at most ``limit`` clients at
+    once. Holders are kept in a sorted set, scored by the server time their
+    lease ends at, so the slots of crashed holders are reclaimed once their
+    ``timeout`` expires regardless of the clocks of the clients.
+
+    Acquiring a free slot and releasing it take a single round trip each.
+    Clients waiting for a slot block on a signal list, named after the
+    semaphore with a ':signal' suffix, pushed to when a slot is released.
+
+    Slots are granted in the order clients started waiting: each waiter
+    takes a ticket from a counter, and waits in line in a sorted set named
+    after the semaphore with a ':queue' suffix, scored by its ticket. A
+    client gets a slot only if fewer waiters are ahead of it than there are
+    free slots, so clients acquiring without blocking don't jump the line.
+    Waiters that crash are dropped from the line once they stop retrying,
+    the ':queue:leases' sorted set tracks when each waiter last did. As the
+    signal wakes any waiter, one woken out of turn passes it on and polls
+    every ``sleep`` seconds until the waiters ahead are served.
+
+    Each Semaphore instance holds at most one slot, create one per thread.
+    """
+
+    def __init__(self, redis, name, limit, timeout=None, sleep=0.1,
+                 blocking_timeout=None, notify=True, notify_timeout=1):
+        """
+        Create a new Semaphore instance named ``name``, held by at most
+        ``limit`` clients at once, using the Redis client supplied by
+        ``redis``.
+
+        ``timeout`` indicates a maximum life in seconds for each slot. By
+        default, slots are held until release() is called.
+
+        ``sleep``, ``blocking_timeout``, ``notify`` and ``notify_timeout``
+        control how acquire() waits for a slot, as for the TokenLock.
+        """
+        self.redis = redis
+        self.name = name
+        self.limit = limit
+        self.timeout = timeout
+        self.sleep = sleep
+        self.blocking_timeout = blocking_timeout
+        self.notify = notify
+        self.notify_timeout = notify_timeout
+        self.signal = '%s:signal' % name
+        self.keys = [name, '%s:queue' % name, '%s:queue:leases' % name,
+                     '%s:tickets' % name, self.signal]
+        self.token = None
+
+    def __enter__(self):
+        if self.acquire():
+            return self
+        raise LockError("Unable to acquire semaphore within the time "
+                        "specified")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def acquire(self, blocking=True, blocking_timeout=None):
+        """
+        Hold one of the semaphore's slots. Returns True once it's acquired.
+
+        If ``blocking`` is False, always return immediately. If a slot was
+        acquired, return True, otherwise return False.
+
+        ``blocking_timeout`` overrides the maximum amount of time to spend
+        trying to acquire a slot, returning False once it's elapsed.
+        """
+        if self.token is not None:
+            raise LockError("Cannot acquire an already acquired semaphore")
+        token = uuid.uuid4().hex
+        script = self.redis.get_script(scripts.ACQUIRE_SEMAPHORE)
+        timeout = self.timeout is not None and int(self.timeout * 1000) or ''
+        args = [self.limit, token, timeout, blocking and 1 or '',
+                self.waiter_ttl, self.signal_ttl]
+        stop_trying_at = self.stop_trying_at(blocking_timeout)
+        acquired = False
+        try:
+            while 1:
+                state = script(self.keys, args)
+                if state == 1:
+                    acquired = True
+                    break
+                # with slots free for waiters ahead, leave them the signal
+                if not blocking or not self.wait(self.signal, stop_trying_at,
+                                                 poll=state == -1):
+                    break
+        finally:
+            if blocking and not acquired:
+                self.redis.get_script(scripts.LEAVE_SEMAPHORE_LINE)(
+                    self.keys, [self.limit, token, self.signal_ttl])
+        if acquired:
+            self.token = token
+        return acquired
+
+    @property
+    def waiter_ttl(self):
+        """
+        The time in milliseconds a waiter keeps its place in line for
+        without retrying
+        """
+        retry = self.notify and max(1, math.ceil(self.notify_timeout)) or 0
+        return int(max(retry, self.sleep) * 3000) + 1000
+
+    def release(self):
+        "Releases the slot held by this instance"
+        if self.token is None:
+            raise ValueError("Cannot release an unlocked semaphore")
+        token = self.token
+        self.token = None
+        if not self.redis.get_script(scripts.RELEASE_SEMAPHORE)(
+                [self.name, self.signal], [token, self.signal_ttl]):
+            raise LockError("Cannot release a semaphore slot that's no "
+                            "longer owned")
+
+    def extend(self, timeout=None):
+        """
+        Reset the time the slot held expires in to ``timeout`` seconds, the
+        semaphore's own timeout by default. Raises a LockError if the slot
+        is no longer held.
+        """
+        if self.token is None:
+            raise LockError("Cannot extend an unlocked semaphore")
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is None:
+            raise LockError("Cannot extend a semaphore with no timeout")
+        if not self.redis.get_script(scripts.RENEW_SEMAPHORE)(
+                [self.name], [self.token, int(timeout * 1000)]):
+            raise LockError("Cannot extend a semaphore slot that's no "
+                            "longer owned")
+        return True
+
+
+class ReadWriteLock(object):
+    """
+    A distributed lock held either by any number of readers, or by a single
+    writer. Writers are preferred: once a writer waits for the lock, new
+    readers wait until it's done.
+
+    The ``read_lock`` and ``write_lock`` attributes are the two sides of
+    the lock, used like a TokenLock:
+
+        >>> rw = ReadWriteLock(r, 'document')
+        >>> with rw.read_lock:
+        ...     r.get('document')
+
+    Acquiring a free lock and releasing it take a single round trip each.
+    Waiting readers and writers block on separate signal lists. A
+    ReadWriteLock instance shouldn't be shared by multiple threads, create
+    a lock per thread instead.
+    """
+
+    def __init__(self, redis, name, timeout=None, sleep=0.1,
+                 blocking_timeout=None, notify=True, notify_timeout=1):
+        """
+        Create a new ReadWriteLock instance named ``name`` using the Redis
+        client supplied by ``redis``.
+
+        ``timeout`` indicates a maximum life in seconds for each reader's
+        and writer's hold of the lock. By default, the lock is held until
+        release() is called.
+
+        ``sleep``, ``blocking_timeout``, ``notify`` and ``notify_timeout``
+        control how acquire() waits for the lock, as for the TokenLock.
+        """
+        self.redis = redis
+        self.name = name
+        self.timeout = timeout
+        self.sleep = sleep
+        self.blocking_timeout = blocking_timeout
+        self.notify = notify
+        self.notify_timeout = notify_timeout
+        self.readers = '%s:readers' % name
+        self.waiting_writer = '%s:writer' % name
+        self.read_signal = '%s:signal:read' % name
+        self.write_signal = '%s:signal:write' % name
+        self.read_lock = ReadLock(self)
+        self.write_lock = WriteLock(self)
+
+
+class ReadLock(SignalWaiter):
+    "The readers' side of a ReadWriteLock"
+
+    def __init__(self, rwlock):
+        self.rwlock = rwlock
+        self.token = None
+
+    def __getattr__(self, attr):
+        # settings are read from the ReadWriteLock
+        return getattr(self.rwlock, attr)
+
+    def __enter__(self):
+        if self.acquire():
+            return self
+        raise LockError("Unable to acquire lock within the time specified")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def acquire(self, blocking=True, blocking_timeout=None):
+        """
+        Hold the lock with other readers, once no writer holds or waits for
+        it. Returns True once the lock is acquired.
+
+        If ``blocking`` is False, always return immediately. If the lock
+        was acquired, return True, otherwise return False.
+
+        ``blocking_timeout`` overrides the maximum amount of time to spend
+        trying to acquire the lock, returning False once it's elapsed.
+        """
+        if self.token is not None:
+            raise LockError("Cannot acquire an already acquired lock")
+        rw = self.rwlock
+        token = uuid.uuid4().hex
+        script = rw.redis.get_script(scripts.ACQUIRE_READ_LOCK)
+        timeout = rw.timeout is not None and int(rw.timeout * 1000) or ''
+        def try_acquire():
+            return script(
+                [rw.name, rw.readers, rw.waiting_writer, rw.read_signal],
+                [token, timeout, self.signal_ttl])
+        if not self.retry(try_acquire, rw.read_signal, blocking,
+                          blocking_timeout):
+            return False
+        self.token = token
+        return True
+
+    def release(self):
+        "Releases the already acquired lock"
+        if self.token is None:
+            raise ValueError("Cannot release an unlocked lock")
+        rw = self.rwlock
+        token = self.token
+        self.token = None
+        if not rw.redis.get_script(scripts.RELEASE_READ_LOCK)(
+                [rw.readers, rw.write_signal], [token, self.signal_ttl]):
+            raise LockError("Cannot release a lock that's no longer owned")
+
+
+class WriteLock(SignalWaiter):
+    "The writer's side of a ReadWriteLock"
+
+    def __init__(self, rwlock):
+        self.rwlock = rwlock
+        self.token = None
+
+    def __getattr__(self, attr):
+        # settings are read from the ReadWriteLock
+        return getattr(self.rwlock, attr)
+
+    def __enter__(self):
+        if self.acquire():
+            return self
+        raise LockError("Unable to acquire lock within the time specified")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def acquire(self, blocking=True, blocking_timeout=None):
+        """
+        Hold the lock exclusively, once all readers released it. While
+        waiting, new readers are held off. Returns True once the lock is
+        acquired.
+
+        If ``blocking`` is False, always return immediately. If the lock
+        was acquired, return True, otherwise return False.
+
+        ``blocking_timeout`` overrides the maximum amount of time to spend
+        trying to acquire the lock, returning False once it's elapsed.
+        """
+        if self.token is not None:
+            raise LockError("Cannot acquire an already acquired lock")
+        rw = self.rwlock
+        token = uuid.uuid4().hex
+        script = rw.redis.get_script(scripts.ACQUIRE_WRITE_LOCK)
+        timeout = rw.timeout is not None and int(rw.timeout * 1000) or ''
+        # hold readers off until the next retry, if there's one
+        hold_off = ''
+        if blocking:
+            hold_off = int(2 * 1000 * (
+                rw.notify and rw.notify_timeout or rw.sleep)) + 1000
+        def try_acquire():
+            return script([rw.name, rw.readers, rw.waiting_writer],
+                          [token, timeout, hold_off])
+        if not self.retry(try_acquire, rw.write_signal, blocking,
+                          blocking_timeout):
+            if blocking:
+                # stop holding readers off
+                rw.redis.compare_and_delete(rw.waiting_writer, token)
+            return False
+        self.token = token
+        return True
+
+    def release(self):
+        "Releases the already acquired lock"
+        if self.token is None:
+            raise ValueError("Cannot release an unlocked lock")
+        rw = self.rwlock
+        token = self.token
+        self.token = None
+        if not rw.redis.get_script(scripts.RELEASE_WRITE_LOCK)(
+                [rw.name, rw.read_signal, rw.write_signal],
+                [token, self.signal_ttl]):
+            raise LockError("Cannot release a lock that's no longer owned")
@@ -0,0 +1,714 @@
+from __future__ import with_statement
+import os
+import socket
+import threading
+import time
+from queue import Empty, Full, Queue
+from redis.connection import decode_response
+from redis.exceptions import ConnectionError, PubSubError, RedisError
+
+RAW_MESSAGE_TYPES = (b'message', b'pmessage')
+
+
+class Message(object):
+    """
+    A compact alternative to message dicts. The payload is kept as the
+    bytes read in ``raw_data``, and decoded with ``encoding`` when the
+    ``data`` attribute is first accessed. Messages can also be indexed like
+    dicts, by 'type', 'pattern', 'channel' or 'data'.
+    """
+    __slots__ = ('type', 'pattern', 'channel', 'raw_data', 'encoding',
+                 'errors', '_data')
+    keys = ('type', 'pattern', 'channel', 'data')
+
+    def __init__(self, type, pattern, channel, raw_data, encoding='utf-8',
+                 errors='strict'):
+        self.type = type
+        self.pattern = pattern
+        self.channel = channel
+        self.raw_data = raw_data
+        self.encoding = encoding
+        self.errors = errors
+        self._data = None
+
+    def __repr__(self):
+        return '<Message type=%r pattern=%r channel=%r data=%r>' % (
+            self.type, self.pattern, self.channel, self.raw_data)
+
+    def __getitem__(self, key):
+        if key not in self.keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __eq__(self, other):
+        if isinstance(other, Message):
+            other = other.as_dict()
+        return self.as_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        # over the fields compared by __eq__, so equal messages hash alike
+        return hash((self.type, self.pattern, self.channel, self.data))
+
+    @property
+    def data(self):
+        "The payload, decoded on first access"
+        if self._data is None:
+            self._data = self.raw_data.decode(self.encoding, self.errors)
+        return self._data
+
+    def as_dict(self):
+        "Returns the message as a dict"
+        return dict((key, getattr(self, key)) for key in self.keys)
+
+
+def parse_raw_response(response, encoding='utf-8', errors='strict'):
+    """
+    Return the Message of a publish/subscribe ``response`` read with bulk
+    replies as bytes, or the response decoded if it's not a message. Only
+    the type, channel and pattern of messages are decoded.
+    """
+    if response[0] not in RAW_MESSAGE_TYPES:
+        return decode_response(response, encoding, errors)
+    if response[0] == b'pmessage':
+        return Message('pmessage', response[1].decode(encoding, errors),
+                       response[2].decode(encoding, errors), response[3],
+                       encoding, errors)
+    return Message('message', None, response[1].decode(encoding, errors),
+                   response[2], encoding, errors)
+
+
+def to_message(response):
+    "Return the message dict of a publish/subscribe ``response``"
+    if response[0] == 'pmessage':
+        return {
+            'type': response[0],
+            'pattern': response[1],
+            'channel': response[2],
+            'data': response[3]
+        }
+    return {
+        'type': response[0],
+        'pattern': None,
+        'channel': response[1],
+        'data': response[2]
+    }
+
+
+class HandlerStats(object):
+    """
+    Statistics of the messages dispatched to a handler. Latencies are
+    measured from the time a message is read to the time its handler
+    returns, and so include the time spent waiting in the worker's queue.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.errors = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.total_time = 0.0
+
+    def __repr__(self):
+        return '<HandlerStats messages=%d errors=%d queued=%d ' \
+            'mean_latency=%.6f max_latency=%.6f>' % (
+                self.messages, self.errors, self.queued, self.mean_latency,
+                self.max_latency)
+
+    @property
+    def mean_latency(self):
+        "The mean time between reading a message and handling it"
+        return self.messages and self.total_latency / self.messages or 0.0
+
+    @property
+    def mean_time(self):
+        "The mean time spent in the handler per message"
+        return self.messages and self.total_time / self.messages or 0.0
+
+    def enqueued(self):
+        with self.lock:
+            self.queued += 1
+            if self.queued > self.max_queued:
+                self.max_queued = self.queued
+
+    def handled(self, received, started, error=False):
+        finished = time.time()
+        with self.lock:
+            self.queued -= 1
+            self.messages += 1
+            if error:
+                self.errors += 1
+            latency = finished - received
+            self.total_latency += latency
+            if latency > self.max_latency:
+                self.max_latency = latency
+            self.total_time += finished - started
+
+
+class PubSubWorkerPool(threading.Thread):
+    """
+    A daemon thread reading the messages of ``pubsub`` and dispatching them
+    to a pool of ``workers`` threads calling their handlers, so that slow
+    handlers don't hold up the messages of other channels.
+
+    ``handlers`` maps channel names, and ``pattern_handlers`` patterns, to
+    the functions called with each message published on them. Messages of
+    the same channel are always handled by the same worker, in the order
+    they were published.
+
+    Each worker has a queue of up to ``queue_size`` messages. When a queue
+    is full, the reader blocks until there's room, leaving messages in the
+    socket so the server buffers them instead.
+
+    Handlers raising an exception are counted as errors, and the exception
+    is passed to ``exception_handler`` along with the message if specified.
+    """
+    def __init__(self, pubsub, handlers=None, pattern_handlers=None,
+                 workers=4, queue_size=1000, exception_handler=None):
+        super(PubSubWorkerPool, self).__init__()
+        self.daemon = True
+        self.pubsub = pubsub
+        self.handlers = dict(handlers or {})
+        self.pattern_handlers = dict(pattern_handlers or {})
+        if not self.handlers and not self.pattern_handlers:
+            raise ValueError("No channel or pattern handlers specified")
+        self.exception_handler = exception_handler
+        self.channel_stats = dict(
+            (channel, HandlerStats()) for channel in self.handlers)
+        self.pattern_stats = dict(
+            (pattern, HandlerStats()) for pattern in self.pattern_handlers)
+        self.queues = [Queue(queue_size) for i in range(workers)]
+        self.workers = [
+            threading.Thread(target=self.work, args=(queue,))
+            for queue in self.queues]
+        for worker in self.workers:
+            worker.daemon = True
+        self._running = False
+
+    def start(self):
+        # subscribe before returning so no message published after start()
+        # is missed
+        if self.handlers:
+            self.pubsub.subscribe(list(self.handlers))
+        if self.pattern_handlers:
+            self.pubsub.psubscribe(list(self.pattern_handlers))
+        self._running = True
+        for worker in self.workers:
+            worker.start()
+        super(PubSubWorkerPool, self).start()
+
+    def run(self):
+        try:
+            self.dispatch(self.pubsub.listen())
+        except ConnectionError:
+            if self._running:
+                raise
+        finally:
+            # let the workers handle the messages queued, then exit
+            for queue in self.queues:
+                queue.put(None)
+
+    def dispatch(self, messages):
+        "Queue each of ``messages`` for the worker handling its channel"
+        queues = self.queues
+        for message in messages:
+            received = time.time()
+            if message['type'] == 'message':
+                handler = self.handlers.get(message['channel'])
+                stats = self.channel_stats.get(message['channel'])
+            elif message['type'] == 'pmessage':
+                handler = self.pattern_handlers.get(message['pattern'])
+                stats = self.pattern_stats.get(message['pattern'])
+            else:
+                continue
+            if handler is None:
+                continue
+            stats.enqueued()
+            queue = queues[hash(message['channel']) % len(queues)]
+            queue.put((handler, stats, message, received))
+
+    def work(self, queue):
+        "Call the handlers of the messages in ``queue`` until it's closed"
+        while 1:
+            item = queue.get()
+            if item is None:
+                return
+            handler, stats, message, received = item
+            started = time.time()
+            try:
+                handler(message)
+            except Exception as e:
+                stats.handled(received, started, error=True)
+                if self.exception_handler is not None:
+                    self.exception_handler(e, message)
+            else:
+                stats.handled(received, started)
+
+    def queue_depths(self):
+        "Returns the number of messages queued for each worker"
+        return [queue.qsize() for queue in self.queues]
+
+    def stop(self):
+        """
+        Stop reading messages and wait for the reader and the workers to
+        exit, once the workers handled the messages already queued.
+        """
+        self._running = False
+        connection = self.pubsub.connection
+        if connection is not None and connection._sock is not None:
+            # wake up the reader, which sees the socket as closed
+            connection._sock.shutdown(socket.SHUT_RDWR)
+        self.join()
+        for worker in self.workers:
+            worker.join()
+        self.pubsub.reset()
+
+
+_multiplexers = {}
+_multiplexers_lock = threading.Lock()
+
+
+def get_multiplexer(connection_pool):
+    "Return the process's PubSubMultiplexer of ``connection_pool``"
+    key = id(connection_pool)
+    with _multiplexers_lock:
+        multiplexer = _multiplexers.get(key)
+        if multiplexer is None or multiplexer.pid != os.getpid():
+            # threads don't survive a fork, the child needs its own
+            multiplexer = _multiplexers[key] = \
+                PubSubMultiplexer(connection_pool)
+        return multiplexer
+
+
+class PubSubMultiplexer(threading.Thread):
+    """
+    Shares a single subscription connection between any number of local
+    Subscribers. Channels and patterns are subscribed to on the server once,
+    by the first Subscriber subscribing to them, and unsubscribed from once
+    no Subscriber is subscribed to them anymore. A daemon thread reads the
+    messages and queues them for each Subscriber of their channel or pattern.
+
+    Use get_multiplexer(), or the subscriber() method of the client, to
+    share the multiplexer of a connection pool across the process.
+
+    If ``compact`` is True, messages are queued as Message objects instead
+    of dicts, their payloads decoded when first accessed.
+    """
+    def __init__(self, connection_pool, retry_interval=1, compact=False):
+        super(PubSubMultiplexer, self).__init__()
+        self.daemon = True
+        self.pid = os.getpid()
+        self.connection_pool = connection_pool
+        self.retry_interval = retry_interval
+        self.compact = compact
+        self.connection = None
+        self.channel_subscribers = {}
+        self.pattern_subscribers = {}
+        self.lock = threading.Lock()
+        self.confirmed = threading.Condition(self.lock)
+        # the number of subscription replies expected and received, used to
+        # wait for subscriptions to take effect
+        self.sent = 0
+        self.received = 0
+        self._running = False
+        self._closed = False
+
+    def subscriber(self, max_queued=0):
+        "Return a new Subscriber receiving messages through this multiplexer"
+        return Subscriber(self, max_queued)
+
+    def subscribe(self, subscriber, channels):
+        "Subscribe ``subscriber`` to ``channels``"
+        self._subscribe(subscriber, channels, self.channel_subscribers,
+                        'SUBSCRIBE')
+
+    def psubscribe(self, subscriber, patterns):
+        "Subscribe ``subscriber`` to the channels matching ``patterns``"
+        self._subscribe(subscriber, patterns, self.pattern_subscribers,
+                        'PSUBSCRIBE')
+
+    def unsubscribe(self, subscriber, channels):
+        "Unsubscribe ``subscriber`` from ``channels``"
+        self._unsubscribe(subscriber, channels, self.channel_subscribers,
+                          'UNSUBSCRIBE')
+
+    def punsubscribe(self, subscriber, patterns):
+        "Unsubscribe ``subscriber`` from the patterns ``patterns``"
+        self._unsubscribe(subscriber, patterns, self.pattern_subscribers,
+                          'PUNSUBSCRIBE')
+
+    def _subscribe(self, subscriber, names, subscribers, command):
+        with self.lock:
+            if self._closed:
+                # the reading thread can't be started again
+                raise PubSubError("Cannot subscribe through a closed "
+                                  "PubSubMultiplexer")
+            new = []
+            for name in names:
+                if name not in subscribers:
+                    subscribers[name] = set()
+                    new.append(name)
+                subscribers[name].add(subscriber)
+            if not new:
+                return
+            if not self._running:
+                self._start()
+            target = self._send(command, new)
+            # wait for the server to confirm the subscriptions, so messages
+            # published once this returns are received
+            while self.received < target and self._running:
+                self.confirmed.wait(1)
+
+    def _unsubscribe(self, subscriber, names, subscribers, command):
+        with self.lock:
+            removed = []
+            for name in names:
+                if subscriber not in subscribers.get(name, ()):
+                    continue
+                subscribers[name].remove(subscriber)
+                if not subscribers[name]:
+                    del subscribers[name]
+                    removed.append(name)
+            if removed and self._running:
+                self._send(command, removed)
+
+    def _send(self, command, names):
+        # called with the lock held. Returns the number of replies received
+        # once the server replied to this command
+        self.connection.send_command(command, *names)
+        self.sent += len(names)
+        return self.sent
+
+    def _start(self):
+        # called with the lock held
+        self.connection = self.connection_pool.get_connection('pubsub')
+        self.connection.connect()
+        self._running = True
+        self.start()
+
+    def run(self):
+        while self._running:
+            connection = self.connection
+            try:
+                response = connection.read_response(raw=self.compact)
+            except ConnectionError:
+                if not self._running:
+                    break
+                self.reconnect()
+                continue
+            if self.compact:
+                response = parse_raw_response(
+                    response, connection.encoding, connection.encoding_errors)
+            self.dispatch(response)
+
+    def dispatch(self, response):
+        "Queue the message of ``response`` for its Subscribers"
+        if isinstance(response, Message):
+            message = response
+        elif response[0] in ('message', 'pmessage'):
+            message = to_message(response)
+        else:
+            # a subscription reply
+            with self.lock:
+                self.received += 1
+                self.confirmed.notify_all()
+            return
+        if message['type'] == 'message':
+            key, subscribers = message['channel'], self.channel_subscribers
+        else:
+            key, subscribers = message['pattern'], self.pattern_subscribers
+        with self.lock:
+            subscribers = list(subscribers.get(key, ()))
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+    def reconnect(self):
+        "Reconnect, and subscribe again to all channels and patterns"
+        while self._running:
+            with self.lock:
+                self.connection.disconnect()
+                # replies to the commands sent won't come anymore
+                self.received = self.sent
+                self.confirmed.notify_all()
+                try:
+                    self.connection.connect()
+                    if self.channel_subscribers:
+                        self._send('SUBSCRIBE', list(self.channel_subscribers))
+                    if self.pattern_subscribers:
+                        self._send('PSUBSCRIBE',
+                                   list(self.pattern_subscribers))
+                    return
+                except ConnectionError:
+                    pass
+            time.sleep(self.retry_interval)
+
+    def close(self):
+        """
+        Stop reading messages and close the connection, dropping all the
+        subscriptions. A new multiplexer is created for the connection pool
+        by the next call to get_multiplexer(), subscribing through this one
+        raises a PubSubError.
+        """
+        with _multiplexers_lock:
+            if _multiplexers.get(id(self.connection_pool)) is self:
+                del _multiplexers[id(self.connection_pool)]
+        with self.lock:
+            running, self._running = self._running, False
+            self._closed = True
+            self.confirmed.notify_all()
+            connection = self.connection
+            if running and connection._sock is not None:
+                # wake up the reader, which sees the socket as closed
+                connection._sock.shutdown(socket.SHUT_RDWR)
+        if running:
+            self.join()
+            connection.disconnect()
+            self.connection_pool.release(connection)
+            self.connection = None
+
+
+class Subscriber(object):
+    """
+    A local subscriber to channels and patterns, receiving their messages
+    through a PubSubMultiplexer's shared connection. Messages are queued
+    until they're read with get_message() or listen(). If ``max_queued`` is
+    specified, messages arriving while that many are queued are dropped and
+    counted in the ``dropped`` attribute.
+    """
+    def __init__(self, multiplexer, max_queued=0):
+        self.multiplexer = multiplexer
+        self.channels = set()
+        self.patterns = set()
+        self.queue = Queue(max_queued)
+        self.dropped = 0
+
+    def partition(self, names):
+        "Return a list of (multiplexer, names) tuples subscribing to ``names``"
+        return [(self.multiplexer, names)]
+
+    def subscribe(self, channels):
+        "Subscribe to ``channels``"
+        if isinstance(channels, str):
+            channels = [channels]
+        self.channels.update(channels)
+        for multiplexer, names in self.partition(channels):
+            multiplexer.subscribe(self, names)
+
+    def psubscribe(self, patterns):
+        "Subscribe to all channels matching any pattern in ``patterns``"
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        self.patterns.update(patterns)
+        for multiplexer, names in self.partition(patterns):
+            multiplexer.psubscribe(self, names)
+
+    def unsubscribe(self, channels=[]):
+        """
+        Unsubscribe from ``channels``. If empty, unsubscribe from all
+        channels.
+        """
+        if isinstance(channels, str):
+            channels = [channels]
+        channels = set(channels or self.channels)
+        self.channels -= channels
+        for multiplexer, names in self.partition(channels):
+            multiplexer.unsubscribe(self, names)
+        self._stop_listening()
+
+    def punsubscribe(self, patterns=[]):
+        """
+        Unsubscribe from the patterns ``patterns``. If empty, unsubscribe
+        from all patterns.
+        """
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        patterns = set(patterns or self.patterns)
+        self.patterns -= patterns
+        for multiplexer, names in self.partition(patterns):
+            multiplexer.punsubscribe(self, names)
+        self._stop_listening()
+
+    def close(self):
+        "Unsubscribe from all channels and patterns"
+        self.unsubscribe()
+        self.punsubscribe()
+
+    def _stop_listening(self):
+        # once no subscription is left, wake up listen() waiting for a
+        # message so it returns. If the queue is full, listen() isn't waiting
+        if not self.channels and not self.patterns:
+            try:
+                self.queue.put_nowait(None)
+            except Full:
+                pass
+
+    def put(self, message):
+        "Queue ``message``, dropping it if the queue is full"
+        try:
+            self.queue.put_nowait(message)
+        except Full:
+            self.dropped += 1
+
+    def get_message(self, timeout=0):
+        """
+        Return the next message, or None if no message arrives within
+        ``timeout`` seconds. Returns immediately if ``timeout`` is 0, and
+        waits forever if it's None.
+        """
+        try:
+            if timeout == 0:
+                return self.queue.get_nowait()
+            return self.queue.get(True, timeout)
+        except Empty:
+            return None
+
+    def listen(self):
+        """
+        Listen for messages on the channels and patterns subscribed to,
+        until no subscription is left
+        """
+        while self.channels or self.patterns:
+            message = self.queue.get()
+            # None is queued when the last subscription is removed
+            if message is not None:
+                yield message
+
+
+class PartitionedSubscriber(Subscriber):
+    """
+    A Subscriber spreading its channels and patterns across ``partitions``
+    connections by hash, each read by a thread of its own, and merging their
+    messages into a single queue. The messages of a channel always arrive on
+    the same connection, in the order they were published.
+
+    Unlike the Subscribers of a shared PubSubMultiplexer, each partitioned
+    subscriber has connections of its own, which close() closes. If
+    ``compact`` is True, messages are Message objects instead of dicts.
+    """
+    def __init__(self, connection_pool, partitions=4, max_queued=0,
+                 compact=False):
+        super(PartitionedSubscriber, self).__init__(None, max_queued)
+        self.multiplexers = [
+            PubSubMultiplexer(connection_pool, compact=compact)
+            for i in range(partitions)]
+
+    def partition(self, names):
+        partitions = {}
+        for name in names:
+            index = hash(name) % len(self.multiplexers)
+            partitions.setdefault(index, []).append(name)
+        return [(self.multiplexers[index], partition)
+                for index, partition in partitions.items()]
+
+    def close(self):
+        """
+        Close the connections, dropping all the subscriptions. The
+        subscriber can't subscribe again afterwards.
+        """
+        self.channels.clear()
+        self.patterns.clear()
+        for multiplexer in self.multiplexers:
+            multiplexer.close()
+        self._stop_listening()
+
+
+class BufferedPublisher(threading.Thread):
+    """
+    Buffers published messages and publishes them with publish_many() in
+    batches of up to ``max_messages``, pipelined in a single round trip.
+    A batch is sent by the thread publishing its last message once it's
+    full, or by a daemon thread ``max_delay`` seconds after its first
+    message was buffered. Batches are sent in order.
+
+    Errors publishing a batch from the daemon thread are counted in the
+    ``errors`` attribute and passed to ``exception_handler`` along with the
+    messages if specified.
+    """
+    def __init__(self, redis, max_messages=100, max_delay=0.01,
+                 exception_handler=None):
+        super(BufferedPublisher, self).__init__()
+        self.daemon = True
+        self.redis = redis
+        self.max_messages = max_messages
+        self.max_delay = max_delay
+        self.exception_handler = exception_handler
+        self.buffer = []
+        self.buffered_at = None
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.published = 0
+        self.errors = 0
+        self._running = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def publish(self, channel, message):
+        "Buffer ``message`` to be published on ``channel``"
+        with self.condition:
+            self.buffer.append((channel, message))
+            if len(self.buffer) == 1:
+                self.buffered_at = time.time()
+                self.condition.notify()
+            full = len(self.buffer) >= self.max_messages
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Publish the buffered messages now. Returns a list of the number of
+        subscribers each message was delivered to.
+        """
+        with self.flush_lock:
+            return self._send(self._take())
+
+    def _take(self):
+        with self.condition:
+            messages, self.buffer = self.buffer, []
+            self.buffered_at = None
+            return messages
+
+    def _send(self, messages):
+        if not messages:
+            return []
+        counts = self.redis.publish_many(messages)
+        self.published += len(messages)
+        return counts
+
+    def run(self):
+        while 1:
+            with self.condition:
+                while self._running:
+                    if self.buffered_at is None:
+                        self.condition.wait()
+                        continue
+                    wait = self.buffered_at + self.max_delay - time.time()
+                    if wait <= 0:
+                        break
+                    self.condition.wait(wait)
+                if not self._running:
+                    return
+            with self.flush_lock:
+                messages = self._take()
+                try:
+                    self._send(messages)
+                except RedisError as e:
+                    self.errors += 1
+                    if self.exception_handler is not None:
+                        self.exception_handler(e, messages)
+
+    def close(self):
+        "Stop the daemon thread and publish the buffered messages"
+        with self.condition:
+            self._running = False
+            self.condition.notify()
+        if self.is_alive():
+            self.join()
+        return self.flush()
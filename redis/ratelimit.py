@@ -0,0 +1,78 @@
+import uuid
+from redis import scripts
+
+
+class RateLimiter(object):
+    """
+    Base class of the rate limiters, allowing at most ``limit`` hits per
+    ``period`` seconds for each key checked. Limits are tracked in keys
+    named after the checked keys, prefixed with ``prefix``.
+
+    Each check runs a single script, whether it's for one key or many.
+    """
+    lua = None
+
+    def __init__(self, redis, limit, period, prefix='ratelimit:'):
+        self.redis = redis
+        self.limit = limit
+        self.period = period
+        self.prefix = prefix
+        self.script = redis.register_script(self.lua)
+
+    def check(self, key, cost=1):
+        """
+        Record a hit of ``cost`` on ``key`` if it's within the limit.
+        Returns a tuple of whether the hit was allowed and the number of
+        hits remaining.
+        """
+        return self.check_many([key], cost)[0]
+
+    def allow(self, key, cost=1):
+        "Returns True if a hit of ``cost`` on ``key`` is within the limit"
+        return self.check_many([key], cost)[0][0]
+
+    def check_many(self, keys, cost=1):
+        """
+        Record a hit of ``cost`` on each key in ``keys`` within the limit,
+        in a single round trip. Returns a list of tuples of whether each
+        hit was allowed and the number of hits remaining.
+        """
+        if not keys:
+            return []
+        keys = ['%s%s' % (self.prefix, key) for key in keys]
+        response = self.script(keys, self.arguments(cost))
+        return [(bool(allowed), remaining) for allowed, remaining
+                in zip(response[::2], response[1::2])]
+
+    def arguments(self, cost):
+        "Return the script arguments of a check of ``cost``"
+        return [self.limit, int(self.period * 1000), cost]
+
+
+class FixedWindowRateLimiter(RateLimiter):
+    """
+    Counts the hits on each key in windows of ``period`` seconds, starting
+    with the first hit. Cheapest of the limiters, but allows bursts of up
+    to twice the limit across the end of a window.
+    """
+    lua = scripts.FIXED_WINDOW
+
+
+class SlidingWindowRateLimiter(RateLimiter):
+    """
+    Logs the hits on each key in a sorted set, allowing at most ``limit``
+    hits within any ``period`` seconds. Exact, but stores a member per hit.
+    """
+    lua = scripts.SLIDING_WINDOW
+
+    def arguments(self, cost):
+        return RateLimiter.arguments(self, cost) + [uuid.uuid4().hex]
+
+
+class TokenBucketRateLimiter(RateLimiter):
+    """
+    Keeps a bucket of up to ``limit`` tokens for each key, refilled at a
+    rate of ``limit`` tokens per ``period`` seconds. Each hit takes
+    ``cost`` tokens, allowing bursts of up to ``limit`` hits.
+    """
+    lua = scripts.TOKEN_BUCKET
@@ -0,0 +1,110 @@
+import datetime
+import time
+from redis import scripts
+
+
+def to_timestamp(when):
+    "Return the unix timestamp of ``when``, a datetime or a timestamp"
+    if isinstance(when, datetime.datetime):
+        return time.mktime(when.timetuple()) + when.microsecond / 1000000.0
+    return float(when)
+
+
+class Scheduler(object):
+    """
+    Schedules items, such as job payloads or ids, to be processed at a
+    later time. Items are kept in a sorted set scored by the unix time
+    they're due at, and workers claim batches of due items atomically, so
+    any number of workers can process the same schedule without processing
+    an item twice.
+
+    Items are unique: scheduling an item already scheduled moves it to the
+    new due time. Due times are compared with the clocks of the workers.
+    """
+
+    def __init__(self, redis, name):
+        """
+        Create a Scheduler using the sorted set ``name`` and the Redis
+        client supplied by ``redis``. Workers sleeping until the next item
+        is due are woken through the list '<name>:signal' when an earlier
+        item is scheduled.
+        """
+        self.redis = redis
+        self.name = name
+        self.signal = '%s:signal' % name
+        self._schedule = redis.register_script(scripts.SCHEDULE_ITEMS)
+        self._claim = redis.register_script(scripts.CLAIM_DUE_ITEMS)
+
+    def __len__(self):
+        "Returns the number of scheduled items"
+        return self.redis.zcard(self.name)
+
+    def schedule(self, item, when):
+        """
+        Schedule ``item`` to be due at ``when``, a datetime or a unix
+        timestamp. Returns True if the item wasn't already scheduled.
+        """
+        return bool(self.schedule_many({item: when}))
+
+    def schedule_in(self, item, delay):
+        "Schedule ``item`` to be due in ``delay`` seconds"
+        return self.schedule(item, time.time() + delay)
+
+    def schedule_many(self, mapping):
+        """
+        Schedule each item of ``mapping`` to be due at its value, a datetime
+        or a unix timestamp, in a single round trip. Returns the number of
+        items that weren't already scheduled.
+        """
+        if not mapping:
+            return 0
+        args = []
+        for item, when in mapping.items():
+            args.extend((repr(to_timestamp(when)), item))
+        return self._schedule([self.name, self.signal], args)
+
+    def cancel(self, *items):
+        "Remove ``items`` from the schedule, returning how many were removed"
+        return self.redis.zrem(self.name, *items)
+
+    def claim(self, count=100, now=None):
+        """
+        Remove and return up to ``count`` items due at ``now``, the current
+        time by default, in order of their due time.
+
+        Returns a tuple of the list of items and the unix time the next item
+        is due at, or None if no other item is scheduled.
+        """
+        if now is None:
+            now = time.time()
+        items, next_due = self._claim([self.name], [repr(now), count])
+        if next_due is not None:
+            next_due = float(next_due)
+        return items, next_due
+
+    def run(self, handler, count=100, max_sleep=5, stop=None):
+        """
+        Claim due items in batches of up to ``count`` and call ``handler``
+        with each of them, until the ``stop`` event, a threading.Event, is
+        set. A sleeping worker notices the event within ``max_sleep``
+        seconds.
+
+        When no item is due, sleep until the next one is, for at most
+        ``max_sleep`` seconds. A worker sleeping for longer than a second
+        is woken when an item due earlier is scheduled.
+        """
+        while stop is None or not stop.is_set():
+            items, next_due = self.claim(count)
+            for item in items:
+                handler(item)
+            if len(items) == count or (stop is not None and stop.is_set()):
+                # more items may be due already, or the worker was stopped
+                continue
+            wait = max_sleep
+            if next_due is not None:
+                wait = min(max(next_due - time.time(), 0), max_sleep)
+            if wait >= 1:
+                # BLPOP timeouts are whole seconds
+                self.redis.blpop([self.signal], int(wait))
+            elif wait > 0:
+                time.sleep(wait)
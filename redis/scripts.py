@@ -0,0 +1,482 @@
+"""
+Lua sources of the atomic operations exposed as client methods. Each script
+does in a single round trip what would otherwise take a WATCH/MULTI/EXEC
+transaction, retried until no other client modifies the watched keys.
+"""
+
+# KEYS[1] key, ARGV[1] expected value, ARGV[2] new value, ARGV[3] ttl or 0
+COMPARE_AND_SET = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if tonumber(ARGV[3]) > 0 then
+    redis.call('SETEX', KEYS[1], ARGV[3], ARGV[2])
+else
+    redis.call('SET', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+# KEYS[1] key, ARGV[1] expected value
+COMPARE_AND_DELETE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS the keys, ARGV[1] ttl or 0, ARGV[2] 1 to only set if none of the keys
+# exist, ARGV[3:] the values of the keys
+MSETEX = """
+local ttl = tonumber(ARGV[1])
+if ARGV[2] == '1' then
+    for i, key in ipairs(KEYS) do
+        if redis.call('EXISTS', key) == 1 then
+            return 0
+        end
+    end
+end
+for i, key in ipairs(KEYS) do
+    if ttl > 0 then
+        redis.call('SETEX', key, ttl, ARGV[i + 2])
+    else
+        redis.call('SET', key, ARGV[i + 2])
+    end
+end
+return 1
+"""
+
+# KEYS[1] hash, ARGV[1] minimum or '', ARGV[2] maximum or '', ARGV[3:] pairs
+# of fields and amounts
+HINCRBY_CAPPED = """
+local minimum = tonumber(ARGV[1])
+local maximum = tonumber(ARGV[2])
+local values = {}
+-- check all the values before writing any, like HINCRBY would
+for i = 3, #ARGV, 2 do
+    local value = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or 0)
+    if not value or value % 1 ~= 0 then
+        return redis.error_reply('hash value is not an integer')
+    end
+    value = value + tonumber(ARGV[i + 1])
+    if maximum and value > maximum then
+        value = maximum
+    end
+    if minimum and value < minimum then
+        value = minimum
+    end
+    values[#values + 1] = value
+end
+for i = 3, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i],
+               string.format('%d', values[(i - 1) / 2]))
+end
+return values
+"""
+
+# KEYS[1] list, ARGV[1] count, ARGV[2] 'left' or 'right'
+POP_MANY = """
+local count = tonumber(ARGV[1])
+if count <= 0 then
+    return {}
+end
+if ARGV[2] == 'left' then
+    local items = redis.call('LRANGE', KEYS[1], 0, count - 1)
+    redis.call('LTRIM', KEYS[1], count, -1)
+    return items
+end
+local items = redis.call('LRANGE', KEYS[1], -count, -1)
+redis.call('LTRIM', KEYS[1], 0, -count - 1)
+local reversed = {}
+for i = #items, 1, -1 do
+    reversed[#reversed + 1] = items[i]
+end
+return reversed
+"""
+
+# KEYS[1] sorted set, KEYS[2] list, ARGV[1] maximum score, ARGV[2] count or ''
+ZMOVE_EXPIRED = """
+local members
+if ARGV[2] ~= '' then
+    members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1],
+                         'LIMIT', 0, ARGV[2])
+else
+    members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+end
+-- unpack() is limited by the size of the Lua stack, move members in batches
+for i = 1, #members, 1000 do
+    local batch = {unpack(members, i, math.min(i + 999, #members))}
+    redis.call('ZREM', KEYS[1], unpack(batch))
+    redis.call('RPUSH', KEYS[2], unpack(batch))
+end
+return members
+"""
+
+# KEYS[1] lock, ARGV[1] token, ARGV[2] new ttl in milliseconds
+RENEW_LOCK = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+"""
+
+# KEYS[1] lock, KEYS[2] signal list, ARGV[1] token, ARGV[2] signal ttl in
+# milliseconds
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('RPUSH', KEYS[2], 1)
+redis.call('PEXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+# sets ``now`` to the server's time in milliseconds, so leases don't depend
+# on the clocks of the clients. Scripts calling TIME before writing have to
+# replicate their effects rather than themselves on servers before 5.0.
+SERVER_TIME = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+"""
+
+# KEYS[1] holders, KEYS[2] waiters scored by ticket, KEYS[3] waiters' leases,
+# KEYS[4] ticket counter, KEYS[5] signal list, ARGV[1] limit, ARGV[2] token,
+# ARGV[3] timeout in milliseconds or '', ARGV[4] 1 to wait in line or '' to
+# give up, ARGV[5] waiter lease in milliseconds, ARGV[6] signal ttl in
+# milliseconds. Returns 1 once acquired, 0 if no slot is free and -1 if the
+# free slots are for waiters ahead of the token.
+ACQUIRE_SEMAPHORE = SERVER_TIME + """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+-- drop the waiters that stopped trying without leaving the line
+local gone = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now)
+for i, waiter in ipairs(gone) do
+    redis.call('ZREM', KEYS[2], waiter)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now)
+if not redis.call('ZSCORE', KEYS[2], ARGV[2]) then
+    redis.call('ZADD', KEYS[2], redis.call('INCR', KEYS[4]), ARGV[2])
+end
+local free = tonumber(ARGV[1]) - redis.call('ZCARD', KEYS[1])
+local acquired = redis.call('ZRANK', KEYS[2], ARGV[2]) < free
+if acquired or ARGV[4] == '' then
+    redis.call('ZREM', KEYS[2], ARGV[2])
+    redis.call('ZREM', KEYS[3], ARGV[2])
+else
+    redis.call('ZADD', KEYS[3], now + tonumber(ARGV[5]), ARGV[2])
+end
+if acquired then
+    local expires = 'inf'
+    if ARGV[3] ~= '' then
+        expires = now + tonumber(ARGV[3])
+    end
+    redis.call('ZADD', KEYS[1], expires, ARGV[2])
+    free = free - 1
+end
+if redis.call('ZCARD', KEYS[2]) == 0 then
+    redis.call('DEL', KEYS[4])
+elseif free > 0 then
+    -- wake the waiters the slots left are for
+    redis.call('DEL', KEYS[5])
+    redis.call('RPUSH', KEYS[5], 1)
+    redis.call('PEXPIRE', KEYS[5], ARGV[6])
+end
+if acquired then
+    return 1
+elseif free > 0 and ARGV[4] ~= '' then
+    return -1
+end
+return 0
+"""
+
+# KEYS[1] holders, KEYS[2] waiters scored by ticket, KEYS[3] waiters' leases,
+# KEYS[4] ticket counter, KEYS[5] signal list, ARGV[1] limit, ARGV[2] token,
+# ARGV[3] signal ttl in milliseconds
+LEAVE_SEMAPHORE_LINE = """
+redis.call('ZREM', KEYS[2], ARGV[2])
+redis.call('ZREM', KEYS[3], ARGV[2])
+if redis.call('ZCARD', KEYS[2]) == 0 then
+    redis.call('DEL', KEYS[4])
+elseif redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[1]) then
+    -- the token may have been the one a free slot waited for
+    redis.call('DEL', KEYS[5])
+    redis.call('RPUSH', KEYS[5], 1)
+    redis.call('PEXPIRE', KEYS[5], ARGV[3])
+end
+return 1
+"""
+
+# KEYS[1] holders, KEYS[2] signal list, ARGV[1] token, ARGV[2] signal ttl in
+# milliseconds
+RELEASE_SEMAPHORE = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+redis.call('RPUSH', KEYS[2], 1)
+redis.call('PEXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+# KEYS[1] holders, ARGV[1] token, ARGV[2] new timeout in milliseconds
+RENEW_SEMAPHORE = SERVER_TIME + """
+local expires = tonumber(redis.call('ZSCORE', KEYS[1], ARGV[1]))
+if not expires or expires <= now then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[1])
+return 1
+"""
+
+# KEYS[1] writer, KEYS[2] readers, KEYS[3] waiting writer, KEYS[4] readers'
+# signal list, ARGV[1] token, ARGV[2] timeout in milliseconds or '', ARGV[3]
+# signal ttl in milliseconds
+ACQUIRE_READ_LOCK = SERVER_TIME + """
+if redis.call('EXISTS', KEYS[1]) == 1 or
+        redis.call('EXISTS', KEYS[3]) == 1 then
+    return 0
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+local expires = 'inf'
+if ARGV[2] ~= '' then
+    expires = now + tonumber(ARGV[2])
+end
+redis.call('ZADD', KEYS[2], expires, ARGV[1])
+-- wake the next waiting reader, so that all the readers waiting for a
+-- writer get in once it's done
+redis.call('DEL', KEYS[4])
+redis.call('RPUSH', KEYS[4], 1)
+redis.call('PEXPIRE', KEYS[4], ARGV[3])
+return 1
+"""
+
+# KEYS[1] writer, KEYS[2] readers, KEYS[3] waiting writer, ARGV[1] token,
+# ARGV[2] timeout in milliseconds or '', ARGV[3] the time in milliseconds new
+# readers are held off for if the lock is busy, or '' to not hold them off
+ACQUIRE_WRITE_LOCK = SERVER_TIME + """
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+if redis.call('EXISTS', KEYS[1]) == 1 or
+        redis.call('ZCARD', KEYS[2]) > 0 then
+    if ARGV[3] ~= '' then
+        redis.call('SET', KEYS[3], ARGV[1], 'PX', ARGV[3])
+    end
+    return 0
+end
+if ARGV[2] ~= '' then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+else
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+redis.call('DEL', KEYS[3])
+return 1
+"""
+
+# KEYS[1] readers, KEYS[2] writers' signal list, ARGV[1] token, ARGV[2]
+# signal ttl in milliseconds
+RELEASE_READ_LOCK = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+if redis.call('ZCARD', KEYS[1]) == 0 then
+    redis.call('DEL', KEYS[2])
+    redis.call('RPUSH', KEYS[2], 1)
+    redis.call('PEXPIRE', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+# KEYS[1] writer, KEYS[2] readers' signal list, KEYS[3] writers' signal list,
+# ARGV[1] token, ARGV[2] signal ttl in milliseconds
+RELEASE_WRITE_LOCK = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+redis.call('RPUSH', KEYS[2], 1)
+redis.call('RPUSH', KEYS[3], 1)
+redis.call('PEXPIRE', KEYS[2], ARGV[2])
+redis.call('PEXPIRE', KEYS[3], ARGV[2])
+return 1
+"""
+
+# KEYS the counters, ARGV[1] limit, ARGV[2] period in milliseconds, ARGV[3]
+# cost. Returns a flat list of (allowed, remaining) pairs.
+FIXED_WINDOW = """
+local limit = tonumber(ARGV[1])
+local cost = tonumber(ARGV[3])
+local results = {}
+for i, key in ipairs(KEYS) do
+    local count = redis.call('INCRBY', key, cost)
+    if count == cost then
+        -- the first hit of the window starts it
+        redis.call('PEXPIRE', key, ARGV[2])
+    end
+    local allowed = 1
+    if count > limit then
+        -- rejected hits don't count
+        count = redis.call('DECRBY', key, cost)
+        allowed = 0
+    end
+    results[#results + 1] = allowed
+    results[#results + 1] = limit - count
+end
+return results
+"""
+
+# KEYS the logs, ARGV[1] limit, ARGV[2] period in milliseconds, ARGV[3] cost,
+# ARGV[4] a unique id for the members added. Returns a flat list of
+# (allowed, remaining) pairs.
+SLIDING_WINDOW = SERVER_TIME + """
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local results = {}
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - period)
+    local count = redis.call('ZCARD', key)
+    local allowed = 0
+    if count + cost <= limit then
+        for j = 1, cost do
+            redis.call('ZADD', key, now, ARGV[4] .. ':' .. i .. ':' .. j)
+        end
+        redis.call('PEXPIRE', key, period)
+        count = count + cost
+        allowed = 1
+    end
+    results[#results + 1] = allowed
+    results[#results + 1] = limit - count
+end
+return results
+"""
+
+# KEYS the buckets, ARGV[1] capacity, ARGV[2] period in milliseconds to refill
+# an empty bucket in, ARGV[3] cost. Returns a flat list of (allowed,
+# remaining) pairs.
+TOKEN_BUCKET = SERVER_TIME + """
+local capacity = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local rate = capacity / period
+local results = {}
+for i, key in ipairs(KEYS) do
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+    local tokens = capacity
+    if bucket[1] then
+        local elapsed = math.max(0, now - tonumber(bucket[2]))
+        tokens = math.min(capacity, tonumber(bucket[1]) + elapsed * rate)
+    end
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HMSET', key, 'tokens', tostring(tokens), 'updated', now)
+    redis.call('PEXPIRE', key, period)
+    results[#results + 1] = allowed
+    results[#results + 1] = math.floor(tokens)
+end
+return results
+"""
+
+# KEYS[1] queue, KEYS[2] processing, KEYS[3] jobs, ARGV[1] count, ARGV[2]
+# visibility timeout in milliseconds. Returns a flat list of (id, payload)
+# pairs.
+DEQUEUE_JOBS = SERVER_TIME + """
+local count = tonumber(ARGV[1])
+-- jobs not acknowledged within their visibility timeout go back to the
+-- head of the queue first
+local stalled = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now,
+                           'LIMIT', 0, count)
+for i = #stalled, 1, -1 do
+    redis.call('ZREM', KEYS[2], stalled[i])
+    redis.call('LPUSH', KEYS[1], stalled[i])
+end
+local ids = redis.call('LRANGE', KEYS[1], 0, count - 1)
+if #ids == 0 then
+    return {}
+end
+redis.call('LTRIM', KEYS[1], #ids, -1)
+local deadline = now + tonumber(ARGV[2])
+local jobs = {}
+for i, id in ipairs(ids) do
+    redis.call('ZADD', KEYS[2], deadline, id)
+    jobs[#jobs + 1] = id
+    jobs[#jobs + 1] = redis.call('HGET', KEYS[3], id)
+end
+return jobs
+"""
+
+# KEYS[1] processing, KEYS[2] jobs, ARGV the ids of the jobs
+ACK_JOBS = """
+local acked = 0
+for i, id in ipairs(ARGV) do
+    if redis.call('ZREM', KEYS[1], id) == 1 then
+        redis.call('HDEL', KEYS[2], id)
+        acked = acked + 1
+    end
+end
+return acked
+"""
+
+# KEYS[1] queue, KEYS[2] processing, ARGV the ids of the jobs
+RELEASE_JOBS = """
+local released = 0
+for i = #ARGV, 1, -1 do
+    if redis.call('ZREM', KEYS[2], ARGV[i]) == 1 then
+        redis.call('LPUSH', KEYS[1], ARGV[i])
+        released = released + 1
+    end
+end
+return released
+"""
+
+# KEYS[1] queue, KEYS[2] processing
+REQUEUE_STALLED_JOBS = SERVER_TIME + """
+local stalled = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)
+for i = #stalled, 1, -1 do
+    redis.call('ZREM', KEYS[2], stalled[i])
+    redis.call('LPUSH', KEYS[1], stalled[i])
+end
+return #stalled
+"""
+
+# KEYS[1] schedule, KEYS[2] signal list, ARGV pairs of due times and items.
+# Returns the number of items added.
+SCHEDULE_ITEMS = """
+local earliest
+for i = 1, #ARGV, 2 do
+    local due = tonumber(ARGV[i])
+    if not earliest or due < earliest then
+        earliest = due
+    end
+end
+local added = 0
+for i = 1, #ARGV, 2 do
+    added = added + redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+-- wake sleeping workers if an item is now due before the others
+local first = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if tonumber(first[2]) >= earliest then
+    redis.call('DEL', KEYS[2])
+    redis.call('RPUSH', KEYS[2], 1)
+    redis.call('EXPIRE', KEYS[2], 1)
+end
+return added
+"""
+
+# KEYS[1] schedule, ARGV[1] the current time, ARGV[2] count. Returns the due
+# items removed from the schedule and the due time of the next item, or nil.
+CLAIM_DUE_ITEMS = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1],
+                       'LIMIT', 0, ARGV[2])
+-- unpack() is limited by the size of the Lua stack, remove in batches
+for i = 1, #due, 1000 do
+    redis.call('ZREM', KEYS[1], unpack(due, i, math.min(i + 999, #due)))
+end
+local next = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+-- a nil would end the table, return false for a nil reply instead
+return {due, next[2] or false}
+"""
@@ -0,0 +1,135 @@
+from __future__ import with_statement
+import math
+import time
+import uuid
+from redis import scripts
+
+
+class WorkQueue(object):
+    """
+    A reliable work queue. Jobs are identified by a unique id and stored in
+    a hash, and their ids are queued in a list. Dequeued jobs move to a
+    sorted set of jobs being processed, scored by the server time their
+    visibility timeout ends at, until they're acknowledged. Jobs that
+    aren't acknowledged in time, because their consumer crashed or stalled,
+    return to the head of the queue to be dequeued again.
+
+    Enqueuing and dequeuing any number of jobs take a single round trip.
+
+    The queue ``name`` is used as the key of the list of queued ids, and as
+    the prefix of the other keys: '<name>:jobs', '<name>:processing' and
+    '<name>:signal', a list pushed to when jobs are enqueued that blocking
+    consumers wait on.
+    """
+
+    def __init__(self, redis, name, visibility_timeout=30):
+        """
+        Create a WorkQueue named ``name`` using the Redis client supplied
+        by ``redis``. Dequeued jobs are returned to the queue if they're not
+        acknowledged within ``visibility_timeout`` seconds.
+        """
+        self.redis = redis
+        self.name = name
+        self.visibility_timeout = visibility_timeout
+        self.jobs = '%s:jobs' % name
+        self.processing = '%s:processing' % name
+        self.signal = '%s:signal' % name
+        self._dequeue = redis.register_script(scripts.DEQUEUE_JOBS)
+        self._ack = redis.register_script(scripts.ACK_JOBS)
+        self._release = redis.register_script(scripts.RELEASE_JOBS)
+        self._requeue = redis.register_script(scripts.REQUEUE_STALLED_JOBS)
+
+    def __len__(self):
+        "Returns the number of queued jobs, not counting those in process"
+        return self.redis.llen(self.name)
+
+    def put(self, *payloads):
+        """
+        Enqueue a job for each of ``payloads``, in a single transaction.
+        Returns the list of the jobs' ids.
+        """
+        ids = [uuid.uuid4().hex for payload in payloads]
+        if not ids:
+            return ids
+        with self.redis.pipeline() as pipe:
+            pipe.hmset(self.jobs, dict(zip(ids, payloads)))
+            pipe.rpush(self.name, *ids)
+            # wake up to one blocked consumer per job
+            pipe.delete(self.signal)
+            pipe.rpush(self.signal, *[1] * min(len(ids), 100))
+            pipe.expire(self.signal, 1)
+            pipe.execute()
+        return ids
+
+    def get(self, count=1, timeout=None):
+        """
+        Dequeue up to ``count`` jobs. Returns a list of (id, payload) tuples,
+        which is empty if no job is queued.
+
+        If ``timeout`` is specified and no job is queued, wait up to that
+        many seconds, rounded up to a whole second, for jobs to be enqueued.
+        """
+        jobs = self.get_nowait(count)
+        if jobs or not timeout:
+            return jobs
+        stop_trying_at = time.time() + timeout
+        while not jobs:
+            remaining = stop_trying_at - time.time()
+            if remaining <= 0:
+                break
+            self.redis.blpop([self.signal], int(math.ceil(remaining)))
+            jobs = self.get_nowait(count)
+        return jobs
+
+    def get_nowait(self, count=1):
+        "Dequeue up to ``count`` jobs, without waiting for jobs to be queued"
+        response = self._dequeue(
+            [self.name, self.processing, self.jobs],
+            [count, int(self.visibility_timeout * 1000)])
+        return list(zip(response[::2], response[1::2]))
+
+    def ack(self, *ids):
+        """
+        Acknowledge the processing of the jobs ``ids``, deleting them.
+        Returns the number of jobs acknowledged, which doesn't count jobs
+        returned to the queue because their visibility timeout expired.
+        """
+        if not ids:
+            return 0
+        return self._ack([self.processing, self.jobs], ids)
+
+    def release(self, *ids):
+        """
+        Return the jobs ``ids`` being processed to the head of the queue,
+        to be retried. Returns the number of jobs returned.
+        """
+        if not ids:
+            return 0
+        return self._release([self.name, self.processing], ids)
+
+    def requeue_stalled(self):
+        """
+        Return all the jobs whose visibility timeout expired to the head of
+        the queue. Dequeuing does so for as many jobs as it dequeues, this
+        is only needed to requeue all of them at once. Returns the number of
+        jobs returned.
+        """
+        return self._requeue([self.name, self.processing])
+
+    def processing_count(self):
+        "Returns the number of jobs being processed"
+        return self.redis.zcard(self.processing)
+
+    def consume(self, prefetch=10, timeout=1):
+        """
+        Yield (id, payload) tuples of jobs forever, dequeuing up to
+        ``prefetch`` jobs per round trip. When no job is queued, wait for
+        jobs to be enqueued, for up to ``timeout`` seconds at a time.
+
+        The visibility timeout of prefetched jobs starts when they're
+        dequeued, so ``prefetch`` jobs have to be processed within it.
+        Jobs still have to be acknowledged with ack().
+        """
+        while 1:
+            for job in self.get(prefetch, timeout):
+                yield job
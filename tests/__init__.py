@@ -2,8 +2,31 @@ import unittest
 from tests.server_commands import ServerCommandsTestCase
 from tests.connection_pool import ConnectionPoolTestCase
 from tests.pipeline import PipelineTestCase
-from tests.lock import LockTestCase
-from tests.pubsub import PubSubTestCase, PubSubRedisDownTestCase
+from tests.lock import (
+    LockTestCase,
+    ReadWriteLockTestCase,
+    SemaphoreTestCase,
+    TokenLockTestCase,
+    )
+from tests.pubsub import (
+    BufferedPublisherTestCase,
+    PartitionedSubscriberTestCase,
+    PubSubTestCase,
+    PubSubMultiplexerTestCase,
+    PubSubRedisDownTestCase,
+    PubSubWorkerPoolTestCase,
+    )
+from tests.cache import (
+    ClientCacheTestCase,
+    ClientCacheCommandsTestCase,
+    SingleFlightTestCase,
+    )
+from tests.codecs import CodecsTestCase, CompressionCodecTestCase
+from tests.ratelimit import RateLimiterTestCase
+from tests.workqueue import WorkQueueTestCase
+from tests.scheduler import SchedulerTestCase
+from tests.commands import CommandSpecTestCase
+from tests.scripting import AtomicOperationsTestCase, ScriptingTestCase
 
 use_hiredis = False
 try:
@@ -18,6 +41,24 @@ def all_tests():
     suite.addTest(unittest.makeSuite(ConnectionPoolTestCase))
     suite.addTest(unittest.makeSuite(PipelineTestCase))
     suite.addTest(unittest.makeSuite(LockTestCase))
+    suite.addTest(unittest.makeSuite(TokenLockTestCase))
+    suite.addTest(unittest.makeSuite(SemaphoreTestCase))
+    suite.addTest(unittest.makeSuite(ReadWriteLockTestCase))
     suite.addTest(unittest.makeSuite(PubSubTestCase))
     suite.addTest(unittest.makeSuite(PubSubRedisDownTestCase))
+    suite.addTest(unittest.makeSuite(PubSubWorkerPoolTestCase))
+    suite.addTest(unittest.makeSuite(PubSubMultiplexerTestCase))
+    suite.addTest(unittest.makeSuite(PartitionedSubscriberTestCase))
+    suite.addTest(unittest.makeSuite(BufferedPublisherTestCase))
+    suite.addTest(unittest.makeSuite(ClientCacheTestCase))
+    suite.addTest(unittest.makeSuite(ClientCacheCommandsTestCase))
+    suite.addTest(unittest.makeSuite(SingleFlightTestCase))
+    suite.addTest(unittest.makeSuite(CodecsTestCase))
+    suite.addTest(unittest.makeSuite(CompressionCodecTestCase))
+    suite.addTest(unittest.makeSuite(ScriptingTestCase))
+    suite.addTest(unittest.makeSuite(AtomicOperationsTestCase))
+    suite.addTest(unittest.makeSuite(RateLimiterTestCase))
+    suite.addTest(unittest.makeSuite(WorkQueueTestCase))
+    suite.addTest(unittest.makeSuite(SchedulerTestCase))
+    suite.addTest(unittest.makeSuite(CommandSpecTestCase))
     return suite
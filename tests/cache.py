@@ -0,0 +1,241 @@
+import redis
+import threading
+import time
+import unittest
+
+from redis.cache import ClientCache, CacheInvalidator, SingleFlight
+
+
+class ClientCacheTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = ClientCache(max_entries=2)
+        cache.set(('GET', 'a'), '1')
+        cache.set(('GET', 'b'), '2')
+        self.assertEqual(cache.get(('GET', 'a')), (True, '1'))
+        cache.set(('GET', 'c'), '3')
+        self.assertEqual(cache.get(('GET', 'b')), (False, None))
+        self.assertEqual(cache.get(('GET', 'a')), (True, '1'))
+        self.assertEqual(cache.get(('GET', 'c')), (True, '3'))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_max_bytes(self):
+        cache = ClientCache(max_bytes=10)
+        cache.set(('GET', 'a'), 'x' * 6)
+        cache.set(('GET', 'b'), 'y' * 6)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(('GET', 'b')), (True, 'y' * 6))
+        self.assertFalse(cache.set(('GET', 'c'), 'z' * 11))
+
+    def test_ttl(self):
+        cache = ClientCache(ttl=0.1)
+        cache.set(('GET', 'a'), '1')
+        self.assertEqual(cache.get(('GET', 'a')), (True, '1'))
+        time.sleep(0.2)
+        self.assertEqual(cache.get(('GET', 'a')), (False, None))
+
+    def test_invalidate_command(self):
+        cache = ClientCache()
+        cache.set(('HGET', 'a', 'f'), '1')
+        cache.set(('HGETALL', 'a'), {'f': '1'})
+        cache.set(('GET', 'b'), '2')
+        cache.invalidate_command(('HSET', 'a', 'f', '3'))
+        self.assertEqual(len(cache), 1)
+        cache.invalidate_command(('DEL', 'c', 'b'))
+        self.assertEqual(len(cache), 0)
+
+    def test_stale_generation_discarded(self):
+        cache = ClientCache()
+        generation = cache.generation
+        cache.invalidate('a')
+        self.assertFalse(cache.set(('GET', 'a'), '1', generation))
+
+    def test_mutable_replies_copied(self):
+        cache = ClientCache()
+        cache.set(('SMEMBERS', 'a'), set(['1']))
+        hit, members = cache.get(('SMEMBERS', 'a'))
+        members.add('2')
+        self.assertEqual(cache.get(('SMEMBERS', 'a')), (True, set(['1'])))
+
+
+class ClientCacheCommandsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = ClientCache()
+        self.client = redis.StrictRedis(host='localhost', port=6379, db=9,
+                                        client_cache=self.cache)
+        self.client.flushdb()
+
+    def tearDown(self):
+        self.client.flushdb()
+        self.client.connection_pool.disconnect()
+
+    def test_hits_skip_server(self):
+        self.client.set('a', 'foo')
+        self.assertEqual(self.client.get('a'), 'foo')
+        other = redis.StrictRedis(host='localhost', port=6379, db=9)
+        other.set('a', 'bar')
+        self.assertEqual(self.client.get('a'), 'foo')
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_writes_invalidate(self):
+        self.client.hset('a', 'f', 'foo')
+        self.assertEqual(self.client.hgetall('a'), {'f': 'foo'})
+        self.client.hset('a', 'g', 'bar')
+        self.assertEqual(self.client.hgetall('a'), {'f': 'foo', 'g': 'bar'})
+        self.client.sadd('b', '1')
+        self.assertEqual(self.client.smembers('b'), set(['1']))
+        with self.client.pipeline() as pipe:
+            pipe.sadd('b', '2').execute()
+        self.assertEqual(self.client.smembers('b'), set(['1', '2']))
+        self.client.hmset_many('a', ['g'], ['baz'])
+        self.assertEqual(self.client.hgetall('a'), {'f': 'foo', 'g': 'baz'})
+
+    def test_invalidator(self):
+        self.client.config_set('notify-keyspace-events', 'KA')
+        invalidator = CacheInvalidator(self.client)
+        invalidator.start()
+        try:
+            self.client.set('a', 'foo')
+            self.assertEqual(self.client.get('a'), 'foo')
+            other = redis.StrictRedis(host='localhost', port=6379, db=9)
+            other.set('a', 'bar')
+            time.sleep(0.1)
+            self.assertEqual(self.client.get('a'), 'bar')
+        finally:
+            invalidator.stop()
+            self.client.config_set('notify-keyspace-events', '')
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def test_concurrent_calls_coalesced(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def execute(*args):
+            calls.append(args)
+            release.wait()
+            return ['foo']
+
+        results = []
+        def call():
+            results.append(single_flight.execute(execute, ('MGET', 'a'), {}))
+        threads = [threading.Thread(target=call) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        while single_flight.coalesced < 4:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, [('MGET', 'a')])
+        self.assertEqual(results, [['foo']] * 5)
+        # each caller receives its own copy of the reply
+        self.assertEqual(len(set(map(id, results))), 5)
+
+    def test_errors_shared(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def execute(*args):
+            calls.append(args)
+            release.wait()
+            raise redis.ResponseError('failed')
+
+        errors = []
+        def call():
+            try:
+                single_flight.execute(execute, ('GET', 'a'), {})
+            except redis.ResponseError as e:
+                errors.append(e)
+        threads = [threading.Thread(target=call) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        while single_flight.coalesced < 4:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, [('GET', 'a')])
+        # the waiters receive the leader's error
+        self.assertEqual(len(errors), 5)
+        self.assertEqual(len(set(map(id, errors))), 1)
+        self.assertEqual(single_flight._calls, {})
+
+    def test_interrupted_leader(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def execute(*args):
+            release.wait()
+            raise KeyboardInterrupt()
+
+        errors = []
+        def call():
+            try:
+                errors.append(single_flight.execute(execute, ('GET', 'a'),
+                                                    {}))
+            except KeyboardInterrupt as e:
+                errors.append(e)
+        threads = [threading.Thread(target=call) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        while single_flight.coalesced < 1:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        # the waiter raises the interruption too, rather than returning None
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(all(isinstance(e, KeyboardInterrupt) for e in errors))
+
+    def test_read_your_writes(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def execute(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                release.wait()
+            return 'foo'
+
+        leader = threading.Thread(target=single_flight.execute,
+                                  args=(execute, ('GET', 'a'), {}))
+        leader.start()
+        while not calls:
+            time.sleep(0.01)
+        # reads don't prevent joining the call in flight
+        single_flight.completed(['GET'])
+        waiter = threading.Thread(target=single_flight.execute,
+                                  args=(execute, ('GET', 'a'), {}))
+        waiter.start()
+        while single_flight.coalesced < 1:
+            time.sleep(0.01)
+        # after a write, the thread's read is sent on its own
+        single_flight.completed(['SET'])
+        self.assertEqual(single_flight.execute(execute, ('GET', 'a'), {}),
+                         'foo')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(single_flight.coalesced, 1)
+        release.set()
+        leader.join()
+        waiter.join()
+
+    def test_client(self):
+        client = redis.StrictRedis(host='localhost', port=6379, db=9,
+                                   single_flight=SingleFlight())
+        client.set('a', 'foo')
+        self.assertEqual(client.get('a'), 'foo')
+        self.assertEqual(client.single_flight.executed, 1)
+        client.delete('a')
+
+    def test_bulk_commands_record_writes(self):
+        client = redis.StrictRedis(host='localhost', port=6379, db=9,
+                                   single_flight=SingleFlight())
+        client.mset_many(['a'], ['foo'])
+        client.hmset_many('b', ['f'], ['foo'])
+        client.zadd_many('c', ['m'], [1])
+        self.assertEqual(client.single_flight.writes, 3)
+        client.delete('a', 'b', 'c')
@@ -0,0 +1,121 @@
+from __future__ import with_statement
+import redis
+import unittest
+
+from redis.codecs import CompressionCodec, JSONCodec, KeyCodecs, PickleCodec
+
+
+class CodecsTestCase(unittest.TestCase):
+    def setUp(self):
+        codecs = KeyCodecs([('json:*', JSONCodec()), ('pickle:*', PickleCodec())])
+        self.client = redis.StrictRedis(host='localhost', port=6379, db=9,
+                                        codecs=codecs)
+        self.client.flushdb()
+
+    def tearDown(self):
+        self.client.flushdb()
+        self.client.connection_pool.disconnect()
+
+    def test_strings(self):
+        self.client.set('json:a', {'a': [1, 2]})
+        self.client.set('pickle:a', set([b'\xff']))
+        self.client.set('a', 'foo')
+        self.assertEqual(self.client.get('json:a'), {'a': [1, 2]})
+        self.assertEqual(self.client.get('pickle:a'), set([b'\xff']))
+        self.assertEqual(
+            self.client.mget('json:a', 'pickle:a', 'a', 'b'),
+            [{'a': [1, 2]}, set([b'\xff']), 'foo', None])
+        # values are stored serialized
+        plain = redis.StrictRedis(host='localhost', port=6379, db=9)
+        self.assertEqual(plain.get('json:a'), '{"a":[1,2]}')
+
+    def test_hashes(self):
+        self.client.hmset('json:a', {'a': 1, 'b': [2]})
+        self.assertEqual(self.client.hgetall('json:a'), {'a': 1, 'b': [2]})
+        self.assertEqual(self.client.hget('json:a', 'b'), [2])
+        self.assertEqual(self.client.hmget('json:a', 'a', 'c'), [1, None])
+        self.assertEqual(sorted(self.client.hvals('json:a'), key=str),
+                         [1, [2]])
+
+    def test_lists(self):
+        self.client.rpush('pickle:a', (1, 2), {'a': 3})
+        self.assertEqual(self.client.lrange('pickle:a', 0, -1),
+                         [(1, 2), {'a': 3}])
+        self.assertEqual(self.client.lpop('pickle:a'), (1, 2))
+        self.assertEqual(self.client.blpop('pickle:a', 1),
+                         ('pickle:a', {'a': 3}))
+
+    def test_pipelines(self):
+        for transaction in (True, False):
+            with self.client.pipeline(transaction) as pipe:
+                pipe.set('json:a', [1]).get('json:a').set('a', 'foo')
+                pipe.get('a').incr('b')
+                self.assertEqual(pipe.execute()[:4], [True, [1], True, 'foo'])
+
+    def test_identical_reads_share_decoders(self):
+        # so that a SingleFlight, keyed on the options, coalesces them
+        codecs = self.client.codecs
+        for args in (('GET', 'json:a'), ('MGET', 'json:a', 'a'),
+                     ('HGETALL', 'pickle:a'), ('LRANGE', 'json:a', 0, -1)):
+            self.assertEqual(codecs.prepare(args, {}),
+                             codecs.prepare(args, {}))
+        self.assertNotEqual(codecs.decoder(('GET', 'json:a')),
+                            codecs.decoder(('GET', 'pickle:a')))
+        self.assertNotEqual(codecs.decoder(('GET', 'json:a')),
+                            codecs.decoder(('LRANGE', 'json:a', 0, -1)))
+
+    def test_default_codec(self):
+        client = redis.StrictRedis(host='localhost', port=6379, db=9,
+                                   codecs=JSONCodec())
+        client.set('a', [1, 'b'])
+        self.assertEqual(client.get('a'), [1, 'b'])
+
+
+class CompressionCodecTestCase(unittest.TestCase):
+    def test_threshold(self):
+        codec = CompressionCodec(threshold=100)
+        self.assertEqual(codec.encode('a' * 99), b'\x00' + b'a' * 99)
+        data = codec.encode('a' * 100)
+        self.assertTrue(data.startswith(b'z'))
+        self.assertTrue(len(data) < 100)
+        self.assertEqual(codec.decode(data), 'a' * 100)
+        self.assertEqual(codec.decode(b'\x00' + b'a' * 99), 'a' * 99)
+        self.assertRaises(redis.RedisError, codec.decode, b'a' * 99)
+
+    def test_untagged_values(self):
+        # values written before the codec was enabled
+        codec = CompressionCodec()
+        for data in (b'zebra', b'xylophone', b'hello', b''):
+            self.assertRaises(redis.DecompressionError, codec.decode, data)
+
+    def test_raw_values_like_compressed(self):
+        # short values starting like a compressed value are stored raw
+        codec = CompressionCodec(threshold=100)
+        for value in ('\x00RCzabc', 'zabc', 'x', ''):
+            self.assertEqual(codec.decode(codec.encode(value)), value)
+
+    def test_algorithms(self):
+        for algorithm in ('zlib', 'lzma'):
+            codec = CompressionCodec(JSONCodec(), threshold=0,
+                                     algorithm=algorithm, level=1)
+            value = [{'a': i} for i in range(100)]
+            self.assertEqual(codec.decode(codec.encode(value)), value)
+        self.assertRaises(redis.RedisError, CompressionCodec, algorithm='foo')
+
+    def test_incompressible(self):
+        codec = CompressionCodec(threshold=0)
+        self.assertEqual(codec.encode(b'ab'), b'\x00ab')
+
+    def test_client(self):
+        client = redis.StrictRedis(host='localhost', port=6379, db=9,
+                                   codecs=CompressionCodec(threshold=10))
+        client.flushdb()
+        client.set('a', 'a' * 1000)
+        client.hset('b', 'c', 'b' * 1000)
+        self.assertEqual(client.get('a'), 'a' * 1000)
+        self.assertEqual(client.mget('a', 'c'), ['a' * 1000, None])
+        self.assertEqual(client.hget('b', 'c'), 'b' * 1000)
+        self.assertTrue(client.strlen('a') < 1000)
+        with client.pipeline() as pipe:
+            self.assertEqual(pipe.get('a').execute(), ['a' * 1000])
+        client.flushdb()
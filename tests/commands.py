@@ -0,0 +1,187 @@
+import redis
+import unittest
+
+from redis.cache import (
+    COALESCED_COMMANDS,
+    READ_ONLY_COMMANDS,
+    ClientCache,
+    SingleFlight,
+    is_coalesced,
+    written_keys,
+    )
+from redis.commands import COMMANDS, CommandSpec, command_keys
+
+
+class RoutingConnectionPool(redis.ConnectionPool):
+    "Records the keys connections are requested for"
+    routes_by_key = True
+
+    def __init__(self, **kwargs):
+        super(RoutingConnectionPool, self).__init__(**kwargs)
+        self.requests = []
+
+    def get_connection(self, command_name, *keys, **options):
+        self.requests.append((command_name, keys))
+        return super(RoutingConnectionPool, self).get_connection(
+            command_name, *keys, **options)
+
+
+class CommandSpecTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = redis.StrictRedis(host='localhost', port=6379, db=9)
+        self.client.flushdb()
+
+    def tearDown(self):
+        self.client.flushdb()
+        self.client.connection_pool.disconnect()
+
+    def test_spec(self):
+        spec = self.client.command_spec('get')
+        self.assertEqual(
+            (spec.name, spec.arity, spec.readonly, spec.write, spec.blocking,
+             spec.reply),
+            ('GET', 2, True, False, False, 'bulk'))
+        self.assertTrue(self.client.command_spec('BLPOP').blocking)
+        self.assertEqual(self.client.command_spec('NOSUCHCOMMAND'), None)
+        self.assertEqual(self.client.command_keys(('get', 'a')), ['a'])
+        self.assertEqual(command_keys(('mget', 'a', 'b')), ['a', 'b'])
+
+    def test_keys(self):
+        self.assertEqual(command_keys(('GET', 'a')), ['a'])
+        self.assertEqual(command_keys(('MSET', 'a', 1, 'b', 2)), ['a', 'b'])
+        self.assertEqual(command_keys(('DEL', 'a', 'b', 'c')),
+                         ['a', 'b', 'c'])
+        self.assertEqual(command_keys(('BLPOP', 'a', 'b', 0)), ['a', 'b'])
+        self.assertEqual(command_keys(('RENAME', 'a', 'b')), ['a', 'b'])
+        self.assertEqual(command_keys(('OBJECT', 'ENCODING', 'a')), ['a'])
+        self.assertEqual(command_keys(('EVAL', 'script', 2, 'a', 'b', 'c')),
+                         ['a', 'b'])
+        self.assertEqual(
+            command_keys(('ZUNIONSTORE', 'd', 2, 'a', 'b', 'WEIGHTS', 1, 2)),
+            ['d', 'a', 'b'])
+        self.assertEqual(command_keys(('SORT', 'a', 'STORE', 'd')),
+                         ['a', 'd'])
+        self.assertEqual(command_keys(('PING',)), [])
+        self.assertEqual(command_keys(('NOSUCHCOMMAND', 'a')), [])
+
+    def test_arity(self):
+        self.assertTrue(COMMANDS['GET'].check_arity(('GET', 'a')))
+        self.assertFalse(COMMANDS['GET'].check_arity(('GET', 'a', 'b')))
+        self.assertTrue(COMMANDS['DEL'].check_arity(('DEL', 'a', 'b')))
+        self.assertFalse(COMMANDS['DEL'].check_arity(('DEL',)))
+
+    def test_cache_command_sets(self):
+        self.assertTrue('GET' in READ_ONLY_COMMANDS)
+        self.assertFalse('SET' in READ_ONLY_COMMANDS)
+        self.assertTrue('GET' in COALESCED_COMMANDS)
+        self.assertFalse('SRANDMEMBER' in COALESCED_COMMANDS)
+        self.assertFalse('BLPOP' in COALESCED_COMMANDS)
+        self.assertEqual(written_keys(('GET', 'a')), [])
+        self.assertEqual(written_keys(('MSET', 'a', 1, 'b', 2)), ['a', 'b'])
+        self.assertEqual(written_keys(('NOSUCHCOMMAND', 'a', 'b')), ('a',))
+
+    def test_routing(self):
+        pool = RoutingConnectionPool(db=9)
+        client = redis.StrictRedis(connection_pool=pool)
+        client.set('a', 1)
+        client.mget('a', 'b')
+        client.zunionstore('d', ['x', 'y'])
+        client.ping()
+        self.assertEqual(pool.requests, [
+            ('SET', ('a',)),
+            ('MGET', ('a', 'b')),
+            ('ZUNIONSTORE', ('d', 'x', 'y')),
+            ('PING', ()),
+            ])
+        del pool.requests[:]
+        client.mset_many(['a', 'b'], [1, 2])
+        client.zadd_many('z', ['m'], [1])
+        self.assertEqual(pool.requests, [
+            ('MSET', ('a', 'b')),
+            ('ZADD', ('z',)),
+            ])
+        client.delete('a', 'b', 'z')
+        pool.disconnect()
+
+    def test_bulk_commands_not_routed(self):
+        pool = redis.ConnectionPool(db=9)
+        requests = []
+        get_connection = pool.get_connection
+        def recording_get_connection(command_name, *keys, **options):
+            requests.append((command_name, keys))
+            return get_connection(command_name, *keys, **options)
+        pool.get_connection = recording_get_connection
+        client = redis.StrictRedis(connection_pool=pool)
+        client.zadd_many('z', ['m'], [1])
+        self.assertEqual(requests, [('ZADD', ())])
+        client.delete('z')
+        pool.disconnect()
+
+    def test_keys_found_for_routing_pools_only(self):
+        calls = []
+        def key_func(args):
+            calls.append(args)
+            return args[1:2]
+        specs = dict(COMMANDS)
+        specs['GET'] = CommandSpec('GET', 2, 'readonly movablekeys',
+                                   reply='bulk', key_func=key_func)
+        self.client.command_specs = specs
+        self.client.get('a')
+        self.assertEqual(calls, [])
+        pool = RoutingConnectionPool(db=9)
+        client = redis.StrictRedis(connection_pool=pool)
+        client.command_specs = specs
+        client.get('a')
+        self.assertEqual(calls, [('GET', 'a')])
+        pool.disconnect()
+
+    def test_cache_uses_client_specs(self):
+        specs = dict(COMMANDS)
+        specs['XWRITE'] = CommandSpec('XWRITE', 3, 'write', 2, 2, 1)
+        specs['XREAD'] = CommandSpec('XREAD', 2, 'readonly', 1, 1, 1)
+        cache = ClientCache()
+        cache.set(('GET', 'a'), '1')
+        cache.set(('GET', 'b'), '2')
+        cache.invalidate_command(('XWRITE', 'a', 'b'), specs)
+        self.assertEqual(cache.get(('GET', 'a')), (True, '1'))
+        self.assertEqual(cache.get(('GET', 'b')), (False, None))
+        single_flight = SingleFlight()
+        single_flight.completed(['XREAD'], specs)
+        self.assertEqual(single_flight.writes, 0)
+        single_flight.completed(['XREAD'])
+        self.assertEqual(single_flight.writes, 1)
+        # pipelines inherit the client's table
+        self.client.command_specs = specs
+        self.assertTrue(self.client.pipeline().command_specs is specs)
+
+    def test_load_command_specs(self):
+        specs = self.client.load_command_specs()
+        self.assertTrue(self.client.command_specs is specs)
+        self.assertFalse(COMMANDS is specs)
+        # the local table agrees with the server
+        for name, spec in COMMANDS.items():
+            if name not in specs:
+                continue
+            loaded = specs[name]
+            self.assertEqual(
+                (loaded.arity, loaded.readonly, loaded.write, loaded.random,
+                 loaded.blocking, loaded.reply),
+                (spec.arity, spec.readonly, spec.write, spec.random,
+                 spec.blocking, spec.reply))
+            self.assertEqual(loaded.keys(('X', 'a', 2, 'b', 'c', 'd')),
+                             spec.keys(('X', 'a', 2, 'b', 'c', 'd')))
+        self.assertTrue(isinstance(specs['GET'], CommandSpec))
+        self.assertEqual(self.client.command_keys(('GET', 'a')), ['a'])
+
+    def test_loaded_specs_cache_script_writes(self):
+        cache = ClientCache()
+        client = redis.StrictRedis(host='localhost', port=6379, db=9,
+                                   client_cache=cache)
+        client.load_command_specs()
+        self.assertTrue(client.command_spec('EVALSHA').write)
+        self.assertTrue(is_coalesced(client.command_spec('HGETALL')))
+        client.set('k', 'b')
+        self.assertEqual(client.get('k'), 'b')
+        client.compare_and_set('k', 'b', 'c')
+        self.assertEqual(client.get('k'), 'c')
+        client.connection_pool.disconnect()
@@ -1,8 +1,11 @@
 from __future__ import with_statement
 import redis
+import threading
 import time
 import unittest
 from redis.client import Lock, LockError
+from redis.codecs import CompressionCodec, JSONCodec
+from redis.lock import TokenLock
 
 class LockTestCase(unittest.TestCase):
     def setUp(self):
@@ -65,3 +68,393 @@ class LockTestCase(unittest.TestCase):
             LockError,
             self.client.lock, 'foo', timeout=1, sleep=2
             )
+
+
+class TokenLockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = redis.StrictRedis(host='localhost', port=6379, db=9)
+        self.client.flushdb()
+
+    def tearDown(self):
+        self.client.flushdb()
+
+    def test_lock(self):
+        lock = self.client.lock('foo', lock_class=TokenLock)
+        self.assertTrue(lock.acquire())
+        self.assertEqual(self.client.get('foo'), lock.token)
+        self.assertEqual(self.client.ttl('foo'), -1)
+        self.assertTrue(lock.owned())
+        lock.release()
+        self.assertEqual(self.client.get('foo'), None)
+        self.assertEqual(lock.token, None)
+
+    def test_client_with_codecs(self):
+        # tokens are stored as they are, not encoded by the codecs
+        for codec in (JSONCodec(), CompressionCodec(threshold=0)):
+            client = redis.StrictRedis(host='localhost', port=6379, db=9,
+                                       codecs=codec)
+            lock1 = TokenLock(client, 'foo', timeout=10)
+            lock2 = TokenLock(client, 'foo', sleep=0.01)
+            self.assertTrue(lock1.acquire())
+            self.assertTrue(lock1.owned())
+            self.assertTrue(lock2.locked())
+            self.assertTrue(lock1.extend(20))
+            lock1.release()
+            self.assertFalse(lock1.locked())
+            self.assertTrue(lock2.acquire(blocking_timeout=1))
+            lock2.release()
+            client.connection_pool.disconnect()
+
+    def test_competing_locks(self):
+        lock1 = TokenLock(self.client, 'foo')
+        lock2 = TokenLock(self.client, 'foo')
+        self.assertTrue(lock1.acquire())
+        self.assertFalse(lock2.acquire(blocking=False))
+        self.assertTrue(lock2.locked())
+        self.assertFalse(lock2.owned())
+        lock1.release()
+        self.assertTrue(lock2.acquire())
+        self.assertFalse(lock1.acquire(blocking=False))
+        lock2.release()
+
+    def test_millisecond_timeout(self):
+        lock1 = TokenLock(self.client, 'foo', timeout=0.2, sleep=0.01)
+        lock2 = TokenLock(self.client, 'foo', sleep=0.01)
+        self.assertTrue(lock1.acquire())
+        self.assertTrue(0 < self.client.pttl('foo') <= 200)
+        self.assertFalse(lock2.acquire(blocking=False))
+        self.assertTrue(lock2.acquire(blocking_timeout=1))
+        # the expired lock is now held by lock2, lock1 can't release it
+        self.assertRaises(LockError, lock1.release)
+        self.assertEqual(self.client.get('foo'), lock2.token)
+        lock2.release()
+
+    def test_blocking_timeout(self):
+        lock1 = TokenLock(self.client, 'foo')
+        lock2 = TokenLock(self.client, 'foo', sleep=0.01,
+                          blocking_timeout=0.1)
+        self.assertTrue(lock1.acquire())
+        start = time.time()
+        self.assertFalse(lock2.acquire())
+        self.assertTrue(time.time() - start >= 0.1)
+        lock1.release()
+
+    def test_polling(self):
+        lock1 = TokenLock(self.client, 'foo', timeout=0.2, notify=False)
+        lock2 = TokenLock(self.client, 'foo', sleep=0.01, notify=False)
+        self.assertTrue(lock1.acquire())
+        start = time.time()
+        self.assertTrue(lock2.acquire())
+        self.assertTrue(time.time() - start < 0.5)
+        lock2.release()
+        self.assertEqual(self.client.exists('foo:signal'), False)
+
+    def test_release_wakes_waiter(self):
+        lock1 = TokenLock(self.client, 'foo')
+        lock2 = TokenLock(self.client, 'foo', notify_timeout=10)
+        self.assertTrue(lock1.acquire())
+        acquired = []
+        def wait():
+            lock2.acquire()
+            acquired.append(time.time())
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        time.sleep(0.2)
+        released = time.time()
+        lock1.release()
+        waiter.join(5)
+        self.assertEqual(len(acquired), 1)
+        self.assertTrue(acquired[0] - released < 0.5)
+        lock2.release()
+
+    def test_crashed_owner(self):
+        # the owner never releases the lock, waiters retry once it expired
+        lock1 = TokenLock(self.client, 'foo', timeout=0.2)
+        lock2 = TokenLock(self.client, 'foo', notify_timeout=1)
+        self.assertTrue(lock1.acquire())
+        start = time.time()
+        self.assertTrue(lock2.acquire(blocking_timeout=3))
+        self.assertTrue(time.time() - start < 2)
+        lock2.release()
+
+    def test_local_handoff(self):
+        acquisitions = []
+
+        class CountingLock(TokenLock):
+            def do_acquire(self, token):
+                acquisitions.append(token)
+                return TokenLock.do_acquire(self, token)
+
+        owners = []
+        def worker():
+            lock = CountingLock(self.client, 'foo', timeout=10, local=True)
+            for i in range(5):
+                with lock:
+                    owners.append(lock.token)
+                    self.assertEqual(self.client.get('foo'), lock.token)
+                    time.sleep(0.001)
+
+        threads = [threading.Thread(target=worker) for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(owners), 50)
+        # the Redis lock was handed over between the threads instead of
+        # being acquired by each of them
+        self.assertTrue(len(acquisitions) < 50)
+        self.assertEqual(self.client.get('foo'), None)
+
+    def test_local_expired_lease(self):
+        lock1 = TokenLock(self.client, 'foo', timeout=0.2, local=True)
+        lock2 = TokenLock(self.client, 'foo', timeout=0.2, local=True)
+        self.assertTrue(lock1.acquire())
+        self.assertFalse(lock2.acquire(blocking=False))
+        token = lock1.token
+        tokens = []
+        waiter = threading.Thread(
+            target=lambda: tokens.append(lock2.acquire() and lock2.token))
+        waiter.start()
+        time.sleep(0.15)
+        # less than half the lease remains, the lock goes through Redis
+        lock1.release()
+        waiter.join()
+        self.assertNotEqual(tokens, [token])
+        self.assertEqual(self.client.get('foo'), lock2.token)
+        lock2.release()
+
+    def test_local_non_blocking(self):
+        lock1 = TokenLock(self.client, 'foo', local=True)
+        lock2 = TokenLock(self.client, 'foo', local=True)
+        other_process = TokenLock(self.client, 'foo')
+        self.assertTrue(other_process.acquire())
+        self.assertFalse(lock1.acquire(blocking=False))
+        other_process.release()
+        self.assertTrue(lock1.acquire(blocking=False))
+        self.assertFalse(lock2.acquire(blocking=False))
+        lock1.release()
+        self.assertTrue(lock2.acquire(blocking=False))
+        lock2.release()
+        self.assertEqual(redis.lock._local_queues, {})
+
+    def test_extend(self):
+        lock = TokenLock(self.client, 'foo', timeout=1)
+        self.assertRaises(LockError, lock.extend)
+        self.assertTrue(lock.acquire())
+        self.assertTrue(lock.extend(10))
+        self.assertTrue(self.client.pttl('foo') > 1000)
+        self.client.delete('foo')
+        self.assertRaises(LockError, lock.extend)
+
+    def test_auto_renewal(self):
+        lock = TokenLock(self.client, 'foo', timeout=0.3, auto_renewal=True)
+        with lock:
+            time.sleep(0.6)
+            self.assertTrue(lock.owned())
+        self.assertEqual(self.client.get('foo'), None)
+        self.assertRaises(LockError, TokenLock, self.client, 'foo',
+                          auto_renewal=True)
+
+    def test_context_manager(self):
+        with self.client.lock('foo', lock_class=TokenLock) as lock:
+            self.assertEqual(self.client.get('foo'), lock.token)
+        self.assertEqual(self.client.get('foo'), None)
+
+
+class SemaphoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = redis.StrictRedis(host='localhost', port=6379, db=9)
+        self.client.flushdb()
+
+    def tearDown(self):
+        self.client.flushdb()
+
+    def test_limit(self):
+        semaphores = [self.client.semaphore('foo', 2) for i in range(3)]
+        self.assertTrue(semaphores[0].acquire())
+        self.assertTrue(semaphores[1].acquire(blocking=False))
+        self.assertFalse(semaphores[2].acquire(blocking=False))
+        self.assertEqual(self.client.zcard('foo'), 2)
+        semaphores[0].release()
+        self.assertTrue(semaphores[2].acquire(blocking=False))
+        semaphores[1].release()
+        semaphores[2].release()
+        self.assertEqual(self.client.zcard('foo'), 0)
+        self.assertRaises(ValueError, semaphores[0].release)
+
+    def test_timeout(self):
+        semaphore1 = self.client.semaphore('foo', 1, timeout=0.2)
+        semaphore2 = self.client.semaphore('foo', 1)
+        self.assertTrue(semaphore1.acquire())
+        self.assertFalse(semaphore2.acquire(blocking=False))
+        time.sleep(0.3)
+        # the slot of the crashed holder was reclaimed
+        self.assertTrue(semaphore2.acquire(blocking=False))
+        self.assertRaises(LockError, semaphore1.extend)
+        self.assertRaises(LockError, semaphore1.release)
+        semaphore2.release()
+
+    def test_extend(self):
+        semaphore = self.client.semaphore('foo', 1, timeout=0.2)
+        with semaphore:
+            self.assertTrue(semaphore.extend(10))
+            time.sleep(0.3)
+            self.assertFalse(self.client.semaphore('foo', 1).acquire(
+                blocking=False))
+
+    def test_release_wakes_waiter(self):
+        semaphore1 = self.client.semaphore('foo', 1)
+        semaphore2 = self.client.semaphore('foo', 1, notify_timeout=10)
+        self.assertTrue(semaphore1.acquire())
+        acquired = []
+        waiter = threading.Thread(
+            target=lambda: acquired.append(semaphore2.acquire()))
+        waiter.start()
+        time.sleep(0.2)
+        start = time.time()
+        semaphore1.release()
+        waiter.join(5)
+        self.assertEqual(acquired, [True])
+        self.assertTrue(time.time() - start < 0.5)
+        semaphore2.release()
+
+    def test_concurrency(self):
+        holders = []
+        peak = []
+        mutex = threading.Lock()
+        def worker():
+            for i in range(5):
+                with self.client.semaphore('foo', 3, sleep=0.01,
+                                           notify=False):
+                    with mutex:
+                        holders.append(1)
+                        peak.append(len(holders))
+                    time.sleep(0.005)
+                    with mutex:
+                        holders.pop()
+        threads = [threading.Thread(target=worker) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(peak), 40)
+        self.assertTrue(max(peak) <= 3)
+
+    def test_fairness(self):
+        holder = self.client.semaphore('foo', 1)
+        self.assertTrue(holder.acquire())
+        order = []
+        def waiter(name):
+            semaphore = self.client.semaphore('foo', 1, notify_timeout=10)
+            semaphore.acquire()
+            order.append(name)
+            semaphore.release()
+        threads = []
+        for name in ('first', 'second', 'third'):
+            thread = threading.Thread(target=waiter, args=(name,))
+            thread.start()
+            threads.append(thread)
+            while self.client.zcard('foo:queue') < len(threads):
+                time.sleep(0.01)
+        holder.release()
+        # a client that doesn't wait can't take the slot from the line
+        self.assertFalse(self.client.semaphore('foo', 1).acquire(
+            blocking=False))
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(order, ['first', 'second', 'third'])
+        self.assertFalse(self.client.exists('foo:queue'))
+        self.assertFalse(self.client.exists('foo:tickets'))
+
+    def test_waiter_giving_up_leaves_line(self):
+        holder = self.client.semaphore('foo', 1)
+        self.assertTrue(holder.acquire())
+        self.assertFalse(self.client.semaphore('foo', 1).acquire(
+            blocking_timeout=0.2))
+        self.assertEqual(self.client.zcard('foo:queue'), 0)
+        holder.release()
+        self.assertTrue(self.client.semaphore('foo', 1).acquire(
+            blocking=False))
+
+    def test_crashed_waiter_dropped(self):
+        semaphore = self.client.semaphore('foo', 1, sleep=0.01, notify=False)
+        # a waiter that crashed in line, its lease over
+        self.client.zadd('foo:queue', crashed=1)
+        self.client.zadd('foo:queue:leases', crashed=0)
+        self.assertTrue(semaphore.acquire(blocking=False))
+        self.assertEqual(self.client.zcard('foo:queue'), 0)
+        semaphore.release()
+
+
+class ReadWriteLockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = redis.StrictRedis(host='localhost', port=6379, db=9)
+        self.client.flushdb()
+
+    def tearDown(self):
+        self.client.flushdb()
+
+    def test_readers(self):
+        rw1 = self.client.read_write_lock('foo')
+        rw2 = self.client.read_write_lock('foo')
+        self.assertTrue(rw1.read_lock.acquire())
+        self.assertTrue(rw2.read_lock.acquire(blocking=False))
+        self.assertFalse(rw2.write_lock.acquire(blocking=False))
+        rw1.read_lock.release()
+        self.assertFalse(rw1.write_lock.acquire(blocking=False))
+        rw2.read_lock.release()
+        self.assertTrue(rw1.write_lock.acquire(blocking=False))
+        self.assertFalse(rw2.read_lock.acquire(blocking=False))
+        self.assertFalse(rw2.write_lock.acquire(blocking=False))
+        rw1.write_lock.release()
+        self.assertTrue(rw2.read_lock.acquire(blocking=False))
+        rw2.read_lock.release()
+
+    def test_waiting_writer_holds_readers_off(self):
+        reader = self.client.read_write_lock('foo')
+        writer = self.client.read_write_lock('foo', notify_timeout=10)
+        self.assertTrue(reader.read_lock.acquire())
+        acquired = []
+        def write():
+            acquired.append(writer.write_lock.acquire())
+        waiter = threading.Thread(target=write)
+        waiter.start()
+        time.sleep(0.2)
+        # new readers wait for the writer
+        self.assertFalse(
+            self.client.read_write_lock('foo').read_lock.acquire(
+                blocking=False))
+        start = time.time()
+        reader.read_lock.release()
+        waiter.join(5)
+        self.assertEqual(acquired, [True])
+        self.assertTrue(time.time() - start < 0.5)
+        writer.write_lock.release()
+
+    def test_writer_gives_up(self):
+        reader = self.client.read_write_lock('foo')
+        writer = self.client.read_write_lock('foo', blocking_timeout=0.1)
+        with reader.read_lock:
+            self.assertFalse(writer.write_lock.acquire())
+            self.assertTrue(
+                self.client.read_write_lock('foo').read_lock.acquire(
+                    blocking=False))
+
+    def test_timeout(self):
+        rw1 = self.client.read_write_lock('foo', timeout=0.2)
+        rw2 = self.client.read_write_lock('foo')
+        self.assertTrue(rw1.write_lock.acquire())
+        self.assertFalse(rw2.read_lock.acquire(blocking=False))
+        time.sleep(0.3)
+        self.assertTrue(rw2.read_lock.acquire(blocking=False))
+        self.assertRaises(LockError, rw1.write_lock.release)
+        rw2.read_lock.release()
+
+    def test_context_manager(self):
+        rw = self.client.read_write_lock('foo')
+        with rw.write_lock:
+            self.assertEqual(self.client.get('foo'), rw.write_lock.token)
+        with rw.read_lock:
+            self.assertEqual(self.client.zrange('foo:readers', 0, -1),
+                             [rw.read_lock.token])
+        self.assertEqual(self.client.exists('foo'), False)
@@ -33,6 +33,17 @@ class PipelineTestCase(unittest.TestCase):
             self.assertEqual(self.client['b'], 'b1')
             self.assertEqual(self.client['c'], 'c1')
 
+    def test_pipeline_response_callbacks(self):
+        self.client.set_response_callback('GET', lambda r: 'static')
+        self.client.set('a', 'a1')
+        for transaction in (True, False):
+            with self.client.pipeline(transaction=transaction) as pipe:
+                pipe.get('a').hgetall('b').zadd('z', z1=1)
+                pipe.zrange('z', 0, -1, withscores=True)
+                self.assertEqual(pipe.execute(),
+                                 ['static', {}, True, [('z1', 1.0)]])
+            self.client.delete('z')
+
     def test_pipeline_no_transaction_watch(self):
         self.client.set('a', 0)
 
@@ -144,3 +155,19 @@ class PipelineTestCase(unittest.TestCase):
         result = self.client.transaction(my_transaction, 'a', 'b')
         self.assertEqual(result, [True])
         self.assertEqual(self.client.get('c'), '4')
+
+    def test_transaction_max_retries(self):
+        self.client.set('a', 1)
+        attempts = []
+
+        def my_transaction(pipe):
+            attempts.append(pipe.get('a'))
+            # always modify the watched key, the transaction never succeeds
+            self.client.incr('a')
+            pipe.multi()
+            pipe.set('b', 1)
+
+        self.assertRaises(redis.WatchError, self.client.transaction,
+                          my_transaction, 'a', max_retries=2)
+        self.assertEqual(attempts, ['1', '2', '3'])
+        self.assertEqual(self.client.get('b'), None)
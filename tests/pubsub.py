@@ -1,7 +1,11 @@
 import redis
+import selectors
+import threading
+import time
 import unittest
 
-from redis.exceptions import ConnectionError
+from redis.exceptions import ConnectionError, PubSubError
+from redis.pubsub import Message, get_multiplexer
 
 class PubSubTestCase(unittest.TestCase):
     def setUp(self):
@@ -52,6 +56,465 @@ class PubSubTestCase(unittest.TestCase):
             ['punsubscribe', 'fo*', 0]
             )
 
+    def test_publish_many(self):
+        self.pubsub.subscribe(['foo', 'bar'])
+        self.assertEqual(self.pubsub.get_message(timeout=1)['type'],
+                         'subscribe')
+        other = self.client.pubsub()
+        other.subscribe('foo')
+        self.assertEqual(
+            self.client.publish_many(
+                [('foo', 'a'), ('bar', 'b'), ('baz', 'c'), ('foo', 'd')]),
+            [2, 1, 0, 2])
+        self.assertEqual(self.client.publish_many([]), [])
+        self.assertEqual(
+            [self.pubsub.get_message(timeout=1)['data'] for i in range(3)],
+            ['a', 'b', 'd'])
+        other.unsubscribe()
+
+    def test_compact_messages(self):
+        pubsub = self.client.pubsub(compact=True)
+        self.assertEqual(pubsub.subscribe('foo'), ['subscribe', 'foo', 1])
+        self.assertEqual(pubsub.psubscribe('ba*'), ['psubscribe', 'ba*', 2])
+        self.client.publish('foo', 'hello foo')
+        self.client.publish('bar', 'hello bar')
+        message = next(pubsub.listen())
+        self.assertTrue(isinstance(message, Message))
+        self.assertEqual(message.raw_data, b'hello foo')
+        self.assertEqual(message._data, None)
+        self.assertEqual(message.data, 'hello foo')
+        self.assertEqual(
+            message,
+            {
+                'type': 'message',
+                'pattern': None,
+                'channel': 'foo',
+                'data': 'hello foo'
+            }
+            )
+        message = pubsub.get_message(timeout=1)
+        self.assertEqual(
+            (message['type'], message['pattern'], message['channel'],
+             message['data']),
+            ('pmessage', 'ba*', 'bar', 'hello bar'))
+        self.assertRaises(KeyError, message.__getitem__, 'raw_data')
+        # equal messages are deduplicated in sets
+        messages = set([
+            Message('message', None, 'foo', b'a'),
+            Message('message', None, 'foo', b'a'),
+            Message('message', None, 'foo', b'b'),
+            ])
+        self.assertEqual(len(messages), 2)
+        self.assertFalse(hasattr(message, '__dict__'))
+        self.assertEqual(pubsub.unsubscribe('foo'), ['unsubscribe', 'foo', 1])
+        pubsub.punsubscribe()
+
+    def test_get_message(self):
+        self.assertEqual(self.pubsub.get_message(), None)
+        self.pubsub.subscribe('foo')
+        self.assertEqual(self.pubsub.get_message(), None)
+        self.client.publish('foo', 'a')
+        self.client.publish('foo', 'b')
+        self.assertEqual(
+            self.pubsub.get_message(timeout=1),
+            {'type': 'message', 'pattern': None, 'channel': 'foo',
+             'data': 'a'})
+        # already read from the socket, and buffered
+        self.assertEqual(self.pubsub.get_message()['data'], 'b')
+        self.assertEqual(self.pubsub.get_message(), None)
+
+    def test_get_message_timeout(self):
+        self.pubsub.subscribe('foo')
+        start = time.time()
+        self.assertEqual(self.pubsub.get_message(timeout=0.1), None)
+        self.assertTrue(time.time() - start >= 0.09)
+        threading.Timer(0.1, self.client.publish, ('foo', 'a')).start()
+        self.assertEqual(self.pubsub.get_message(timeout=5)['data'], 'a')
+        self.pubsub.unsubscribe('foo')
+        self.assertEqual(self.pubsub.get_message(timeout=5), None)
+
+    def test_fileno(self):
+        self.assertRaises(ConnectionError, self.pubsub.fileno)
+        other = self.client.pubsub()
+        self.pubsub.subscribe('foo')
+        other.psubscribe('ba*')
+        selector = selectors.DefaultSelector()
+        selector.register(self.pubsub, selectors.EVENT_READ)
+        selector.register(other, selectors.EVENT_READ)
+        self.assertEqual(selector.select(0), [])
+        self.client.publish('bar', 'b')
+        events = selector.select(1)
+        self.assertEqual([key.fileobj for key, mask in events], [other])
+        self.assertEqual(other.get_message()['data'], 'b')
+        self.assertEqual(other.get_message(), None)
+        selector.close()
+        other.punsubscribe()
+
+class PubSubWorkerPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connection_pool = redis.ConnectionPool()
+        self.client = redis.Redis(connection_pool=self.connection_pool)
+        self.pubsub = self.client.pubsub()
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool is not None and self.pool.is_alive():
+            self.pool.stop()
+        self.connection_pool.disconnect()
+
+    def wait_for(self, condition, timeout=5):
+        stop_waiting_at = time.time() + timeout
+        while not condition() and time.time() < stop_waiting_at:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_dispatch(self):
+        received = []
+        self.pool = self.pubsub.run_in_thread(
+            {'foo': received.append},
+            pattern_handlers={'ba*': received.append})
+        self.client.publish('foo', 'a')
+        self.client.publish('bar', 'b')
+        self.client.publish('other', 'c')
+        self.wait_for(lambda: len(received) == 2)
+        self.assertEqual(
+            sorted((m['type'], m['channel'], m['data']) for m in received),
+            [('message', 'foo', 'a'), ('pmessage', 'bar', 'b')])
+        self.assertEqual(self.pool.channel_stats['foo'].messages, 1)
+        self.assertEqual(self.pool.pattern_stats['ba*'].messages, 1)
+        self.pool.stop()
+        self.assertFalse(self.pool.is_alive())
+        self.assertEqual(self.pubsub.connection, None)
+
+    def test_channel_order(self):
+        received = {'a': [], 'b': [], 'c': []}
+        handlers = dict((channel, lambda m: received[m['channel']].append(
+            m['data'])) for channel in received)
+        self.pool = self.pubsub.run_in_thread(handlers, workers=3)
+        for i in range(50):
+            for channel in received:
+                self.client.publish(channel, str(i))
+        self.wait_for(lambda: sum(map(len, received.values())) == 150)
+        for channel in received:
+            self.assertEqual(received[channel], [str(i) for i in range(50)])
+
+    def test_backpressure(self):
+        unblock = threading.Event()
+        received = []
+
+        def handler(message):
+            unblock.wait(5)
+            received.append(message['data'])
+        self.pool = self.pubsub.run_in_thread(
+            {'foo': handler}, workers=1, queue_size=2)
+        for i in range(10):
+            self.client.publish('foo', str(i))
+        time.sleep(0.2)
+        self.assertTrue(self.pool.queue_depths()[0] <= 2)
+        self.assertTrue(self.pool.channel_stats['foo'].max_queued <= 4)
+        unblock.set()
+        self.wait_for(lambda: len(received) == 10)
+        self.assertEqual(received, [str(i) for i in range(10)])
+        stats = self.pool.channel_stats['foo']
+        self.assertEqual(stats.messages, 10)
+        self.assertEqual(stats.queued, 0)
+        self.assertTrue(stats.max_latency >= 0.2)
+
+    def test_handler_errors(self):
+        errors = []
+
+        def handler(message):
+            raise ValueError(message['data'])
+        self.pool = self.pubsub.run_in_thread(
+            {'foo': handler},
+            exception_handler=lambda e, m: errors.append((str(e), m['data'])))
+        self.client.publish('foo', 'a')
+        self.client.publish('foo', 'b')
+        self.wait_for(lambda: len(errors) == 2)
+        self.assertEqual(errors, [('a', 'a'), ('b', 'b')])
+        self.assertEqual(self.pool.channel_stats['foo'].errors, 2)
+
+    def test_no_handlers(self):
+        self.assertRaises(ValueError, self.pubsub.run_in_thread, {})
+
+class PubSubMultiplexerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connection_pool = redis.ConnectionPool()
+        self.client = redis.Redis(connection_pool=self.connection_pool)
+
+    def tearDown(self):
+        get_multiplexer(self.connection_pool).close()
+        self.connection_pool.disconnect()
+
+    def wait_for(self, condition, timeout=5):
+        stop_waiting_at = time.time() + timeout
+        while not condition() and time.time() < stop_waiting_at:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def numsub(self, channel):
+        return self.client.execute_command('PUBSUB', 'NUMSUB', channel)[1]
+
+    def test_shared_subscription(self):
+        first = self.client.subscriber()
+        second = self.client.subscriber()
+        self.assertTrue(first.multiplexer is second.multiplexer)
+        first.subscribe('foo')
+        second.subscribe(['foo', 'bar'])
+        self.assertEqual(self.numsub('foo'), 1)
+        self.assertEqual(self.client.publish('foo', 'a'), 1)
+        self.client.publish('bar', 'b')
+        message = {'type': 'message', 'pattern': None, 'channel': 'foo',
+                   'data': 'a'}
+        self.assertEqual(first.get_message(timeout=1), message)
+        self.assertEqual(second.get_message(timeout=1), message)
+        self.assertEqual(second.get_message(timeout=1)['data'], 'b')
+        self.assertEqual(first.get_message(timeout=0.1), None)
+
+    def test_reference_counting(self):
+        first = self.client.subscriber()
+        second = self.client.subscriber()
+        first.subscribe('foo')
+        second.subscribe('foo')
+        first.unsubscribe('foo')
+        self.client.publish('foo', 'a')
+        self.assertEqual(second.get_message(timeout=1)['data'], 'a')
+        self.assertEqual(first.get_message(timeout=0.1), None)
+        self.assertEqual(self.numsub('foo'), 1)
+        second.close()
+        self.wait_for(lambda: self.numsub('foo') == 0)
+        first.subscribe('foo')
+        self.assertEqual(self.numsub('foo'), 1)
+
+    def test_patterns(self):
+        first = self.client.subscriber()
+        second = self.client.subscriber()
+        first.psubscribe('ba*')
+        second.psubscribe(['ba*', 'f*'])
+        self.assertEqual(self.client.execute_command('PUBSUB', 'NUMPAT'), 2)
+        self.client.publish('bar', 'b')
+        self.client.publish('foo', 'f')
+        message = {'type': 'pmessage', 'pattern': 'ba*', 'channel': 'bar',
+                   'data': 'b'}
+        self.assertEqual(first.get_message(timeout=1), message)
+        self.assertEqual(first.get_message(timeout=0.1), None)
+        self.assertEqual(second.get_message(timeout=1), message)
+        self.assertEqual(second.get_message(timeout=1)['data'], 'f')
+        second.punsubscribe()
+        self.assertEqual(second.patterns, set())
+        self.assertEqual(self.client.execute_command('PUBSUB', 'NUMPAT'), 1)
+
+    def test_max_queued(self):
+        subscriber = self.client.subscriber(max_queued=2)
+        subscriber.subscribe('foo')
+        for i in range(5):
+            self.client.publish('foo', str(i))
+        self.wait_for(lambda: subscriber.dropped == 3)
+        self.assertEqual(subscriber.get_message()['data'], '0')
+        self.assertEqual(subscriber.get_message()['data'], '1')
+        self.assertEqual(subscriber.get_message(), None)
+
+    def test_single_connection(self):
+        subscribers = [self.client.subscriber() for i in range(50)]
+        for i, subscriber in enumerate(subscribers):
+            subscriber.subscribe('channel:%d' % (i % 10))
+        clients = self.client.execute_command('CLIENT', 'LIST')
+        subscribed = [c for c in clients.splitlines() if 'sub=10' in c]
+        self.assertEqual(len(subscribed), 1)
+        self.client.publish('channel:3', 'a')
+        for i, subscriber in enumerate(subscribers):
+            if i % 10 == 3:
+                self.assertEqual(subscriber.get_message(timeout=1)['data'],
+                                 'a')
+            else:
+                self.assertEqual(subscriber.get_message(), None)
+
+    def test_reconnect(self):
+        subscriber = self.client.subscriber()
+        subscriber.subscribe('foo')
+        subscriber.psubscribe('ba*')
+        subscriber.multiplexer.retry_interval = 0.1
+        self.client.execute_command('CLIENT', 'KILL', 'TYPE', 'pubsub')
+        self.wait_for(lambda: self.numsub('foo') == 1 and
+                      self.client.execute_command('PUBSUB', 'NUMPAT') == 1)
+        self.client.publish('foo', 'a')
+        self.client.publish('bar', 'b')
+        self.assertEqual(subscriber.get_message(timeout=1)['data'], 'a')
+        self.assertEqual(subscriber.get_message(timeout=1)['data'], 'b')
+
+    def test_close(self):
+        subscriber = self.client.subscriber()
+        subscriber.subscribe('foo')
+        multiplexer = subscriber.multiplexer
+        multiplexer.close()
+        self.assertFalse(multiplexer.is_alive())
+        self.assertEqual(self.numsub('foo'), 0)
+        self.assertFalse(get_multiplexer(self.connection_pool) is multiplexer)
+        self.assertRaises(PubSubError, subscriber.subscribe, 'bar')
+        # subscribers of the pool get the new multiplexer
+        subscriber = self.client.subscriber()
+        subscriber.subscribe('foo')
+        self.assertEqual(self.numsub('foo'), 1)
+
+    def test_listen_stops_when_unsubscribed(self):
+        subscriber = self.client.subscriber()
+        subscriber.subscribe('foo')
+        subscriber.psubscribe('ba*')
+        received = []
+        def listen():
+            for message in subscriber.listen():
+                received.append(message['data'])
+        listener = threading.Thread(target=listen)
+        listener.start()
+        self.client.publish('foo', 'a')
+        self.wait_for(lambda: received == ['a'])
+        subscriber.unsubscribe()
+        time.sleep(0.1)
+        self.assertTrue(listener.is_alive())
+        subscriber.punsubscribe()
+        listener.join(5)
+        self.assertFalse(listener.is_alive())
+        self.assertEqual(received, ['a'])
+
+class PartitionedSubscriberTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connection_pool = redis.ConnectionPool()
+        self.client = redis.Redis(connection_pool=self.connection_pool)
+        self.subscriber = self.client.partitioned_subscriber(partitions=4)
+
+    def tearDown(self):
+        self.subscriber.close()
+        self.connection_pool.disconnect()
+
+    def subscribed_connections(self):
+        clients = self.client.execute_command('CLIENT', 'LIST')
+        return len([c for c in clients.splitlines()
+                    if ' sub=0 ' not in c or ' psub=0 ' not in c])
+
+    def test_partitions(self):
+        channels = ['channel:%d' % i for i in range(40)]
+        self.subscriber.subscribe(channels)
+        self.subscriber.psubscribe('pattern:*')
+        self.assertEqual(self.subscribed_connections(), 4)
+        used = [m for m in self.subscriber.multiplexers
+                if m.channel_subscribers]
+        self.assertEqual(len(used), 4)
+        self.assertEqual(
+            sum(len(m.channel_subscribers) for m in used), 40)
+        self.subscriber.close()
+        self.assertEqual(self.subscribed_connections(), 0)
+
+    def test_merged_messages(self):
+        channels = ['channel:%d' % i for i in range(10)]
+        self.subscriber.subscribe(channels)
+        self.subscriber.psubscribe('pattern:*')
+        for i in range(20):
+            for channel in channels:
+                self.client.publish(channel, str(i))
+        self.client.publish('pattern:1', 'p')
+        received = dict((channel, []) for channel in channels)
+        for i in range(200):
+            message = self.subscriber.get_message(timeout=1)
+            received[message['channel']].append(message['data'])
+        for channel in channels:
+            self.assertEqual(received[channel], [str(i) for i in range(20)])
+        message = self.subscriber.get_message(timeout=1)
+        self.assertEqual((message['pattern'], message['data']),
+                         ('pattern:*', 'p'))
+        self.assertEqual(self.subscriber.get_message(), None)
+
+    def test_compact_messages(self):
+        subscriber = self.client.partitioned_subscriber(2, compact=True)
+        try:
+            subscriber.subscribe(['foo', 'bar'])
+            self.client.publish('foo', 'a')
+            message = subscriber.get_message(timeout=1)
+            self.assertTrue(isinstance(message, Message))
+            self.assertEqual((message.channel, message.raw_data),
+                             ('foo', b'a'))
+        finally:
+            subscriber.close()
+
+    def test_unsubscribe(self):
+        self.subscriber.subscribe(['foo', 'bar'])
+        self.subscriber.unsubscribe('foo')
+        self.client.publish('foo', 'a')
+        self.client.publish('bar', 'b')
+        self.assertEqual(self.subscriber.get_message(timeout=1)['data'], 'b')
+        self.assertEqual(self.subscriber.get_message(timeout=0.1), None)
+        self.subscriber.unsubscribe()
+        self.assertEqual(self.subscriber.channels, set())
+
+class BufferedPublisherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connection_pool = redis.ConnectionPool()
+        self.client = redis.Redis(connection_pool=self.connection_pool)
+        self.pubsub = self.client.pubsub()
+        self.pubsub.subscribe('foo')
+
+    def tearDown(self):
+        self.connection_pool.disconnect()
+
+    def receive(self, count):
+        return [self.pubsub.get_message(timeout=1)['data']
+                for i in range(count)]
+
+    def test_flush_when_full(self):
+        publisher = self.client.buffered_publisher(max_messages=3,
+                                                   max_delay=60)
+        publisher.publish('foo', 'a')
+        publisher.publish('foo', 'b')
+        self.assertEqual(self.pubsub.get_message(timeout=0.1), None)
+        publisher.publish('foo', 'c')
+        self.assertEqual(self.receive(3), ['a', 'b', 'c'])
+        self.assertEqual(publisher.published, 3)
+        publisher.close()
+
+    def test_flush_after_delay(self):
+        publisher = self.client.buffered_publisher(max_messages=100,
+                                                   max_delay=0.05)
+        publisher.publish('foo', 'a')
+        publisher.publish('foo', 'b')
+        self.assertEqual(self.receive(2), ['a', 'b'])
+        publisher.publish('foo', 'c')
+        self.assertEqual(self.receive(1), ['c'])
+        publisher.close()
+        self.assertFalse(publisher.is_alive())
+
+    def test_flush(self):
+        with self.client.buffered_publisher(max_delay=60) as publisher:
+            publisher.publish('foo', 'a')
+            publisher.publish('bar', 'b')
+            self.assertEqual(publisher.flush(), [1, 0])
+            self.assertEqual(publisher.flush(), [])
+            publisher.publish('foo', 'c')
+        self.assertEqual(self.receive(2), ['a', 'c'])
+
+    def test_order(self):
+        publisher = self.client.buffered_publisher(max_messages=7,
+                                                   max_delay=0.001)
+        # batches are flushed both when full and by the daemon thread
+        for i in range(100):
+            publisher.publish('foo', str(i))
+            if i % 10 == 0:
+                time.sleep(0.005)
+        publisher.close()
+        self.assertEqual(self.receive(100), [str(i) for i in range(100)])
+
+    def test_errors(self):
+        errors = []
+        client = redis.Redis(port=6390)
+        publisher = client.buffered_publisher(
+            max_delay=0.01,
+            exception_handler=lambda e, messages: errors.append(messages))
+        publisher.publish('foo', 'a')
+        stop_waiting_at = time.time() + 5
+        while not errors and time.time() < stop_waiting_at:
+            time.sleep(0.01)
+        self.assertEqual(errors, [[('foo', 'a')]])
+        self.assertEqual(publisher.errors, 1)
+        self.assertEqual(publisher.close(), [])
+
 class PubSubRedisDownTestCase(unittest.TestCase):
     def setUp(self):
         self.connection_pool = redis.ConnectionPool(port=6390)
@@ -0,0 +1,60 @@
+from __future__ import with_statement
+import redis
+import time
+import unittest
+
+from redis.ratelimit import (
+    FixedWindowRateLimiter,
+    SlidingWindowRateLimiter,
+    TokenBucketRateLimiter,
+    )
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = redis.StrictRedis(host='localhost', port=6379, db=9)
+        self.client.flushdb()
+
+    def tearDown(self):
+        self.client.flushdb()
+        self.client.connection_pool.disconnect()
+
+    def assert_limits(self, limiter):
+        self.assertEqual([limiter.check('a') for i in range(4)],
+                         [(True, 2), (True, 1), (True, 0), (False, 0)])
+        self.assertEqual(limiter.allow('a'), False)
+        self.assertEqual(limiter.check('b', cost=2), (True, 1))
+        self.assertEqual(limiter.check('b', cost=2), (False, 1))
+        self.assertEqual(limiter.check_many(['a', 'b', 'c']),
+                         [(False, 0), (True, 0), (True, 2)])
+        self.assertEqual(limiter.check_many([]), [])
+
+    def test_fixed_window(self):
+        limiter = FixedWindowRateLimiter(self.client, 3, 0.2)
+        self.assert_limits(limiter)
+        self.assertTrue(0 < self.client.pttl('ratelimit:a') <= 200)
+        time.sleep(0.25)
+        self.assertEqual(limiter.check('a'), (True, 2))
+
+    def test_sliding_window(self):
+        limiter = SlidingWindowRateLimiter(self.client, 3, 0.2)
+        self.assert_limits(limiter)
+        self.assertEqual(self.client.zcard('ratelimit:a'), 3)
+        time.sleep(0.25)
+        self.assertEqual(limiter.check('a'), (True, 2))
+        self.assertEqual(self.client.zcard('ratelimit:a'), 1)
+
+    def test_token_bucket(self):
+        limiter = TokenBucketRateLimiter(self.client, 3, 0.3)
+        self.assert_limits(limiter)
+        # a token is added every 0.1 seconds
+        time.sleep(0.15)
+        self.assertEqual(limiter.check('a'), (True, 0))
+        self.assertEqual(limiter.check('a'), (False, 0))
+        time.sleep(0.35)
+        self.assertEqual(limiter.check('a'), (True, 2))
+
+    def test_prefix(self):
+        limiter = FixedWindowRateLimiter(self.client, 3, 1, prefix='api:')
+        limiter.check('a')
+        self.assertEqual(self.client.get('api:a'), '1')
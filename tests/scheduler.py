@@ -0,0 +1,85 @@
+from __future__ import with_statement
+import datetime
+import redis
+import threading
+import time
+import unittest
+
+from redis.scheduler import Scheduler
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = redis.StrictRedis(host='localhost', port=6379, db=9)
+        self.client.flushdb()
+        self.scheduler = Scheduler(self.client, 'schedule')
+
+    def tearDown(self):
+        self.client.flushdb()
+        self.client.connection_pool.disconnect()
+
+    def test_claim(self):
+        self.assertEqual(self.scheduler.schedule('a', 10), True)
+        self.assertEqual(self.scheduler.schedule_many({'b': 20, 'c': 30}), 2)
+        self.assertEqual(self.scheduler.schedule('a', 15), False)
+        self.assertEqual(len(self.scheduler), 3)
+        self.assertEqual(self.scheduler.claim(now=5), ([], 15.0))
+        self.assertEqual(self.scheduler.claim(now=25), (['a', 'b'], 30.0))
+        self.assertEqual(self.scheduler.claim(now=25), ([], 30.0))
+        self.assertEqual(self.scheduler.claim(), (['c'], None))
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_claim_count(self):
+        self.scheduler.schedule_many(dict((str(i), i) for i in range(10)))
+        self.assertEqual(self.scheduler.claim(3, now=100),
+                         (['0', '1', '2'], 3.0))
+
+    def test_schedule_datetime(self):
+        when = datetime.datetime.now() - datetime.timedelta(seconds=1)
+        self.scheduler.schedule('a', when)
+        self.scheduler.schedule_in('b', 60)
+        items, next_due = self.scheduler.claim()
+        self.assertEqual(items, ['a'])
+        self.assertTrue(59 < next_due - time.time() <= 60)
+
+    def test_cancel(self):
+        self.scheduler.schedule_many({'a': 1, 'b': 2})
+        self.assertEqual(self.scheduler.cancel('a', 'c'), 1)
+        self.assertEqual(self.scheduler.claim(now=5), (['b'], None))
+
+    def test_concurrent_workers(self):
+        self.scheduler.schedule_many(dict((str(i), 0) for i in range(1000)))
+        claimed = []
+        def worker():
+            while 1:
+                items, next_due = self.scheduler.claim(10)
+                if not items:
+                    break
+                claimed.extend(items)
+        workers = [threading.Thread(target=worker) for i in range(5)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        self.assertEqual(sorted(claimed), sorted(str(i) for i in range(1000)))
+
+    def test_run(self):
+        processed = []
+        stop = threading.Event()
+        def handler(item):
+            processed.append((item, time.time()))
+            if len(processed) == 2:
+                stop.set()
+        self.scheduler.schedule_in('a', 0.1)
+        worker = threading.Thread(target=self.scheduler.run,
+                                  args=(handler,), kwargs={'stop': stop})
+        worker.start()
+        time.sleep(0.2)
+        # the worker sleeps for 5 seconds, until it's woken by an earlier
+        # item being scheduled
+        start = time.time()
+        self.scheduler.schedule_in('b', 60)
+        self.scheduler.schedule_in('c', 1.2)
+        worker.join(5)
+        self.assertEqual([item for item, t in processed], ['a', 'c'])
+        self.assertTrue(processed[1][1] - start < 2)
@@ -0,0 +1,157 @@
+from __future__ import with_statement
+import redis
+import unittest
+
+from redis import scripts
+from redis.exceptions import NoScriptError
+
+multiply_script = """
+local value = redis.call('GET', KEYS[1])
+value = tonumber(value)
+return value * ARGV[1]"""
+
+
+class ScriptingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = redis.StrictRedis(host='localhost', port=6379, db=9)
+        self.client.script_flush()
+
+    def tearDown(self):
+        self.client.flushdb()
+        self.client.connection_pool.disconnect()
+
+    def test_eval(self):
+        self.client.set('a', 2)
+        # 2 * 3 == 6
+        self.assertEqual(self.client.eval(multiply_script, 1, 'a', 3), 6)
+
+    def test_evalsha(self):
+        self.client.set('a', 2)
+        sha = self.client.script_load(multiply_script)
+        # 2 * 3 == 6
+        self.assertEqual(self.client.evalsha(sha, 1, 'a', 3), 6)
+
+    def test_evalsha_script_not_loaded(self):
+        self.client.set('a', 2)
+        sha = self.client.script_load(multiply_script)
+        # remove the script from Redis's cache
+        self.client.script_flush()
+        self.assertRaises(NoScriptError,
+                          self.client.evalsha, sha, 1, 'a', 3)
+
+    def test_script_loading(self):
+        # get the sha, then clear the cache
+        sha = self.client.script_load(multiply_script)
+        self.client.script_flush()
+        self.assertEqual(self.client.script_exists(sha), [False])
+        self.client.script_load(multiply_script)
+        self.assertEqual(self.client.script_exists(sha), [True])
+
+    def test_script_object(self):
+        self.client.set('a', 2)
+        multiply = self.client.register_script(multiply_script)
+        # the script isn't cached yet, it's sent with EVAL
+        self.assertEqual(self.client.script_exists(multiply.sha), [False])
+        self.assertEqual(multiply(keys=['a'], args=[3]), 6)
+        self.assertEqual(self.client.script_exists(multiply.sha), [True])
+        # then run with EVALSHA
+        self.assertEqual(multiply(keys=['a'], args=[3]), 6)
+
+    def test_script_object_in_pipeline(self):
+        multiply = self.client.register_script(multiply_script)
+        for transaction in (True, False):
+            self.client.script_flush()
+            with self.client.pipeline(transaction) as pipe:
+                pipe.set('a', 2)
+                pipe.get('a')
+                multiply(keys=['a'], args=[3], client=pipe)
+                self.assertEqual(pipe.execute(), [True, '2', 6])
+            self.assertEqual(self.client.script_exists(multiply.sha), [True])
+
+
+class AtomicOperationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = redis.StrictRedis(host='localhost', port=6379, db=9)
+        self.client.flushdb()
+
+    def tearDown(self):
+        self.client.flushdb()
+        self.client.connection_pool.disconnect()
+
+    def test_compare_and_set(self):
+        self.client.set('a', 'foo')
+        self.assertEqual(self.client.compare_and_set('a', 'bar', 'baz'), False)
+        self.assertEqual(self.client.get('a'), 'foo')
+        self.assertEqual(self.client.compare_and_set('a', 'foo', 'baz', 10),
+                         True)
+        self.assertEqual(self.client.get('a'), 'baz')
+        self.assertEqual(self.client.ttl('a'), 10)
+        self.assertEqual(self.client.compare_and_set('b', 'foo', 'baz'), False)
+
+    def test_compare_and_delete(self):
+        self.client.set('a', 'foo')
+        self.assertEqual(self.client.compare_and_delete('a', 'bar'), False)
+        self.assertEqual(self.client.compare_and_delete('a', 'foo'), True)
+        self.assertEqual(self.client.exists('a'), False)
+
+    def test_msetex(self):
+        self.assertEqual(self.client.msetex({'a': 1, 'b': 2}, 10), True)
+        self.assertEqual(self.client.mget('a', 'b'), ['1', '2'])
+        self.assertEqual(self.client.ttl('b'), 10)
+        self.assertEqual(self.client.msetex({'b': 3, 'c': 4}, 10, nx=True),
+                         False)
+        self.assertEqual(self.client.mget('b', 'c'), ['2', None])
+        self.assertEqual(self.client.msetex({'c': 4, 'd': 5}, nx=True), True)
+        self.assertEqual(self.client.ttl('c'), -1)
+
+    def test_hincrby_capped(self):
+        self.client.hset('a', 'x', 2)
+        self.assertEqual(
+            self.client.hincrby_capped('a', {'x': 5, 'y': -5, 'z': 1},
+                                       minimum=0, maximum=4),
+            {'x': 4, 'y': 0, 'z': 1})
+        self.assertEqual(self.client.hgetall('a'),
+                         {'x': '4', 'y': '0', 'z': '1'})
+        self.assertEqual(self.client.hincrby_capped('a', {'y': -5}),
+                         {'y': -5})
+        self.assertRaises(redis.DataError, self.client.hincrby_capped,
+                          'a', {'x': 1.5})
+        self.assertRaises(redis.DataError, self.client.hincrby_capped,
+                          'a', {'x': 1}, maximum=2.5)
+        # no field is written if a current value isn't an integer
+        self.client.hset('a', 'w', 1.5)
+        self.assertRaises(redis.ResponseError, self.client.hincrby_capped,
+                          'a', {'x': 1, 'w': 1})
+        self.assertEqual(self.client.hget('a', 'x'), '4')
+
+    def test_scripts_registered_once(self):
+        script = self.client.get_script(scripts.POP_MANY)
+        self.assertTrue(self.client.get_script(scripts.POP_MANY) is script)
+        self.client.lpop_many('a', 1)
+        self.assertTrue(self.client._scripts[scripts.POP_MANY] is script)
+
+    def test_pop_many(self):
+        self.client.rpush('a', *range(6))
+        self.assertEqual(self.client.lpop_many('a', 2), ['0', '1'])
+        self.assertEqual(self.client.rpop_many('a', 2), ['5', '4'])
+        self.assertEqual(self.client.lpop_many('a', 0), [])
+        self.assertEqual(self.client.rpop_many('a', 5), ['3', '2'])
+        self.assertEqual(self.client.exists('a'), False)
+
+    def test_zmove_expired(self):
+        self.client.zadd('a', x=1, y=2, z=3)
+        self.assertEqual(self.client.zmove_expired('a', 'b', 2, count=1),
+                         ['x'])
+        self.assertEqual(self.client.zmove_expired('a', 'b', 2), ['y'])
+        self.assertEqual(self.client.lrange('b', 0, -1), ['x', 'y'])
+        self.assertEqual(self.client.zrange('a', 0, -1), ['z'])
+        self.assertEqual(self.client.zmove_expired('a', 'b'), ['z'])
+
+    def test_pipeline(self):
+        self.client.script_flush()
+        self.client.set('a', 'foo')
+        with self.client.pipeline() as pipe:
+            pipe.compare_and_set('a', 'foo', 'bar')
+            pipe.hincrby_capped('b', {'x': 2}, maximum=1)
+            pipe.get('a')
+            self.assertEqual(pipe.execute(), [True, {'x': 1}, 'bar'])
@@ -2,9 +2,11 @@ import redis
 import unittest
 import datetime
 import time
+from array import array
 from string import ascii_letters
 from distutils.version import StrictVersion
 from redis.client import parse_info
+from redis.codecs import JSONCodec
 
 class ServerCommandsTestCase(unittest.TestCase):
 
@@ -795,6 +797,42 @@ class ServerCommandsTestCase(unittest.TestCase):
         # a non existant key should return empty list
         self.assertEqual(self.client.zrange('b', 0, 1, withscores=True), [])
 
+    def test_zrange_score_array(self):
+        self.make_zset('a', {'a1': 1, 'a2': 2.5, 'a3': 3})
+        values, scores = self.client.zrange('a', 0, -1, withscores=True,
+                                            score_array='array')
+        self.assertEqual(values, ['a1', 'a2', 'a3'])
+        self.assertEqual(scores, array('d', [1.0, 2.5, 3.0]))
+        self.assertEqual(
+            self.client.zrange('a', 0, 1, desc=True, withscores=True,
+                               score_array='array'),
+            (['a3', 'a2'], array('d', [3.0, 2.5])))
+        self.assertEqual(
+            self.client.zrevrangebyscore('a', 2.5, '-inf', withscores=True,
+                                         score_array='array'),
+            (['a2', 'a1'], array('d', [2.5, 1.0])))
+        self.assertEqual(
+            self.client.zrange('b', 0, 1, withscores=True,
+                               score_array='array'),
+            ([], array('d')))
+        self.assertRaises(redis.DataError, self.client.zrange, 'a', 0, 1,
+                          withscores=True, score_array='list')
+        self.assertRaises(redis.DataError, self.client.zrange, 'a', 0, 1,
+                          score_array='array')
+        self.assertRaises(redis.DataError, self.client.zrange, 'a', 0, 1,
+                          withscores=True, score_cast_func=int,
+                          score_array='array')
+        try:
+            redis.client.import_numpy()
+        except redis.RedisError:
+            self.assertRaises(redis.RedisError, self.client.zrange, 'a', 0, 1,
+                              withscores=True, score_array='numpy')
+        else:
+            values, scores = self.client.zrangebyscore(
+                'a', 2, 3, withscores=True, score_array='numpy')
+            self.assertEqual(values, ['a2', 'a3'])
+            self.assertEqual(scores.tolist(), [2.5, 3.0])
+
     def test_zrangebyscore(self):
         # key is not a zset
         self.client['a'] = 'a'
@@ -1303,3 +1341,129 @@ class ServerCommandsTestCase(unittest.TestCase):
         data = ''.join(data)
         self.client.set('a', data)
         self.assertEqual(self.client.get('a'), data)
+
+    def test_chunked_commands(self):
+        client = redis.Redis(host='localhost', port=6379, db=9, chunk_size=3)
+        mapping = dict(('k%d' % i, str(i)) for i in range(10))
+        self.assertTrue(client.mset(mapping))
+        keys = sorted(mapping)
+        self.assertEqual(client.mget(keys), [mapping[k] for k in keys])
+        self.assertTrue(client.hmset('h', mapping))
+        self.assertEqual(client.hgetall('h'), mapping)
+        self.assertEqual(client.hmget('h', keys), [mapping[k] for k in keys])
+        self.assertEqual(client.sadd('s', *range(10)), 10)
+        self.assertEqual(client.scard('s'), 10)
+        self.assertEqual(client.zadd('z', **mapping), 10)
+        self.assertEqual(client.zcard('z'), 10)
+        self.assertEqual(client.rpush('l', *range(10)), 10)
+        self.assertEqual(client.lrange('l', 0, -1), list(map(str, range(10))))
+        self.assertTrue(client.delete(*keys))
+        self.assertEqual(client.mget(keys), [None] * 10)
+
+    def test_chunked_command_errors(self):
+        client = redis.Redis(host='localhost', port=6379, db=9, chunk_size=2)
+        client.set('s', 'x')
+        self.assertRaises(redis.ResponseError, client.sadd, 's',
+                          'a', 'b', 'c', 'd', 'e')
+        # the replies of the other chunks were read off the connection
+        self.assertEqual(client.get('s'), 'x')
+        client.connection_pool.disconnect()
+
+    def test_bulk_commands(self):
+        members = ['m%d' % i for i in range(25)]
+        scores = array('d', [i * 1.5 for i in range(25)])
+        self.assertEqual(
+            self.client.zadd_many('z', members, scores, chunk_size=4), 25)
+        self.assertEqual(self.client.zrange('z', 0, -1, withscores=True),
+                         list(zip(members, scores)))
+        self.assertEqual(self.client.zadd_many('z', {'m0': 5, 'n': 1}), 1)
+        self.assertEqual(self.client.zscore('z', 'm0'), 5.0)
+        mapping = dict(('k%d' % i, str(i)) for i in range(10))
+        self.assertTrue(self.client.hmset_many('h', mapping, chunk_size=3))
+        self.assertEqual(self.client.hgetall('h'), mapping)
+        keys = sorted(mapping)
+        self.assertTrue(self.client.mset_many(
+            keys, [mapping[k] for k in keys], chunk_size=3))
+        self.assertEqual(self.client.mget(keys), [mapping[k] for k in keys])
+        self.assertEqual(self.client.zadd_many('z', [], []), 0)
+        self.assertRaises(redis.DataError, self.client.zadd_many, 'z',
+                          ['a', 'b'], [1])
+        # errors are raised once all the replies are read
+        self.assertRaises(redis.ResponseError, self.client.zadd_many, 'h',
+                          members, scores, chunk_size=4)
+        self.assertTrue(self.client.ping())
+        # pipelines queue a single command
+        with self.client.pipeline() as pipe:
+            pipe.zadd_many('y', ['a', 'b'], array('d', [1, 2]))
+            pipe.zcard('y')
+            self.assertEqual(pipe.execute(), [2, 2])
+
+    def test_bulk_commands_with_codecs(self):
+        client = redis.Redis(host='localhost', port=6379, db=9,
+                             codecs=JSONCodec())
+        stacks = []
+        pipeline = client.pipeline
+        def recording_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            stacks.append(pipe.command_stack)
+            return pipe
+        client.pipeline = recording_pipeline
+        mapping = dict(('k%d' % i, [i]) for i in range(10))
+        self.assertTrue(client.hmset_many('h', mapping, chunk_size=4))
+        self.assertEqual(client.hgetall('h'), mapping)
+        # the values were encoded one by one, still sent in chunks of 4
+        self.assertEqual([len(args) for args, options in stacks[0]],
+                         [6] * 5)
+        # errors are raised once the replies of all the chunks are read
+        client.set('s', 'x')
+        self.assertRaises(redis.ResponseError, client.hmset_many, 's',
+                          mapping, chunk_size=4)
+        self.assertEqual(client.get('s'), 'x')
+        client.connection_pool.disconnect()
+
+    # SCAN
+    def test_scan_iter(self):
+        self.client.mset({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(set(self.client.scan_iter()), set(['a', 'b', 'c']))
+        self.assertEqual(set(self.client.scan_iter(match='a', count=1)),
+                         set(['a']))
+
+    def test_sscan_iter(self):
+        self.client.sadd('a', 1, 2, 3)
+        self.assertEqual(set(self.client.sscan_iter('a')),
+                         set(['1', '2', '3']))
+        self.assertEqual(list(self.client.sscan_iter('a', match='1')), ['1'])
+
+    def test_hscan_iter(self):
+        self.client.hmset('a', {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(dict(self.client.hscan_iter('a')),
+                         {'a': '1', 'b': '2', 'c': '3'})
+        self.assertEqual(list(self.client.hscan_iter('a', match='a')),
+                         [('a', '1')])
+
+    def test_zscan_iter(self):
+        self.client.zadd('a', a=1, b=2, c=3)
+        self.assertEqual(dict(self.client.zscan_iter('a')),
+                         {'a': 1.0, 'b': 2.0, 'c': 3.0})
+        self.assertEqual(list(self.client.zscan_iter('a', match='a')),
+                         [('a', 1.0)])
+
+    def test_unknown_command(self):
+        self.assertRaises(redis.UnknownCommandError,
+                          self.client.execute_command, 'NOSUCHCOMMAND')
+        try:
+            self.client.execute_command('NOSUCHCOMMAND')
+        except redis.ResponseError as e:
+            self.assertTrue(str(e).startswith('unknown command'))
+
+    def test_zscan_iter_without_zscan(self):
+        "Servers without ZSCAN are paged through with ZRANGE"
+        class OldRedis(redis.Redis):
+            def zscan(self, *args, **kwargs):
+                raise redis.UnknownCommandError("unknown command 'ZSCAN'")
+        client = self.get_client(OldRedis)
+        client.zadd('a', a=1, b=2, c=3)
+        self.assertEqual(list(client.zscan_iter('a', count=2)),
+                         [('a', 1.0), ('b', 2.0), ('c', 3.0)])
+        self.assertEqual(list(client.zscan_iter('a', match='b', count=2)),
+                         [('b', 2.0)])
@@ -0,0 +1,75 @@
+from __future__ import with_statement
+import redis
+import threading
+import time
+import unittest
+
+from redis.workqueue import WorkQueue
+
+
+class WorkQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = redis.StrictRedis(host='localhost', port=6379, db=9)
+        self.client.flushdb()
+        self.queue = WorkQueue(self.client, 'jobs')
+
+    def tearDown(self):
+        self.client.flushdb()
+        self.client.connection_pool.disconnect()
+
+    def test_put_and_get(self):
+        ids = self.queue.put('a', 'b', 'c')
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(len(self.queue), 3)
+        self.assertEqual(self.queue.get(2), [(ids[0], 'a'), (ids[1], 'b')])
+        self.assertEqual(self.queue.get(2), [(ids[2], 'c')])
+        self.assertEqual(self.queue.get(), [])
+        self.assertEqual(self.queue.processing_count(), 3)
+        self.assertEqual(self.queue.put(), [])
+
+    def test_ack(self):
+        ids = self.queue.put('a', 'b')
+        self.queue.get(2)
+        self.assertEqual(self.queue.ack(*ids), 2)
+        self.assertEqual(self.queue.ack(*ids), 0)
+        self.assertEqual(self.queue.processing_count(), 0)
+        self.assertEqual(self.client.hlen('jobs:jobs'), 0)
+
+    def test_release(self):
+        ids = self.queue.put('a', 'b', 'c')
+        self.queue.get(2)
+        self.assertEqual(self.queue.release(*ids), 2)
+        self.assertEqual(self.queue.get(3),
+                         [(ids[0], 'a'), (ids[1], 'b'), (ids[2], 'c')])
+
+    def test_visibility_timeout(self):
+        queue = WorkQueue(self.client, 'jobs', visibility_timeout=0.1)
+        ids = queue.put('a', 'b')
+        self.assertEqual(queue.get(), [(ids[0], 'a')])
+        time.sleep(0.15)
+        # the stalled job is dequeued again, first
+        self.assertEqual(queue.get(2), [(ids[0], 'a'), (ids[1], 'b')])
+        time.sleep(0.15)
+        self.assertEqual(queue.requeue_stalled(), 2)
+        self.assertEqual(len(queue), 2)
+        # the stalled consumer can't acknowledge the job anymore
+        self.assertEqual(queue.ack(ids[0]), 0)
+
+    def test_blocking_get(self):
+        self.assertEqual(self.queue.get(timeout=0.1), [])
+        def put():
+            time.sleep(0.2)
+            self.queue.put('a')
+        producer = threading.Thread(target=put)
+        producer.start()
+        start = time.time()
+        jobs = self.queue.get(10, timeout=5)
+        producer.join()
+        self.assertEqual([payload for id, payload in jobs], ['a'])
+        self.assertTrue(time.time() - start < 1)
+
+    def test_consume(self):
+        self.queue.put(*[str(i) for i in range(25)])
+        consumer = self.queue.consume(prefetch=10)
+        payloads = [next(consumer)[1] for i in range(25)]
+        self.assertEqual(payloads, [str(i) for i in range(25)])